@@ -162,7 +162,8 @@ def interpolate(pointdata, rasterdef, valuefield=None, algorithm="idw", **kwargs
     interpolated.
 
     NOTE: The algorithm for interpolating is set with "algorithm", but currently only allows "idw" or
-    inverse distance weighting. 
+    inverse distance weighting. By default all points are used to calculate each cell, but "neighbours" 
+    can be set to only use that many of the nearest points. 
 
     TODO: Add spline, kdtree, and kriging methods. 
     """
@@ -212,9 +213,6 @@ def interpolate(pointdata, rasterdef, valuefield=None, algorithm="idw", **kwargs
                 points[(px,py)] = aggval
 
         # retrieve input options
-        if neighbours == None:
-            # TODO: not yet implemented
-            neighbours = int(len(points)*0.10) #default neighbours is 10 percent of known points
         if sensitivity == None:
             sensitivity = 3 #same as power, ie that high sensitivity means much more effect from far away pointss
 
@@ -231,6 +229,17 @@ def interpolate(pointdata, rasterdef, valuefield=None, algorithm="idw", **kwargs
                 weighted_values_sum += weight * pval
             return weighted_values_sum / sum_of_weights
 
+        if neighbours:
+            # only use the nearest neighbour points, found with a grid index of the point cells
+            from ..vector.spindex import GridIndex
+            pointcells = list(points.keys())
+            index = GridIndex()
+            index.load(((i,(px,py,px,py)) for i,(px,py) in enumerate(pointcells)))
+            _calcall = _calcvalue
+            def _calcvalue(gridx, gridy, points):
+                nearest = index.nearest([gridx,gridy,gridx,gridy], num_results=neighbours)
+                return _calcall(gridx, gridy, dict(((pointcells[i],points[pointcells[i]]) for i in nearest)))
+
         # calculate values
         for gridy in range(raster.height):
             for gridx in range(raster.width):
@@ -310,40 +319,42 @@ def smooth(pointdata, rasterdef, valuefield=None, algorithm="radial", **kwargs):
         raster.add_band() # add empty band
         band = raster.bands[0]
 
-        # calculate for each cell
-        if not hasattr(pointdata, "spindex"):
-            pointdata.create_spatial_index()
         raster.convert("float32") # output will be floats
         if not "radius" in kwargs:
             raise Exception("Radius must be set for 'radial' method")
         rad = float(kwargs["radius"])
-        c = None
-        for cell in band:
-            
-            #if c != cell.row:
-            #    print cell.row
-            #    c = cell.row
-                
-            px,py = cell.col,cell.row
-            x,y = raster.cell_to_geo(px,py)
-            
-            def weights():
-                for feat in pointdata.quick_overlap([x-rad,y-rad,
-                                                     x+rad,y+rad]):
-                    fx,fy = feat.geometry["coordinates"] # assumes single point
-                    dist = math.sqrt((fx-x)**2 + (fy-y)**2)
-                    if dist <= rad:
-                        weight = feat[valuefield] if valuefield else 1
+
+        # index the points in a grid
+        from ..vector.spindex import GridIndex
+        points = dict()
+        for feat in pointdata:
+            if feat.geometry:
+                fx,fy = feat.geometry["coordinates"] # assumes single point
+                points[feat.id] = fx, fy, (feat[valuefield] if valuefield else 1)
+        index = GridIndex()
+        index.load(((id,(fx,fy,fx,fy)) for id,(fx,fy,_) in points.items()))
+
+        from ..vector import sql
+        valfunc = lambda v: v
+        aggfunc = kwargs.get("aggfunc", "sum")
+        fieldmapping = [("aggval",valfunc,aggfunc)]
+
+        # calculate one row of cells at a time, looking up the points near all cells of the row at once
+        for py in range(raster.height):
+            coords = [raster.cell_to_geo(px,py) for px in range(raster.width)]
+            nearby = index.within_distance_many(coords, rad)
+            for px,(x,y),ids in zip(range(raster.width), coords, nearby):
+
+                def weights():
+                    for id in ids:
+                        fx,fy,weight = points[id]
+                        dist = math.sqrt((fx-x)**2 + (fy-y)**2)
                         yield weight * (1 - (dist / rad))
 
-            from ..vector import sql
-            valfunc = lambda v: v
-            aggfunc = kwargs.get("aggfunc", "sum")
-            fieldmapping = [("aggval",valfunc,aggfunc)]
-            aggval = sql.aggreg(weights(), fieldmapping)[0]
-        
-            if aggval or aggval == 0:
-                cell.value = aggval
+                aggval = sql.aggreg(weights(), fieldmapping)[0]
+            
+                if aggval or aggval == 0:
+                    band.set(px, py, aggval)
 
     elif algorithm == "gauss":
         # create output raster
@@ -882,13 +882,6 @@ def rasterize(vectordata, valuekey=None, stat=None, priority=None, partial=None,
         if not hasattr(vectordata, "spindex"):
             vectordata.create_spatial_index()
 
-        # prepare geometries
-        from shapely.prepared import prep
-        for f in vectordata:
-            if f.geometry:
-                f._shapely = f.get_shapely()
-                f._prepped = prep(f._shapely)
-
         # burn all self intersections onto mask (constant time, slower for easy small geoms)
         for f1 in vectordata:
             if not f1.geometry:
@@ -901,7 +894,7 @@ def rasterize(vectordata, valuekey=None, stat=None, priority=None, partial=None,
             for f2 in vectordata.quick_overlap(f1.bbox):
                 if not f2.geometry:
                     continue
-                if f1 is not f2:
+                if f1.id != f2.id:
                     burn(1, f2, d2)
 
             # if any, then get common raster intersection with main feat
@@ -944,7 +937,7 @@ def rasterize(vectordata, valuekey=None, stat=None, priority=None, partial=None,
                     # get features in that cell
                     spindex = list(vectordata.quick_overlap(cellgeom.bounds))
                     intsecs = [feat for feat in spindex
-                               if feat.geometry and feat._prepped.intersects(cellgeom)]
+                               if feat.geometry and feat.get_prepared().intersects(cellgeom)]
                     if not intsecs:
                         continue
 
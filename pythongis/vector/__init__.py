@@ -14,3 +14,7 @@ from . import converter
 from . import sql
 
 from . import spindex
+
+from . import storage
+
+from . import streaming
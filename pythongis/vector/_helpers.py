@@ -11,6 +11,35 @@ def _pairwise(iterable):
     next(b, None)
     return zip(a, b)
 
+def geojson_bbox(geometry):
+    """Calculates the bbox of a GeoJSON geometry, as a list of [xmin,ymin,xmax,ymax]."""
+    geotype = geometry["type"]
+    coords = geometry["coordinates"]
+
+    if geotype == "Point":
+        x,y = coords
+        bbox = [x,y,x,y]
+    elif geotype in ("MultiPoint","LineString"):
+        xs, ys = zip(*coords)
+        bbox = [min(xs),min(ys),max(xs),max(ys)]
+    elif geotype == "MultiLineString":
+        xs = [x for line in coords for x,y in line]
+        ys = [y for line in coords for x,y in line]
+        bbox = [min(xs),min(ys),max(xs),max(ys)]
+    elif geotype == "Polygon":
+        exterior = coords[0]
+        xs, ys = zip(*exterior)
+        bbox = [min(xs),min(ys),max(xs),max(ys)]
+    elif geotype == "MultiPolygon":
+        xs = [x for poly in coords for x,y in poly[0]]
+        ys = [y for poly in coords for x,y in poly[0]]
+        bbox = [min(xs),min(ys),max(xs),max(ys)]
+    return bbox
+
+def bbox_overlaps(bbox1, bbox2):
+    """Whether two [xmin,ymin,xmax,ymax] bboxes overlap."""
+    return bbox1[0] <= bbox2[2] and bbox1[2] >= bbox2[0] and bbox1[1] <= bbox2[3] and bbox1[3] >= bbox2[1]
+
 def _vincenty_distance(point1, point2, miles=False, a=6378137, b=6356752.314245, f=1/298.257223563, MILES_PER_KILOMETER=0.621371, MAX_ITERATIONS=200, CONVERGENCE_THRESHOLD=1e-12):
     """
     Vincenty's formula (inverse method) to calculate the distance (in
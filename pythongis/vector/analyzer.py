@@ -43,7 +43,12 @@ def spatial_stats(groupbydata, valuedata, fieldmapping=[], keepall=True, subkey=
         # vector in vector
         
         if not hasattr(valuedata, "spindex"): valuedata.create_spatial_index()
-        for groupfeat in groupfeats: 
+        template = sql.Aggregator(fieldmapping)
+
+        # get spindex possibilities of the features a batch at a time
+        groupfeats = list(groupfeats)
+        candidates = valuedata.quick_overlap_iter((groupfeat.bbox if groupfeat.geometry else None for groupfeat in groupfeats))
+        for groupfeat,valfeats in zip(groupfeats, candidates): 
 
             if not groupfeat.geometry:
                 if keepall:
@@ -54,9 +59,9 @@ def spatial_stats(groupbydata, valuedata, fieldmapping=[], keepall=True, subkey=
                 continue
             
             geom = groupfeat.get_shapely()
-            supergeom = supershapely(geom)
+            supergeom = groupfeat.get_prepared()
             #print groupfeat
-            valuefeats = ((valfeat,valfeat.get_shapely()) for valfeat in valuedata.quick_overlap(groupfeat.bbox))
+            valuefeats = ((valfeat,valfeat.get_shapely()) for valfeat in valfeats)
 
             # aggregate
             if groupbydata.type == valuedata.type == "Polygon":
@@ -70,19 +75,20 @@ def spatial_stats(groupbydata, valuedata, fieldmapping=[], keepall=True, subkey=
                     return supergeom.intersects(valgeom)
                 
             if key:
-                matches = (valfeat for valfeat,valgeom in valuefeats
+                matches = ((valfeat,valgeom) for valfeat,valgeom in valuefeats
                            if key(groupfeat,valfeat) and overlaps(valgeom))
             else:
                 matches = ((valfeat,valgeom) for valfeat,valgeom in valuefeats
                            if overlaps(valgeom))
 
             # clean potential junk, maybe allow user setting of minimum area (put on hold for now, maybe user should make sure of this in advance?)
-            def cleaned():
+            def cleaned(matches):
                 for valfeat,valgeom in matches:
                     yield valfeat
-            matches = list(cleaned())
+            matches = cleaned(matches)
 
             if subkey:
+                matches = list(matches)
                 if matches:
                     for group in sql.groupby(matches, subkey):
                         aggreg = sql.aggreg(group, fieldmapping)
@@ -97,11 +103,14 @@ def spatial_stats(groupbydata, valuedata, fieldmapping=[], keepall=True, subkey=
                     out.add_feature(newrow, geom.__geo_interface__)
 
             else:
-                if matches:
-                    aggreg = sql.aggreg(matches, fieldmapping)
+                # aggregate in a single pass without collecting the matches
+                agg = template.new()
+                for valfeat in matches:
+                    agg.add(valfeat)
 
                 # add
-                if matches:
+                if agg.n:
+                    aggreg = agg.result()
                     newrow = list(groupfeat.row)
                     newrow.extend( aggreg )
                     out.add_feature(newrow, geom.__geo_interface__)
@@ -289,9 +298,6 @@ def spatial_stats(groupbydata, valuedata, fieldmapping=[], keepall=True, subkey=
 def closest_point(data, otherdata):
     """Returns a dataset of only the closest point to the other"""
 
-    # TODO: not very effective right now
-    # should use multipurpose nearest iterator...
-
     if not hasattr(otherdata, "spindex"):
         otherdata.create_spatial_index()
 
@@ -302,8 +308,8 @@ def closest_point(data, otherdata):
     
     for feat in data:
         shp = feat.get_shapely()
-        othershps = (otherfeat.get_shapely() for otherfeat in otherdata)
-        nearest = sorted(othershps, key=lambda othershp: shp.distance(othershp))[0]
+        # only compare with as many of the other features as needed, via the spatial index
+        nearest = next(otherdata.quick_nearest(geometry=shp, n=1)).get_shapely()
         npoint = nearest_points(shp, nearest)[0]
         out.add_feature(feat.row, npoint.__geo_interface__)
         
@@ -3,8 +3,13 @@ Module containing the data structures and interfaces for operating with vector d
 """
 
 # import builtins
-import sys, os, itertools, operator, math
+import sys, os, itertools, operator, math, weakref
 from collections import OrderedDict
+from array import array
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping # PY2
 import datetime
 import warnings
 
@@ -12,6 +17,7 @@ import warnings
 # ...and rename them for clarity
 import shapely
 from shapely.geometry import asShape as geojson2shapely
+from shapely.prepared import prep as supershapely
 
 # import pycrs
 import pycrs
@@ -20,6 +26,7 @@ import pycrs
 from . import loader
 from . import saver
 from . import spindex
+from ._helpers import geojson_bbox as _geojson_bbox
 
 # PY3 fix
 try: 
@@ -30,6 +37,9 @@ except NameError:
 
 
 DEFAULT_SPATIAL_INDEX = 'rtree'
+PERSIST_SPATIAL_INDEX = False
+SHAPELY_CACHE_SIZE = 10000
+GROUPBY_MAX_GROUPS = 1000000
 
 
 
@@ -58,12 +68,94 @@ class _ModuleFuncsAsClassMethods(object):
 def is_missing(val):
     return val is None or (isinstance(val, float) and math.isnan(val))
 
+def _prep_row(data, row):
+    # returns a new row list ordered and sized according to the dataset fields
+    if row:
+        if isinstance(row, dict):
+            for fn in row.keys():
+                if fn not in data.fields:
+                    raise Exception("Field name '%s' does not exist" % fn)
+            row = [row.get(fn, None) for fn in data.fields]
+        else:
+            if len(row) != len(data.fields):
+                raise Exception("Row list must be of same length as parent dataset's field list")
+            row = list(row)
+    else:
+        row = [None for _ in data.fields]
+    return row
+
+def _parse_crs(crs):
+    # returns a pycrs object from any crs format, defaulting to unprojected WGS84
+    defaultcrs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
+    crs = crs or defaultcrs
+    if not isinstance(crs, pycrs.CS):
+        try:
+            crs = pycrs.parse.from_unknown_text(crs)
+        except:
+            warnings.warn('Failed to parse the given crs format, falling back to unprojected lat/long WGS84: \n {}'.format(crs))
+            crs = pycrs.parse.from_proj4(defaultcrs)
+    return crs
+
+class _Restartable(object):
+    # re-iterable wrapper that calls the given generator function anew each time it is iterated
+    def __init__(self, func):
+        self.func = func
+
+    def __iter__(self):
+        return iter(self.func())
+
+def _check_geomtype(data, geometry):
+    # ensures a geometry is of the same type as the dataset, or sets the dataset type if not yet set
+    if geometry:
+        geotype = geometry["type"]
+        if data.type: 
+            if "Point" in geotype and data.type == "Point": pass
+            elif "LineString" in geotype and data.type == "LineString": pass
+            elif "Polygon" in geotype and data.type == "Polygon": pass
+            else:
+                raise TypeError("Each feature geometry must be of the same type as the file it is attached to")
+        else: data.type = geotype.replace("Multi", "")
+
+
+
 
 
 
+class _ShapelyCache(object):
+    # keeps track of the features that have cached shapely geometries, in order of last use,
+    # so that the least recently used are dropped once there are more than SHAPELY_CACHE_SIZE. 
+    # the features are only weakly referenced, so that they and their datasets can still be garbage collected
+    def __init__(self):
+        self._feats = OrderedDict()
 
+    def touch(self, feat):
+        feats = self._feats
+        key = id(feat)
+        ref = feats.pop(key, None)
+        if ref is None:
+            limit = SHAPELY_CACHE_SIZE
+            if limit is not None:
+                while feats and len(feats) >= limit:
+                    _,oldref = feats.popitem(last=False)
+                    old = oldref()
+                    if old is not None:
+                        old._cached_shapely = None
+            ref = weakref.ref(feat, lambda ref, key=key: feats.get(key) is ref and feats.pop(key))
+        feats[key] = ref
 
-class Feature:
+    def discard(self, feat):
+        self._feats.pop(id(feat), None)
+
+    def clear(self):
+        for ref in list(self._feats.values()):
+            feat = ref()
+            if feat is not None:
+                feat._cached_shapely = None
+        self._feats.clear()
+
+_shapely_cache = _ShapelyCache()
+
+class Feature(object):
     """
     Class representing a vector data feature. 
     A feature object contains attributes/properties describing the feature, 
@@ -85,6 +177,7 @@ class Feature:
         _cached_bbox: A cached version of the feature's bounding box, to avoid having to repeat the calculation each time. 
             All methods that change the feature's geometry should reset this cache to None in order to recalculate the bbox. 
             In case of errors, the user may reset this themselves by setting it to None. 
+            Resetting it also resets the cached shapely geometry of get_shapely() and get_prepared(). 
             
             TODO:
             - Make sure all methods that alter the geometry indeed does reset the cache. 
@@ -100,6 +193,8 @@ class Feature:
         _data: The parent vector dataset to which the feature belongs. 
     
     """
+    __slots__ = ("_data", "_row", "_geometry", "_bbox", "_cached_shapely", "id", "__weakref__")
+    
     def __init__(self, data, row=None, geometry=None, id=None):
         """
         Creates new feature class.
@@ -115,52 +210,43 @@ class Feature:
             id (optional): If given, manually sets the feature's ID in the parent vector dataset. Otherwise, automatically assigned. 
         """
         self._data = data
-        if row:
-            if isinstance(row, list):
-                if len(row) != len(self._data.fields):
-                    raise Exception("Row list must be of same length as parent dataset's field list")
-                row = list(row)
-            elif isinstance(row, dict):
-                for fn in row.keys():
-                    if fn not in self._data.fields:
-                        raise Exception("Field name '%s' does not exist" % fn)
-                row = [row.get(fn, None) for fn in self._data.fields]
-        else:
-            row = [None for _ in self._data.fields]
-        self.row  = row
+        self._row = _prep_row(data, row)
 
         if geometry:
             geometry = geometry.copy()
             bbox = geometry.get("bbox")
-            self._cached_bbox = bbox
+            self._bbox = bbox
         else:
-            self._cached_bbox = None
+            self._bbox = None
 
-        self.geometry = geometry
+        self._geometry = geometry
+        self._cached_shapely = None
 
         # ensure it is same geometry type as parent
-        if self.geometry:
-            geotype = geometry["type"]
-            if self._data.type: 
-                if "Point" in geotype and self._data.type == "Point": pass
-                elif "LineString" in geotype and self._data.type == "LineString": pass
-                elif "Polygon" in geotype and self._data.type == "Polygon": pass
-                else:
-                    raise TypeError("Each feature geometry must be of the same type as the file it is attached to")
-            else: self._data.type = self.geometry["type"].replace("Multi", "")
+        _check_geomtype(data, geometry)
         
         if id == None: id = next(self._data._id_generator)
         self.id = id
 
     def __getitem__(self, i):
         if isinstance(i, basestring):
-            i = self._data.fields.index(i)
+            i = self._data.field_index(i)
         return self.row[i]
 
     def __setitem__(self, i, setvalue):
         if isinstance(i, basestring):
-            i = self._data.fields.index(i)
-        self.row[i] = setvalue
+            i = self._data.field_index(i)
+        self._row[i] = setvalue
+        self._data._modified = True
+
+    @property
+    def row(self):
+        return self._row
+
+    @row.setter
+    def row(self, row):
+        self._row = row
+        self._data._modified = True
 
     @property
     def __geo_interface__(self):
@@ -169,45 +255,70 @@ class Feature:
                     properties=dict(zip(self._data.fields,self.row))
                     )
 
+    @property
+    def geometry(self):
+        return self._geometry
+
+    @geometry.setter
+    def geometry(self, geometry):
+        self._geometry = geometry
+        self._cached_bbox = None
+
+    @property
+    def _cached_bbox(self):
+        return self._bbox
+
+    @_cached_bbox.setter
+    def _cached_bbox(self, bbox):
+        self._bbox = bbox
+        if bbox is None:
+            # the geometry has changed, so the shapely geometry and the spatial index of the parent dataset must be updated
+            if self._cached_shapely is not None:
+                self._cached_shapely = None
+                _shapely_cache.discard(self)
+            self._data._modified = True
+            if hasattr(self._data, "spindex"):
+                self._data._reindex_feature(self)
+
     @property
     def bbox(self):
         if not self.geometry:
             raise Exception("Cannot get bbox of null geometry")
         if not self._cached_bbox:
-            geotype = self.geometry["type"]
-            coords = self.geometry["coordinates"]
-
-            if geotype == "Point":
-                x,y = coords
-                bbox = [x,y,x,y]
-            elif geotype in ("MultiPoint","LineString"):
-                xs, ys = zip(*coords)
-                bbox = [min(xs),min(ys),max(xs),max(ys)]
-            elif geotype == "MultiLineString":
-                xs = [x for line in coords for x,y in line]
-                ys = [y for line in coords for x,y in line]
-                bbox = [min(xs),min(ys),max(xs),max(ys)]
-            elif geotype == "Polygon":
-                exterior = coords[0]
-                xs, ys = zip(*exterior)
-                bbox = [min(xs),min(ys),max(xs),max(ys)]
-            elif geotype == "MultiPolygon":
-                xs = [x for poly in coords for x,y in poly[0]]
-                ys = [y for poly in coords for x,y in poly[0]]
-                bbox = [min(xs),min(ys),max(xs),max(ys)]
-            self._cached_bbox = bbox
+            self._cached_bbox = _geojson_bbox(self.geometry)
         return self._cached_bbox
 
     def get_shapely(self):
-        """Creates and returns the shapely object of the feature geometry. 
+        """Returns the shapely object of the feature geometry. 
+        
+        The shapely object is cached on the feature until its geometry is changed, for as long as the feature is among the 
+        SHAPELY_CACHE_SIZE most recently used features (set to None for no limit, or 0 to disable caching). 
         
         NOTE: 
-        - Repeated calling of this method can cause considerable overhead.
         - Will be depreceated once all geometry operations are outsourced to a Geometry class. 
         """
+        return self._get_cached_shapely(prepared=False)
+
+    def get_prepared(self):
+        """Returns the prepared shapely object of the feature geometry, which is much faster when testing the same geometry 
+        against many others with the intersects, contains, covers, crosses, disjoint, overlaps, touches, or within predicates. 
+        Cached the same way as get_shapely(). 
+        """
+        return self._get_cached_shapely(prepared=True)
+
+    def _get_cached_shapely(self, prepared):
         if not self.geometry:
             raise Exception("Cannot get shapely object of null geometry")
-        return geojson2shapely(self.geometry)                
+        cached = self._cached_shapely
+        if cached is None:
+            if SHAPELY_CACHE_SIZE == 0:
+                geom = geojson2shapely(self.geometry)
+                return supershapely(geom) if prepared else geom
+            cached = self._cached_shapely = [geojson2shapely(self.geometry), None]
+        if prepared and cached[1] is None:
+            cached[1] = supershapely(cached[0])
+        _shapely_cache.touch(self)
+        return cached[1] if prepared else cached[0]
 
     def copy(self):
         """Copies the feature and returns a new instance."""
@@ -276,23 +387,23 @@ class Feature:
             if coords:
                 geoj["coordinates"] = coords[0]
             else:
-                self.geometry = None
+                geoj = None
         elif geotype in ("MultiPoint","LineString"):
             geoj["coordinates"] = wrapfunc(coords)
             if not geoj["coordinates"]:
-                self.geometry = None
+                geoj = None
         elif geotype == "MultiLineString":
             coords = [wrapfunc(line)
                      for line in coords]
             geoj["coordinates"] = [line for line in coords if line]
             if not any(geoj["coordinates"]):
-                self.geometry = None
+                geoj = None
         elif geotype == "Polygon":
             coords = [wrapfunc(ext_or_hole)
                      for ext_or_hole in coords]
             geoj["coordinates"] = [ext_or_hole for ext_or_hole in coords if ext_or_hole]
             if not any(geoj["coordinates"]):
-                self.geometry = None
+                geoj = None
         elif geotype == "MultiPolygon":
             coords = [[wrapfunc(ext_or_hole)
                         for ext_or_hole in poly]
@@ -303,9 +414,10 @@ class Feature:
             geoj["coordinates"] = [poly
                                    for poly in coords if poly]
             if not any(geoj["coordinates"]):
-                self.geometry = None
+                geoj = None
             
-        self._cached_bbox = None
+        # also resets the bbox
+        self.geometry = geoj
         
         return True
 
@@ -372,12 +484,307 @@ class Feature:
 
 
 
+class _StoredFeature(Feature):
+    """
+    Lightweight view of a feature whose row and geometry are kept in the storage backend of the
+    parent dataset (see `vector.storage`), rather than on the feature itself. The feature id is
+    the row index in the storage. 
+    Used internally by VectorData instances created with a storage option. 
+    """
+    __slots__ = ()
+    
+    def __init__(self, data, id):
+        self._data = data
+        self.id = id
+
+    def __eq__(self, other):
+        return isinstance(other, _StoredFeature) and other._data is self._data and other.id == self.id
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._data), self.id))
+
+    def __getitem__(self, i):
+        if isinstance(i, basestring):
+            i = self._data.field_index(i)
+        return self._data._storage.get_value(self.id, i)
+
+    def __setitem__(self, i, setvalue):
+        if isinstance(i, basestring):
+            i = self._data.field_index(i)
+        self._data._storage.set_value(self.id, i, setvalue)
+        self._data._modified = True
+
+    @property
+    def row(self):
+        return self._data._storage.get_row(self.id)
+
+    @row.setter
+    def row(self, row):
+        self._data._storage.set_row(self.id, row)
+        self._data._modified = True
+
+    @property
+    def geometry(self):
+        return self._data._storage.get_geometry(self.id)
+
+    @geometry.setter
+    def geometry(self, geometry):
+        _check_geomtype(self._data, geometry)
+        self._data._storage.set_geometry(self.id, geometry)
+        self._data._modified = True
+        if hasattr(self._data, "spindex"):
+            self._data._reindex_feature(self)
+
+    def _get_cached_shapely(self, prepared):
+        # stored features are only short-lived views, so nothing is cached
+        if not self.geometry:
+            raise Exception("Cannot get shapely object of null geometry")
+        geom = geojson2shapely(self.geometry)
+        return supershapely(geom) if prepared else geom
+
+    @property
+    def _cached_bbox(self):
+        return self._data._storage.get_bbox(self.id)
 
-def ID_generator():
+    @_cached_bbox.setter
+    def _cached_bbox(self, bbox):
+        # the storage always keeps the bbox up to date with the geometry
+        # so only explicitly given bboxes are written
+        if bbox:
+            self._data._storage.set_bbox(self.id, bbox)
+
+
+class _StoredFeatures(MutableMapping):
+    """
+    Ordered mapping of feature ids to feature views, used in place of the features OrderedDict
+    for VectorData instances created with a storage option. Views are created on the fly and are
+    not kept in memory. 
+    """
+    def __init__(self, data):
+        self._data = data
+        n = len(data._storage)
+        self._order = array("q", data._storage.ids())
+        if len(self._order) == n:
+            self._present = bytearray(b"\x01") * n
+        else:
+            # some rows have been deleted
+            self._present = bytearray(n)
+            for id in self._order:
+                self._present[id] = 1
+        self._sequential = True # whether the features are ordered the same as in the storage
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __contains__(self, id):
+        return isinstance(id, int) and 0 <= id < len(self._present) and self._present[id] == 1
+
+    def __getitem__(self, id):
+        if id not in self:
+            raise KeyError(id)
+        return _StoredFeature(self._data, id)
+
+    def __setitem__(self, id, feature):
+        if id in self:
+            if not (isinstance(feature, _StoredFeature) and feature == self[id]):
+                stored = self[id]
+                stored.row = _prep_row(self._data, feature.row)
+                stored.geometry = feature.geometry
+        else:
+            raise KeyError("Can only set features that already exist in the storage, use add_feature() to add new ones")
+
+    def __delitem__(self, id):
+        if id not in self:
+            raise KeyError(id)
+        self._order.remove(id)
+        self._present[id] = 0
+        self._data._storage.delete(id)
+        self._data._modified = True
+
+    def values(self):
+        data = self._data
+        return (_StoredFeature(data, id) for id in self._order)
+
+    def add(self, row=None, geometry=None):
+        """Adds and returns a new feature view."""
+        data = self._data
+        row = _prep_row(data, row)
+        _check_geomtype(data, geometry)
+        id = data._storage.append(row, geometry)
+        self._order.append(id)
+        self._present.append(1)
+        return _StoredFeature(data, id)
+
+    def reorder(self, ids):
+        """Changes the iteration order to the given sequence of feature ids."""
+        self._order = array("q", ids)
+        self._sequential = all((a < b for a,b in zip(self._order, self._order[1:])))
+
+    def insert_column(self, index=None):
+        self._data._storage.insert_column(index)
+
+    def delete_column(self, index):
+        self._data._storage.delete_column(index)
+
+    def iter_bboxes(self):
+        """Yields the id and bbox of all features with geometry, without decoding the geometries."""
+        storage = self._data._storage
+        if self._sequential:
+            present = self._present
+            for id,bbox in storage.iter_bboxes():
+                if present[id]:
+                    yield id, bbox
+        else:
+            for id in self._order:
+                bbox = storage.get_bbox(id)
+                if bbox:
+                    yield id, bbox
+
+    def column(self, colindex):
+        """Returns the values of a column in feature order."""
+        col = self._data._storage.column(colindex)
+        if self._sequential and len(self._order) == len(self._present):
+            return col
+        else:
+            return [col[id] for id in self._order]
+
+    def copy(self, data):
+        new = _StoredFeatures(data)
+        new._order = self._order[:]
+        new._present = self._present[:]
+        new._sequential = self._sequential
+        return new
+
+
+class _LazyFeatures(MutableMapping):
+    """
+    Ordered mapping of feature ids to features, used in place of the features OrderedDict
+    for VectorData instances created with the lazy option. Takes the loaded rows and geometries
+    and only creates the Feature instance for each of them when first accessed, after which it is 
+    kept and the loaded row and geometry released. The feature id of a loaded row is its position 
+    in the loaded rows. 
+    """
+    def __init__(self, data, rows, geometries):
+        self._data = data
+        self._rows = list(rows)
+        self._geoms = list(geometries)
+        if len(self._rows) != len(self._geoms):
+            raise Exception("Rows and geometries must be of equal length")
+        n = len(self._rows)
+        self._order = list(range(n))
+        self._pending = bytearray(b"\x01") * n # whether the feature is yet to be created
+        self._feats = dict()
+
+        # determine dataset type from the first geometry
+        for geom in self._geoms:
+            if geom:
+                _check_geomtype(data, geom)
+                break
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __contains__(self, id):
+        if id in self._feats:
+            return True
+        return isinstance(id, int) and 0 <= id < len(self._pending) and self._pending[id] == 1
+
+    def _build(self, id):
+        row,geom = self._rows[id],self._geoms[id]
+        feat = Feature(self._data, row, geom, id=id)
+        self._feats[id] = feat
+        self._pending[id] = 0
+        self._rows[id] = self._geoms[id] = None
+        return feat
+
+    def __getitem__(self, id):
+        feat = self._feats.get(id)
+        if feat is None:
+            if id not in self:
+                raise KeyError(id)
+            feat = self._build(id)
+        return feat
+
+    def __setitem__(self, id, feature):
+        if id not in self:
+            self._order.append(id)
+        elif id < len(self._pending) and self._pending[id]:
+            self._pending[id] = 0
+            self._rows[id] = self._geoms[id] = None
+        self._feats[id] = feature
+        self._data._modified = True
+
+    def __delitem__(self, id):
+        if id not in self:
+            raise KeyError(id)
+        self._order.remove(id)
+        self._feats.pop(id, None)
+        if id < len(self._pending):
+            self._pending[id] = 0
+            self._rows[id] = self._geoms[id] = None
+        self._data._modified = True
+
+    def values(self):
+        return (self[id] for id in self._order)
+
+    def reorder(self, ids):
+        """Changes the iteration order to the given sequence of feature ids."""
+        self._order = list(ids)
+
+    def insert_column(self, index=None):
+        # the loaded rows may belong to someone else, so are replaced rather than changed in-place
+        for i,row in enumerate(self._rows):
+            if row is not None:
+                row = list(row)
+                if index is None:
+                    row.append(None)
+                else:
+                    row.insert(index, None)
+                self._rows[i] = row
+        for feat in self._feats.values():
+            if index is None:
+                feat.row.append(None)
+            else:
+                feat.row.insert(index, None)
+
+    def delete_column(self, index):
+        for i,row in enumerate(self._rows):
+            if row is not None:
+                row = list(row)
+                del row[index]
+                self._rows[i] = row
+        for feat in self._feats.values():
+            del feat.row[index]
+
+    def iter_bboxes(self):
+        """Yields the id and bbox of all features with geometry, without creating the features not yet accessed."""
+        for id in self._order:
+            feat = self._feats.get(id)
+            if feat is not None:
+                if feat.geometry:
+                    yield id, feat.bbox
+            else:
+                geom = self._geoms[id]
+                if geom:
+                    yield id, geom.get("bbox") or _geojson_bbox(geom)
+
+
+
+
+def ID_generator(start=0):
     """Used internally for ensuring default feature IDs are unique for each VectorData instance.
     TODO: Maybe make private. 
     """
-    i = 0
+    i = start
     while True:
         yield i
         i += 1
@@ -397,7 +804,7 @@ NAMEGEN = Name_generator()
 
 
 
-class VectorData:
+class VectorData(object):
     """
     Class representing a vector dataset. 
     
@@ -426,21 +833,18 @@ class VectorData:
         analyze: Access all methods from the analyzer module, passing self as first arg.
         convert: Access all methods from the converter module, passing self as first arg.
     """
-    def __init__(self, filepath=None, type=None, name=None, fields=None, rows=None, geometries=None, features=None, crs=None, **kwargs):
+    def __init__(self, filepath=None, type=None, name=None, fields=None, rows=None, geometries=None, features=None, crs=None, storage=None, lazy=False, **kwargs):
         """A vector dataset can be created in several ways. 
         
         To create an empty dataset, simply initiate the class with no args. A list of field names can be set with the fields arg, 
         or set after creation. 
         
-        To load from a file, specify the filepath argument. The "select" option can be used to only populate the data with a subsample of 
-        features instead of the entire dataset. When loading non-spatial file formats, the "x/yfield" and "geokey" args can be set to calculate
+        To load from a file, specify the filepath argument. The "select" and "bbox" options can be used to only populate the data with a subsample of 
+        features instead of the entire dataset, and are applied while reading the file. When loading non-spatial file formats, the "x/yfield" and "geokey" args can be set to calculate
         the geometry based on the attributes of each row. Optional **kwargs can be used to pass on format-specific loading options. 
         Supported reading fileformats include: 
         - fdsfds...
         
-        TODO: 
-        - Ensure that select applies to all file formats, not just the non-spatial ones. 
-        
         To initiate from a list of existing Feature instances, pass in to the features arg. 
         Alternatively, to load a dataset from separate lists of row values and geometry GeoJSON dictionaries, pass in the rows and geometries args 
         as lists of equal length. 
@@ -465,10 +869,31 @@ class VectorData:
                 TODO: Currently holds no meaning, makes no difference for any methods or functions. Maybe add on-the-fly reprojection? 
             
             select (optional): Function that takes a fieldname-value dictionary mapping and returns True for features that should be loaded. 
+            bbox (optional): Only loads features whose geometry bbox overlaps the given [xmin,ymin,xmax,ymax] bbox. For shapefiles, 
+                non-matching shapes are skipped without being decoded. 
             x/yfield (optional): Specifies the field name containing the x/y coordinates of each feature, used for creating the feature 
                 geometries of non-spatial fileformat point data. 
             geokey (optional): Function for creating more advanced types of geometries of non-spatial fileformats. The function takes
                 a fieldname-value dictionary mapping and returns a GeoJSON dictionary, or None for null-geometries. 
+
+            storage (optional): How to store the rows and geometries in memory. Default is to keep a separate Feature object
+                for each feature. Alternatively:
+                - "columnar": keeps each field as a single typed array or list, and geometries as packed coordinate arrays, 
+                    with the features being lightweight views into them. Much less memory demanding for large datasets
+                    and faster for whole-column operations. See `vector.storage.ColumnarStorage`. 
+                - "sqlite": keeps the rows and geometries on disk in a SQLite database file, along with an R*Tree 
+                    spatial index, so that datasets larger than memory can be used. If the "database" option is set
+                    to the filepath of a previously built database, it is opened directly instead of loading the data again, 
+                    otherwise the database is built at that filepath (default is a temporary file). 
+                    Call commit() to write any changes to the database file. See `vector.storage.SqliteStorage`. 
+                Files in the binary columnar format (.pgc) are memory-mapped into columnar storage by default. 
+            lazy (optional): If True, only creates the Feature instance of each row the first time it is accessed, 
+                so that the time and memory spent on features is proportional to how many of them are actually used. 
+                Only applies to the default storage. 
+            
+            cache (optional): If True, saves the loaded file to a sidecar file in the binary columnar format (see `fileformats.columnar`), 
+                and the next time the same file is loaded with the same options, loads the sidecar file instead, as long as 
+                the file has not been modified since. 
             
             **kwargs: File-format specific loading options. See `vector.loader` for details.
         """
@@ -481,41 +906,118 @@ class VectorData:
         # if None, type enforcement will be based on first geometry found
         self.type = type
         
-        if filepath:
-            fields,rows,geometries,crs = loader.from_file(filepath, crs=crs, **kwargs)
-        else:
-            if features:
-                rows,geometries = zip(*((feat.row,feat.geometry) for feat in features))
+        self._id_generator = ID_generator()
+        self._fields = []
+        self._fieldindex = dict()
+
+        # use or create sidecar cache
+        cache = kwargs.pop("cache", False)
+
+        # remember the source file and options, for identifying sidecar files built from it
+        self._source = (filepath, dict(kwargs)) if filepath else None
+        cachepath = None
+        if filepath and cache:
+            from .fileformats import columnar
+            if any((hasattr(v, "__call__") for v in kwargs.values())):
+                warnings.warn("Datasets loaded with function arguments such as select or geokey can't be cached, loading without cache")
+            elif columnar.valid_cache(filepath, kwargs):
+                filepath, kwargs = columnar.cache_path(filepath), dict()
             else:
-                rows = rows or []
-                geometries = geometries or []
-            fields = fields or []
-            crs = crs
+                cachepath = columnar.cache_path(filepath)
+                cachekey = columnar.cache_key(filepath, kwargs)
 
-        self.fields = fields
+        # binary columnar files are memory-mapped straight into columnar storage
+        if filepath and filepath.lower().endswith(".pgc") and storage is None and not lazy:
+            storage = "columnar"
 
-        self._id_generator = ID_generator()
-        
-        ids_rows_geoms = zip(self._id_generator,rows,geometries)
-        featureobjs = (Feature(self,row,geom,id=id) for id,row,geom in ids_rows_geoms )
-        self.features = OrderedDict([ (feat.id,feat) for feat in featureobjs ])
+        self._storage_option = storage
 
-        defaultcrs = "+proj=longlat +ellps=WGS84 +datum=WGS84 +no_defs"
-        crs = crs or defaultcrs
-        if not isinstance(crs, pycrs.CS):
-            try:
-                crs = pycrs.parse.from_unknown_text(crs)
-            except:
-                warnings.warn('Failed to parse the given crs format, falling back to unprojected lat/long WGS84: \n {}'.format(crs))
-                crs = pycrs.parse.from_proj4(defaultcrs)
-        self.crs = crs
+        if storage is None:
+            self._storage = None
+            
+            if filepath:
+                fields,rows,geometries,crs = loader.from_file(filepath, crs=crs, **kwargs)
+            else:
+                if features:
+                    rows,geometries = zip(*((feat.row,feat.geometry) for feat in features))
+                else:
+                    rows = rows or []
+                    geometries = geometries or []
+                fields = fields or []
+                crs = crs
+
+            self.fields = fields
+
+            if lazy:
+                self.features = _LazyFeatures(self, rows, geometries)
+                self._id_generator = ID_generator(len(self.features))
+            else:
+                ids_rows_geoms = zip(self._id_generator,rows,geometries)
+                featureobjs = (Feature(self,row,geom,id=id) for id,row,geom in ids_rows_geoms )
+                self.features = OrderedDict([ (feat.id,feat) for feat in featureobjs ])
+
+        elif storage in ("columnar","sqlite"):
+            from .storage import ColumnarStorage, SqliteStorage
+            database = kwargs.pop("database", None)
+
+            if storage == "columnar" and filepath and filepath.lower().endswith(".pgc"):
+                from .fileformats import columnar
+                header,self._storage = columnar.read(filepath)
+                self.fields = list(header["fields"])
+                self.type = self.type or header["type"]
+                crs = crs or header["crs"]
+                self.features = _StoredFeatures(self)
+
+            elif storage == "sqlite" and database and os.path.exists(database):
+                # reopen a previously built database instead of loading the file again
+                self._storage = SqliteStorage(database)
+                meta = self._storage.meta
+                self.fields = list(meta["fields"])
+                self.type = self.type or meta["type"]
+                crs = crs or meta["crs"]
+                self.features = _StoredFeatures(self)
+
+            else:
+                # rows and geometries are streamed straight into the storage
+                if filepath:
+                    fields,rowgeoms,crs = loader.iter_file(filepath, crs=crs, **kwargs)
+                else:
+                    if features:
+                        rowgeoms = ((feat.row,feat.geometry) for feat in features)
+                    else:
+                        rowgeoms = zip(rows or [], geometries or [])
+                    fields = fields or []
+                    crs = crs
+
+                self.fields = list(fields)
+
+                if storage == "columnar":
+                    self._storage = ColumnarStorage(len(self.fields))
+                else:
+                    self._storage = SqliteStorage(database, len(self.fields))
+                self.features = _StoredFeatures(self)
+                for row,geom in rowgeoms:
+                    self.features.add(row, geom)
+
+        else:
+            raise Exception("No such storage option: {}".format(storage))
+
+        self.crs = _parse_crs(crs)
+        self.commit()
+
+        # whether features have been added, deleted or edited since loading,
+        # in which case sidecar files built from the source file no longer apply
+        self._modified = False
+
+        if cachepath:
+            self.save(cachepath, meta=dict(cache=cachekey))
 
     def __repr__(self):
         attrs = dict(filepath=self.filepath,
                      type=self.type,
                      length=len(self),
                      )
-        if any((f.geometry for f in self)):
+        if self.has_geometry():
             attrs["bbox"] = self.bbox
         else:
             attrs["bbox"] = None
@@ -550,7 +1052,26 @@ class VectorData:
         if isinstance(i, slice):
             raise Exception("Can only set one feature at a time")
         else:
+            existed = i in self.features
             self.features[i] = feature
+            self._modified = True
+            if hasattr(self, "spindex"):
+                if existed:
+                    self.spindex.delete(i)
+                if feature.geometry:
+                    self.spindex.insert(i, feature.bbox)
+
+    def __delitem__(self, i):
+        """
+        Drop a Feature based on its feature id.
+        """
+        if isinstance(i, slice):
+            raise Exception("Can only drop one feature at a time")
+        else:
+            del self.features[i]
+            self._modified = True
+            if hasattr(self, "spindex"):
+                self.spindex.delete(i)
 
     def __geo_interface__(self):
         """
@@ -560,12 +1081,25 @@ class VectorData:
 
     def has_geometry(self):
         """Returns True if at least one feature has non-null geometry."""
-        return any((feat.geometry for feat in self))
+        for _ in self._iter_bboxes():
+            return True
+        return False
+
+    def _iter_bboxes(self):
+        # yields the id and bbox of all features with geometry,
+        # without creating or decoding features when possible
+        if isinstance(self.features, (_StoredFeatures,_LazyFeatures)):
+            for id,bbox in self.features.iter_bboxes():
+                yield id, bbox
+        else:
+            for feat in self:
+                if feat.geometry:
+                    yield feat.id, feat.bbox
 
     @property
     def bbox(self):
         if self.has_geometry():
-            xmins, ymins, xmaxs, ymaxs = zip(*(feat.bbox for feat in self if feat.geometry))
+            xmins, ymins, xmaxs, ymaxs = zip(*(bbox for id,bbox in self._iter_bboxes()))
             bbox = min(xmins),min(ymins),max(xmaxs),max(ymaxs)
             return bbox
         else:
@@ -575,29 +1109,89 @@ class VectorData:
 
     def sort(self, key, reverse=False):
         """Sorts the feature order in-place using a key function and optional reverse flag."""
-        self.features = OrderedDict([ (feat.id,feat) for feat in sorted(self.features.values(), key=key, reverse=reverse) ])
+        if isinstance(self.features, (_StoredFeatures,_LazyFeatures)):
+            self.features.reorder([feat.id for feat in sorted(self.features.values(), key=key, reverse=reverse)])
+        else:
+            self.features = OrderedDict([ (feat.id,feat) for feat in sorted(self.features.values(), key=key, reverse=reverse) ])
         return self
 
     def add_feature(self, row=None, geometry=None):
         """Adds and returns a new feature, given a row list or dict, and a geometry GeoJSON dictionary.
         If neither are set, populates row with None values, and empty geometry.
         """
+        if self._storage is not None:
+            feature = self.features.add(row, geometry)
+            self._modified = True
+            if hasattr(self, "spindex") and feature.geometry:
+                self.spindex.insert(feature.id, feature.bbox)
+            return feature
         feature = Feature(self, row, geometry)
         self[feature.id] = feature
         return feature
 
+    def _reindex_feature(self, feature):
+        # updates the spatial index after the geometry of a feature has changed,
+        # as long as the feature belongs to this dataset
+        features = self.features
+        if isinstance(features, _StoredFeatures):
+            member = feature.id in features
+        elif isinstance(features, _LazyFeatures):
+            member = features._feats.get(feature.id) is feature
+        else:
+            member = features.get(feature.id) is feature
+        if member:
+            self.spindex.delete(feature.id)
+            if feature.geometry:
+                self.spindex.insert(feature.id, feature.bbox)
+
+    @property
+    def fields(self):
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields):
+        self._fields = fields
+        self._update_fieldindex()
+
+    def _update_fieldindex(self):
+        # maps each field name to its position, keeping the first one in case of duplicate names
+        fieldindex = dict()
+        for i,field in enumerate(self._fields):
+            fieldindex.setdefault(field, i)
+        self._fieldindex = fieldindex
+
+    def field_index(self, field):
+        """Returns the index position of a field name, using a lookup table instead of searching through the fields.
+        Raises ValueError if no such field exists.
+        """
+        i = self._fieldindex.get(field)
+        if i is None or i >= len(self._fields) or self._fields[i] != field:
+            # the fields list was changed in-place, so refresh the lookup table
+            self._update_fieldindex()
+            i = self._fieldindex.get(field)
+            if i is None:
+                raise ValueError("%s is not a field" % field)
+        return i
+
     def add_field(self, field, index=None):
         """Adds a new field by the name of 'field', optionally at the specified index position.
         All existing feature rows are updated accordingly.
         """
         if index is None:
             self.fields.append(field)
-            for feat in self:
-                feat.row.append(None)
+            if isinstance(self.features, (_StoredFeatures,_LazyFeatures)):
+                self.features.insert_column()
+            else:
+                for feat in self:
+                    feat.row.append(None)
         else:
             self.fields.insert(index, field)
-            for feat in self:
-                feat.row.insert(index, None)
+            if isinstance(self.features, (_StoredFeatures,_LazyFeatures)):
+                self.features.insert_column(index)
+            else:
+                for feat in self:
+                    feat.row.insert(index, None)
+        self._update_fieldindex()
 
     def compute(self, field, value, by=None, stat=None):
         """Loops through all features and sets the row field to the given value.
@@ -611,10 +1205,10 @@ class VectorData:
             value: Any value or object to be written to the field, or a callable that expects a Feature as its input and outputs 
                 the value to write. 
             by: A field name by which to group, or a callable that expects a Feature as its input and outputs the group-by value.
-            stat: The name of a summary statistic to calculate and write for each by-group, or a callable that expects a list of
-                Feature instances as input and returns the aggregated value to write. 
-                Valid stat values include: 
-                - fdsf...
+            stat: The name of a summary statistic to calculate and write for each by-group, or a callable that expects the list of
+                values from the group as input and returns the aggregated value to write. 
+                Valid stat values include count, sum, mean, min, max, var, stdev, majority, minority, first, last, distinct, 
+                and concat. See `vector.sql.accumulator` for details. 
         """
         if field not in self.fields:
             self.add_field(field)
@@ -626,14 +1220,30 @@ class VectorData:
 
         if by:
             from . import sql
-            fieldmapping = [(field, valfunc, stat)]
-            for feats in sql.groupby(self, key=by):
-                feats = list(feats)
-                # aggregate stat for each bygroup
-                aggval = sql.aggreg(feats, aggregfuncs=fieldmapping)[0]
-                # then write to every group member
-                for feat in feats:
-                    feat[field] = aggval
+            if isinstance(by, basestring):
+                byfield = by
+                by = lambda f: f[byfield]
+            elif isinstance(by, (list,tuple)):
+                byfields = by
+                by = lambda f: tuple((f[h] for h in byfields))
+            # group by contents for key values that are not hashable, eg lists
+            bykey = lambda f: sql._hashable(by(f))
+            # aggregate stat for each bygroup in a single pass
+            template = sql.Aggregator([(field, valfunc, stat)])
+            aggs = dict()
+            for feat in self:
+                keyval = bykey(feat)
+                agg = aggs.get(keyval)
+                if agg is None:
+                    agg = aggs[keyval] = template.new()
+                agg.add(feat)
+            aggvals = dict(((keyval,agg.result()[0]) for keyval,agg in aggs.items()))
+            # then write to every group member
+            for feat in self:
+                feat[field] = aggvals[bykey(feat)]
+        elif self._storage is not None and not hasattr(value, "__call__"):
+            # fill the entire column at once
+            self._storage.fill_column(self.field_index(field), value)
         else:
             for feat in self:
                 feat[field] = valfunc(feat)
@@ -652,7 +1262,8 @@ class VectorData:
 
     def moving_window(self, n, fieldmapping, groupby=None):
         """Loops through the features in the dataset, and calculates one or more new values based
-        on aggregate statistics of a moving window of previously visited rows.
+        on aggregate statistics of a moving window of previously visited rows. The statistics are based on the
+        values of each row at the time it entered the window. See `vector.sql.SlidingWindow`. 
         
         Arguments:
             n: Size of the moving window specified as number of rows.
@@ -661,45 +1272,55 @@ class VectorData:
                 of a new or existing field to write, valuefield is the field name or function that retrieves the value
                 to calculate statistics on, and stat is the name of the statistic to calculate or a function that takes
                 the list of values from the moving window as defined by valuefield. 
-                Valid stat values include: 
-                - fdsf...
+                Valid stat values include count, sum, mean, min, max, var, stdev, majority, minority, first, last, distinct, 
+                and concat. See `vector.sql.accumulator` for details. 
             groupby (optional): If specified, the moving window will run separately for each group of features as defined
                 by the groupby field name or grouping function. 
         """
         for name,valfunc,statfunc in fieldmapping:
             if not name in self.fields:
                 self.add_field(name)
-        prevs = []
 
         from . import sql
 
-        def calc(f, prevs, fieldmapping):
-            prevs.append(f)
-            if len(prevs) > n:
-                prevs.pop(0)
-            row = sql.aggreg(prevs, fieldmapping)
-            for (name,_,_),val in zip(fieldmapping,row):
+        # statistics are updated incrementally as rows enter and leave the window
+        template = sql.SlidingWindow(n, fieldmapping)
+
+        def calc(f, window):
+            window.add(f)
+            for (name,_,_),val in zip(fieldmapping, window.result()):
                 f[name] = val
 
         if groupby:
-            for _,feats in self.group(groupby):
-                prevs = []
-                for f in feats:
-                    calc(f, prevs, fieldmapping)
+            # keep a separate window for each group in a single pass, instead of grouping the features first
+            if isinstance(groupby, basestring):
+                groupfield = groupby
+                groupby = lambda f: f[groupfield]
+            windows = dict()
+            for f in self:
+                # group values such as lists are made hashable
+                keyval = sql._hashable(groupby(f))
+                window = windows.get(keyval)
+                if window is None:
+                    window = windows[keyval] = template.new()
+                calc(f, window)
 
         else:
-            prevs = []
             for f in self:
-                calc(f, prevs, fieldmapping)
+                calc(f, template)
         
         return self
 
     def drop_field(self, field):
         """Drops the specified field, changing the dataset in-place."""
-        fieldindex = self.fields.index(field)
+        fieldindex = self.field_index(field)
         del self.fields[fieldindex]
-        for feat in self:
-            del feat.row[fieldindex]
+        self._update_fieldindex()
+        if isinstance(self.features, (_StoredFeatures,_LazyFeatures)):
+            self.features.delete_column(fieldindex)
+        else:
+            for feat in self:
+                del feat.row[fieldindex]
 
     def drop_fields(self, fields):
         """Drops all of the specified fields, changing the dataset in-place."""
@@ -717,14 +1338,20 @@ class VectorData:
 
     def rename_field(self, oldname, newname):
         """Changes the name of a field from oldname to newname."""
-        self.fields[self.fields.index(oldname)] = newname
+        self.fields[self.field_index(oldname)] = newname
+        self._update_fieldindex()
 
     def convert_field(self, field, valfunc):
         """Applies the given valfunc function to force convert all values in a field."""
-        fieldindex = self.fields.index(field)
-        for feat in self:
-            val = feat.row[fieldindex]
-            feat.row[fieldindex] = valfunc(val)
+        fieldindex = self.field_index(field)
+        if self._storage is not None:
+            values = [valfunc(val) for val in self._storage.column(fieldindex)]
+            self._storage.delete_column(fieldindex)
+            self._storage.insert_column(fieldindex, values)
+        else:
+            for feat in self:
+                val = feat.row[fieldindex]
+                feat.row[fieldindex] = valfunc(val)
 
     # INSPECTING
 
@@ -740,7 +1367,7 @@ class VectorData:
         
         for field in self.fields:
             
-            values = [feat[field] for feat in self]
+            values = self.column(field)
             typ = self.field_type(field)
             getval = lambda v: v
             
@@ -805,7 +1432,7 @@ class VectorData:
                 printrow = [field, typ] + [None for _ in fieldmapping] + [None]
                 
             elif typ in ("int","float"):
-                values = [feat[field] for feat in self]
+                values = self.column(field)
                 _min,_max,mean,missing = sql.aggreg(values, aggregfuncs=fieldmapping)
                 missing = missing if missing else 0
                 valid = len(self) - missing
@@ -823,9 +1450,34 @@ class VectorData:
 
         print(outstring)
 
+    def column(self, field):
+        """Returns all the values of a field at once, in feature order.
+        When the data uses a storage backend, the column container is returned directly
+        and should be treated as read-only.
+        """
+        fieldindex = self.field_index(field)
+        if self._storage is not None:
+            return self.features.column(fieldindex)
+        return [feat.row[fieldindex] for feat in self]
+
+    def columns(self, *fields):
+        """Returns a list of the value columns of each of the given fields (default is all fields), in feature order.
+        Much faster than looking up the fields of each feature one at a time.
+        """
+        fields = fields or self.fields
+        indexes = [self.field_index(field) for field in fields]
+        if self._storage is not None:
+            return [self.features.column(i) for i in indexes]
+        cols = [[] for _ in indexes]
+        for feat in self:
+            row = feat.row
+            for col,i in zip(cols,indexes):
+                col.append(row[i])
+        return cols
+
     def field_values(self, field):
         """Returns sorted list of all the unique values in this field."""
-        return sorted(set(f[field] for f in self))
+        return sorted(set(self.column(field)))
 
     def field_type(self, field):
         """Determines and returns field type of field based on its values (ignoring missing values).
@@ -833,7 +1485,11 @@ class VectorData:
         
         TODO: also detect other types eg datetime, etc.
         """
-        values = (f[field] for f in self)
+        values = self.column(field)
+        if isinstance(values, (array,memoryview)):
+            # typed storage column
+            if (getattr(values, "typecode", None) or values.format) == "q":
+                return "int"
         values = (v for v in values if not is_missing(v))
         # approach: at first assume int, if fails then assume float,
         # ...if fails then assume text and stop checking (lowest possible dtype)
@@ -862,7 +1518,7 @@ class VectorData:
         
         typ = self.field_type(field)
         getval = lambda v: v
-        values = [f[field] for f in self]
+        values = list(self.column(field))
 
         def getmissing(v):
             """Sets valid values to none so that only missing values are counted in stats"""
@@ -875,8 +1531,10 @@ class VectorData:
         printfields = ["", "frequency", "percent"]
         printrows = []
 
-        for uniq in sorted(set(values)):
-            freq = values.count(uniq)
+        from collections import Counter
+        counts = Counter(values)
+        for uniq in sorted(counts.keys()):
+            freq = counts[uniq]
             perc = freq / float(len(self)) * 100
             perc = "%.2f%%" % perc
             printrow = [uniq, freq, perc]
@@ -904,7 +1562,7 @@ class VectorData:
         """
         import pyagg
         from . import classypie
-        values = [f[field] for f in self]
+        values = list(self.column(field))
 
         bars = []
         for (_min,_max),group in classypie.split(values, breaks="equal", classes=bins):
@@ -929,10 +1587,35 @@ class VectorData:
             if func(feat):
                 yield feat
 
-    def group(self, key):
-        """Iterates over keyvalue-group pairs based on key"""
-        for uid,feats in itertools.groupby(sorted(self, key=key), key=key):
-            yield uid, list(feats)
+    def group(self, key, sort=False, maxgroups=None):
+        """Iterates over keyvalue-group pairs based on key, which can be a field name or a function that takes a Feature.
+
+        By default the groups are found by hashing the key values in a single pass, and are yielded in the order they were first seen. 
+        Beyond maxgroups number of groups (defaults to GROUPBY_MAX_GROUPS), the ids of the grouped features are spilled to disk so 
+        that memory use stays bounded. If sort is True, the groups are instead yielded in sorted order of their key values. 
+        For datasets with sqlite storage, sorted grouping by a field name is done by the database without loading all features.
+        """
+        if isinstance(key, basestring):
+            fieldindex = self.field_index(key)
+            if sort and self._storage is not None and hasattr(self._storage, "ordered_ids"):
+                ids = (id for id in self._storage.ordered_ids(fieldindex) if id in self.features)
+                feats = (self[id] for id in ids)
+                keyfunc = lambda f: f.row[fieldindex]
+                for uid,group in itertools.groupby(feats, key=keyfunc):
+                    yield uid, list(group)
+                return
+            key = lambda f: f.row[fieldindex]
+        if sort:
+            for uid,feats in itertools.groupby(sorted(self, key=key), key=key):
+                yield uid, list(feats)
+        else:
+            from . import sql
+            if maxgroups is None:
+                maxgroups = GROUPBY_MAX_GROUPS
+            # group the feature ids rather than the features, so they can be spilled to disk
+            idkey = lambda id: key(self[id])
+            for uid,ids in sql.hash_groupby(iter(self.features), idkey, maxgroups=maxgroups):
+                yield uid, [self[id] for id in ids]
 
     ### OTHER ###
 
@@ -940,16 +1623,16 @@ class VectorData:
         """Returns new filtered VectorData instance. 
         Func takes a Feature instance as input and keeps only those where it returns True.
         """
-        new = VectorData()
-        new.fields = [field for field in self.fields]
+        new = VectorData(fields=[field for field in self.fields], storage=self._storage_option)
         
         for feat in self:
             if func(feat):
                 new.add_feature(feat.row, feat.geometry)
 
+        new.commit()
         return new
 
-    def aggregate(self, key, geomfunc=None, fieldmapping=[]):
+    def aggregate(self, key, geomfunc=None, fieldmapping=[], sort=False):
         """Aggregate values and geometries within key groupings.
         
         Arguments:
@@ -962,8 +1645,10 @@ class VectorData:
                 of a new or existing field to write, valuefield is the field name or function that retrieves the value
                 to calculate statistics on, and stat is the name of the statistic to calculate or a function that takes
                 the list of values from the group as defined by valuefield. 
-                Valid stat values include: 
-                - fdsf...
+                Valid stat values include count, sum, mean, min, max, var, stdev, majority, minority, first, last, distinct, 
+                and concat. See `vector.sql.accumulator` for details. 
+            sort (optional): If True, the output groups are sorted by their key values, otherwise they are in the order 
+                they were first seen (default). See group(). 
         """
         # TODO: Move to manager...?
         out = VectorData()
@@ -976,13 +1661,13 @@ class VectorData:
         
         out.fields = [fieldname for fieldname,_,_ in fieldmapping]
 
-        if not geomfunc:
-            geomfunc = lambda fs: None
-
         from . import sql
         
-        for feats in sql.groupby(self, key=key):
-            row,geom = sql.aggreg(feats, aggregfuncs=fieldmapping, geomfunc=geomfunc)
+        for _,feats in self.group(key, sort=sort):
+            if geomfunc:
+                row,geom = sql.aggreg(feats, aggregfuncs=fieldmapping, geomfunc=geomfunc)
+            else:
+                row,geom = sql.aggreg(feats, aggregfuncs=fieldmapping), None
             out.add_feature(row=row, geometry=geom)
 
         return out
@@ -1014,10 +1699,14 @@ class VectorData:
         
         return out
 
-    def join(self, other, key, fieldmapping=[], collapse=False, keepall=True):
+    def join(self, other, key, fieldmapping=[], collapse=False, keepall=True, presorted=False):
         """Matches and joins the features in this dataset with the features in another dataset.
         Returns a new joined dataset.
 
+        By default, a hash table is built from the keys of the smaller of the two datasets, and the features of this dataset
+        are streamed through it, so keys only need to be hashable. If both datasets are already sorted by the key, 
+        presorted=True instead joins them in a single merge pass over both. 
+
         Note: if the other dataset has fields with the same name as the main dataset, those will not be joined, keeping
             only the ones in the main dataset. 
         
@@ -1031,12 +1720,14 @@ class VectorData:
             collapse (optional): If True, collapses and aggregates all matching features in the other dataset (default), otherwise
                 adds a new row for each matching pair. 
             fieldmapping (optional): If collapse is True, this determines the aggregation rules. See aggregate(). 
+                Each group of matching features is only aggregated once, the first time a feature in this dataset matches it. 
             keepall (optional): If True, keeps all features in the main dataset regardless (default), otherwise only keeps the 
                 ones that match.
+            presorted (optional): If True, both datasets must be sorted by the key in ascending order, and are merge joined. 
         """
         # TODO: enable multiple join conditions in descending priority, ie key can be a list of keys, so looks for a match using the first key, then the second, etc, until a match is found.
         # TODO: Move to manager...?
-        out = VectorData()
+        out = VectorData(storage=self._storage_option)
         out.fields = list(self.fields)
         out.fields += (field for field in other.fields if field not in self.fields)
 
@@ -1044,19 +1735,29 @@ class VectorData:
 
         from . import sql
 
+        # key functions for each dataset, using the field positions of each
         if isinstance(key, (list,tuple)):
-            keyfunc = lambda f: tuple([f[k] for k in key])
+            idx1 = [self.field_index(k) for k in key]
+            idx2 = [other.field_index(k) for k in key]
+            key1 = lambda f: tuple([f[i] for i in idx1])
+            key2 = lambda f: tuple([f[i] for i in idx2])
         elif hasattr(key,"__call__"):
-            keyfunc = key
+            key1 = key2 = key
         else:
-            keyfunc = lambda f: f[key]
-            
-        key1 = key2 = keyfunc
+            i1,i2 = self.field_index(key),other.field_index(key)
+            key1 = lambda f: f[i1]
+            key2 = lambda f: f[i2]
+
+        # stream the pairs of each feature and its matching features
+        if presorted:
+            pairs = sql.merge_join(self, other, key1, key2, keepall=keepall)
+        else:
+            pairs = sql.hash_join(self, other, key1, key2, keepall=keepall, buildleft=len(self) < len(other))
 
         if collapse:
             out.fields += (fieldtup[0] for fieldtup in fieldmapping if fieldtup[0] not in out.fields)
             fieldmapping_default = [(field,lambda f,field=field:f[field],"first") for field in other.fields if field not in self.fields]
-            fs,vfs,afs = zip(*fieldmapping) or [[],[],[]]
+            fs = [fieldtup[0] for fieldtup in fieldmapping]
             
             def getfm(item):
                 if item[0] in fs:
@@ -1066,51 +1767,34 @@ class VectorData:
             fieldmapping_old = fieldmapping
             fieldmapping = [getfm(item) for item in fieldmapping_default]
             fieldmapping += (item for item in fieldmapping_old if item[0] not in self.fields and item[0] not in other.fields)
-            print(fieldmapping)
-
-            def grouppairs(data1, key1, data2, key2):
-                "aggregates"
-                # create hash table
-                # inspired by http://rosettacode.org/wiki/Hash_join#Python
-                hsh = dict()
-                for keyval,f2s in itertools.groupby(sorted(data2,key=key2), key=key2):
-                    aggval = sql.aggreg(f2s, aggregfuncs=fieldmapping)
-                    hsh[keyval] = aggval
-                # iterate join
-                for f1 in data1:
+
+            # aggregate each group of matches when first probed
+            aggregated = dict()
+            for f1,f2s in pairs:
+                if f2s:
                     keyval = key1(f1)
-                    if keyval in hsh:
-                        f2row = hsh[keyval]
-                        yield f1,f2row
-                    elif keepall:
-                        f2row = (None for f in fieldmapping)
-                        yield f1,f2row
+                    f2row = aggregated.get(keyval)
+                    if f2row is None:
+                        f2row = aggregated[keyval] = sql.aggreg(f2s, aggregfuncs=fieldmapping)
+                else:
+                    f2row = [None for f in fieldmapping]
+                row = list(f1.row)
+                row += f2row
+                out.add_feature(row=row, geometry=f1.geometry)
 
         else:
-            def grouppairs(data1, key1, data2, key2):
-                "pairwise"
-                # create hash table
-                # inspired by http://rosettacode.org/wiki/Hash_join#Python
-                hsh = dict()
-                for keyval,f2s in itertools.groupby(sorted(data2,key=key2), key=key2):
-                    hsh[keyval] = list(f2s)
-                # iterate join
-                for f1 in data1:
-                    keyval = key1(f1)
-                    if keyval in hsh:
-                        f2s = hsh[keyval]
-                        for f2row in f2s:
-                            yield f1,[f2row[i] for i in otheridx]
-                    elif keepall:
-                        f2row = [None for i in otheridx]
-                        yield f1,f2row
-
-        for pair in grouppairs(self, key1, other, key2):
-            f1,f2row = pair
-            row = list(f1.row)
-            row += f2row
-            out.add_feature(row=row, geometry=f1.geometry)
+            for f1,f2s in pairs:
+                if f2s:
+                    for f2 in f2s:
+                        row = list(f1.row)
+                        row += (f2[i] for i in otheridx)
+                        out.add_feature(row=row, geometry=f1.geometry)
+                else:
+                    row = list(f1.row)
+                    row += (None for i in otheridx)
+                    out.add_feature(row=row, geometry=f1.geometry)
 
+        out.commit()
         return out
     
 
@@ -1186,14 +1870,74 @@ class VectorData:
 
     ###### SPATIAL INDEXING #######
 
-    def create_spatial_index(self, type=None, backend=None, **kwargs):
+    def create_spatial_index(self, type=None, backend=None, persist=None, **kwargs):
         """Creates spatial index to allow quick overlap search methods.
-        If features are changed, added, or dropped, the index must be created again.
+        The index is kept up to date as features are added with add_feature(), set or dropped with data[id] = feature 
+        or del data[id], and as feature geometries are set or transformed. If a geometry dictionary is changed in-place,
+        its feature's cached bbox must be reset with feature._cached_bbox = None for the index to be updated. 
+
+        For datasets loaded from a file and when persist is True, a previously saved sidecar index file (the source 
+        filepath + ".pgi") is loaded instead of building the index, as long as the source file has not been modified 
+        since, the dataset was loaded with the same options and has the same number of features, and none of its 
+        features have been added, deleted or edited since loading. 
+
+        Args:
+            type (optional): Either 'rtree', 'quadtree', or 'grid', defaults to DEFAULT_SPATIAL_INDEX. 
+                The 'grid' index only works for point data, but is faster for it and can answer many bbox and distance 
+                queries at once with spindex.intersects_many() and spindex.within_distance_many(). 
+            backend (optional): The implementation to use for the index type. For 'rtree' this is either 'rtree' (libspatialindex),
+                'pyrtree', or 'packed' for a dependency-free STR bulk loaded R-tree stored in numpy arrays. 
+                For 'quadtree' only 'pyqtree' is available, and for 'grid' only 'grid' (numpy). 
+            persist (optional): If True, loads the sidecar index file if up to date, or else saves the newly built index 
+                to a sidecar file next to the source file, so that it can be reused the next time the file is loaded. 
+                Defaults to PERSIST_SPATIAL_INDEX. Not possible for datasets loaded with function arguments such as select. 
+                The 'rtree' (libspatialindex) backend can't be saved. 
+            **kwargs: Options passed on to the backend. 
         """
+        # storage that maintains its own spatial index
+        if type is None and self._storage is not None and hasattr(self._storage, "spatial_index"):
+            self.spindex = self._storage.spatial_index()
+            return
+
+        if persist is None:
+            persist = PERSIST_SPATIAL_INDEX
+
+        # reuse the sidecar index file if up to date
+        # (after in-memory edits the index no longer matches the source file)
+        indexpath = None
+        if persist and self._source and any((hasattr(v, "__call__") for v in self._source[1].values())):
+            # the repr of functions differs each time, so the index would never be found again
+            warnings.warn("Spatial indexes of datasets loaded with function arguments such as select or geokey can't be persisted")
+        elif persist and self._source and not self._modified and os.path.exists(self._source[0]):
+            sourcepath,options = self._source
+            indexpath = spindex.index_path(sourcepath)
+            indexkey = spindex.index_key(sourcepath, len(self), options)
+            try:
+                index = spindex.load_index(indexpath, indexkey, type, backend)
+            except Exception as err:
+                warnings.warn("Could not load the spatial index file {}: {}".format(indexpath, err))
+                index = None
+            if index is not None:
+                self.spindex = index
+                return
+
+        self._build_spatial_index(type, backend, **kwargs)
+
+        # save to sidecar file
+        if indexpath and hasattr(self, 'spindex'):
+            try:
+                spindex.save_index(self.spindex, indexpath, indexkey)
+            except Exception as err:
+                if os.path.exists(indexpath):
+                    os.remove(indexpath)
+                warnings.warn("Could not save the spatial index file {}: {}".format(indexpath, err))
+
+    def _build_spatial_index(self, type=None, backend=None, **kwargs):
         # if no preference, try the default
         if type is None:
             try:
-                self.create_spatial_index(type=DEFAULT_SPATIAL_INDEX, **kwargs)
+                self._build_spatial_index(type=DEFAULT_SPATIAL_INDEX, backend=backend, **kwargs)
+                return
             except ImportError:
                 pass
 
@@ -1204,6 +1948,8 @@ class VectorData:
                     self.spindex = spindex.Rtree(backend=backend, **kwargs)
                 elif type == 'quadtree':
                     self.spindex = spindex.QuadTree(backend=backend, bbox=self.bbox, **kwargs)
+                elif type == 'grid':
+                    self.spindex = spindex.GridIndex(backend=backend, **kwargs)
                 else:
                     raise Exception('No such spatial index type: {}'.format(type))
             except ImportError:
@@ -1222,11 +1968,9 @@ class VectorData:
                 except ImportError:
                     pass
             
-        # populate the spindex
+        # populate the spindex, all at once for backends that bulk load
         if hasattr(self, 'spindex'):
-            for feat in self:
-                if feat.geometry:
-                    self.spindex.insert(feat.id, feat.bbox)
+            self.spindex.load(self._iter_bboxes())
    
     def quick_overlap(self, bbox):
         """
@@ -1242,6 +1986,56 @@ class VectorData:
         overlaps = self.spindex.intersects(bbox)
         return (self[id] for id in overlaps)
 
+    def quick_overlap_many(self, bboxes):
+        """
+        Quickly get the features whose bbox overlap each of the specified bboxes via the spatial index, 
+        answering all the queries at once instead of one at a time. Mainly useful for joining one dataset 
+        with another, where the bboxes are those of all the features of the other dataset. 
+
+        Args:
+            bboxes: Sequence of xmin,ymin,xmax,ymax bboxes, where None is allowed for features without geometry. 
+
+        Returns:
+            A list with the list of overlapping features for each bbox, in the same order as the bboxes. 
+        """
+        if not hasattr(self, "spindex"):
+            raise Exception("You need to create the spatial index before you can use this method")
+        # ensure min,min,max,max pattern, and skip missing bboxes
+        bboxes = list(bboxes)
+        positions = []
+        queries = []
+        for i,bbox in enumerate(bboxes):
+            if bbox is not None:
+                xs = bbox[0],bbox[2]
+                ys = bbox[1],bbox[3]
+                positions.append(i)
+                queries.append([min(xs),min(ys),max(xs),max(ys)])
+        results = [[] for _ in bboxes]
+        for i,ids in zip(positions, self.spindex.intersects_many(queries)):
+            results[i] = [self[id] for id in ids]
+        return results
+
+    def quick_overlap_iter(self, bboxes, batchsize=None):
+        """
+        Same as quick_overlap_many(), but yields the list of overlapping features of each bbox as they are needed, 
+        querying the spatial index for batchsize bboxes at a time, so that only the results of one batch are held 
+        in memory at once. 
+
+        Args:
+            bboxes: Iterable of xmin,ymin,xmax,ymax bboxes, where None is allowed for features without geometry. 
+            batchsize (optional): Number of bboxes to query at a time, defaults to sql.JOIN_BATCHSIZE. 
+        """
+        if batchsize is None:
+            from . import sql
+            batchsize = sql.JOIN_BATCHSIZE
+        bboxes = iter(bboxes)
+        while True:
+            batch = list(itertools.islice(bboxes, batchsize))
+            if not batch:
+                break
+            for feats in self.quick_overlap_many(batch):
+                yield feats
+
     def quick_disjoint(self, bbox):
         """
         Quickly get features whose bbox do -not- overlap the specified bbox via the spatial index.
@@ -1253,80 +2047,113 @@ class VectorData:
         ys = bbox[1],bbox[3]
         bbox = [min(xs),min(ys),max(xs),max(ys)]
         # return generator over results
-        overlaps = set((id for id in self.spindex.intersection(bbox)))
+        overlaps = set((id for id in self.spindex.intersects(bbox)))
         allids = set(self.features.keys())
         disjoint = allids.difference(overlaps)
         return (self[id] for id in disjoint)
 
-    def quick_nearest(self, bbox, n=None, radius=None):
+    def quick_nearest(self, bbox=None, n=None, radius=None, geometry=None):
         """
-        Quickly get n features whose bbox are nearest the specified bbox via the spatial index.
+        Quickly get the n features whose bbox are nearest the specified bbox via the spatial index,
+        in order of increasing distance. 
 
-        TODO: radius option not yet implemented. 
+        Args:
+            bbox (optional): The xmin,ymin,xmax,ymax bbox to search from. Can be omitted if geometry is given. 
+            n (optional): Max number of features to return, defaults to all. 
+            radius (optional): Only return features within this distance. 
+            geometry (optional): GeoJSON dict or shapely geometry to search from. If given, the features are ordered
+                and limited by their exact geometry distance instead of their bbox distance. Since the bbox distance
+                is never larger than the exact distance, candidates are refined lazily, and only until
+                the nearest remaining bbox is farther away than the features found so far. 
         """
-        # TODO: special handling if points data, might be faster to just test all.
-        # ...
-        
         if not hasattr(self, "spindex"):
             raise Exception("You need to create the spatial index before you can use this method")
 
-        if radius != None:
-            raise NotImplementedError("Spatial index nearest with radius option not yet implemented")
+        if geometry is not None:
+            if isinstance(geometry, dict):
+                geometry = geojson2shapely(geometry)
+            if bbox is None:
+                bbox = geometry.bounds
+        elif bbox is None:
+            raise Exception("Either bbox or geometry must be given")
         
         # ensure min,min,max,max pattern
         xs = bbox[0],bbox[2]
         ys = bbox[1],bbox[3]
         bbox = [min(xs),min(ys),max(xs),max(ys)]
-        # return generator over results
-        if not n:
-            n = len(self)
 
-        for id in self.spindex.nearest(bbox, num_results=n): # radius not yet respected
+        if geometry is None:
+            # return generator over results
+            for id in self.spindex.nearest(bbox, num_results=n, radius=radius):
+                yield self[id]
+            return
+
+        # refine by exact distance
+        # candidates arrive in order of bbox distance, which is the lowest possible exact distance,
+        # so a feature can be yielded once no remaining candidate can be any closer
+        import heapq
+        found = 0
+        queue = []
+        for id in self.spindex.nearest(bbox, num_results=None, radius=radius):
             feat = self[id]
-            yield feat
-           
-##        if radius:
-##            window = shapely.geometry.box(*bbox)
-##            for id in self.spindex.nearest(bbox, num_results=n):
-##                feat = self[id]
-##                # bboxes are sorted by distance, so only yield while bbox is inside of radius
-##                if window.distance(shapely.geometry.box(*feat.bbox)) <= radius:
-##                    yield feat
-##                else:
-##                    break
-##        else:
-##            # TODO: if wanting to find x nearest regardless of distance, then we must sort by max bbox distance,
-##            # then group by continuous intersectioning ones, and return from each group until n reached
-##            box = shapely.geometry.box(*bbox)
-##            def maxdist(otherfeat):
-##                "get highest distance to any of the corners of bbox"
-##                return max((box.distance(shapely.geometry.Point(*p)) for p in shapely.geometry.box(*otherfeat.bbox).coordinates))
-##            feats = (self[id] for id in self.spindex.nearest(bbox, num_results=n))
-##            sortfeats = (f for f in sorted(feats, key=maxdist))
-##            i = 0
-##            def grouped():
-##                groupid = 0
-##                prevfeat = None
-##                for feat in sortfeats:
-##                    if fsd:
-##                        fdsf
-##            for key,subfeats in sorted(sortfeats):
-##                yield self[id]
+            lowest = spindex.bbox_distance(bbox, feat.bbox)
+            while queue and queue[0][0] <= lowest:
+                yield heapq.heappop(queue)[2]
+                found += 1
+                if n and found >= n:
+                    return
+            dist = geometry.distance(feat.get_shapely())
+            if radius is None or dist <= radius:
+                heapq.heappush(queue, (dist, id, feat))
+        while queue:
+            yield heapq.heappop(queue)[2]
+            found += 1
+            if n and found >= n:
+                return
         
     ###### GENERAL #######
 
     def save(self, savepath, **kwargs):
         fields = self.fields
-        rowgeoms = ((feat.row,feat.geometry) for feat in self)
-        rows, geometries = zip(*rowgeoms)
+        if savepath.lower().endswith(".pgc"):
+            # write the columnar storage directly if possible
+            from .fileformats import columnar
+            from .storage import ColumnarStorage
+            if (isinstance(self._storage, ColumnarStorage) and self.features._sequential 
+                and len(self.features) == len(self._storage)):
+                storage = self._storage
+            else:
+                storage = columnar.build_storage(fields, (feat.row for feat in self), (feat.geometry for feat in self))
+            columnar.write(savepath, fields, storage, crs=self.crs.to_proj4(), type=self.type, meta=kwargs.get("meta"))
+            return
+        if self._storage is not None:
+            # dont load all rows and geometries into memory at once, but read them straight from the storage
+            storage,ids = self._storage,self.features._order
+            rows = _Restartable(lambda: storage.iter_rows(ids))
+            geometries = _Restartable(lambda: storage.iter_geometries(ids))
+        else:
+            rowgeoms = ((list(feat.row),feat.geometry) for feat in self)
+            rows, geometries = zip(*rowgeoms)
         saver.to_file(fields, rows, geometries, savepath, **kwargs)
 
+    def commit(self):
+        """For datasets with on-disk storage, writes all changes to disk, along with the
+        fields, type, and crs of the dataset. Does nothing otherwise.
+        """
+        if self._storage is not None and hasattr(self._storage, "commit"):
+            self._storage.commit(fields=self.fields, type=self.type, crs=self.crs.to_proj4())
+
     def copy(self):
         new = VectorData()
         new.type = self.type
         new.fields = [field for field in self.fields]
-        featureobjs = (Feature(new, feat.row, feat.geometry) for feat in self )
-        new.features = OrderedDict([ (feat.id,feat) for feat in featureobjs ])
+        if self._storage is not None:
+            new._storage = self._storage.copy()
+            new._storage_option = self._storage_option
+            new.features = self.features.copy(new)
+        else:
+            featureobjs = (Feature(new, feat.row, feat.geometry) for feat in self )
+            new.features = OrderedDict([ (feat.id,feat) for feat in featureobjs ])
         #if hasattr(self, "spindex"): new.spindex = self.spindex.copy() # NO SUCH METHOD
         new.crs = pycrs.parse.from_proj4(self.crs.to_proj4()) # separate copy
         return new
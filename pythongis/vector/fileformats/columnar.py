@@ -0,0 +1,216 @@
+"""
+Native binary columnar file format (.pgc) for fast saving and reloading of parsed vector datasets.
+
+The file holds the same typed column arrays and packed coordinate and offset arrays as the
+`vector.storage.ColumnarStorage`, so that loading a file is simply a matter of memory-mapping
+the arrays instead of parsing anything.
+
+Layout:
+    - 4 bytes: the magic string "PGC1"
+    - 8 bytes: little-endian length of the header
+    - header: utf8 encoded JSON describing the dataset and the position of each data block
+    - data blocks: the raw bytes of each array, each block aligned to 8 bytes
+
+Int and float columns are stored as raw arrays. Text columns are stored as utf8 encoded bytes along with
+an array of offsets, and mixed columns as JSON, where values of other types are stored as text. These two
+are decoded when loading, while all other arrays are memory-mapped.
+"""
+
+# import builtins
+import os
+import sys
+import json
+import mmap
+import struct
+from array import array
+
+# import internal modules
+from ..storage import ColumnarStorage, GEOMETRY_ARRAYS, _typecode
+
+
+MAGIC = b"PGC1"
+
+
+
+def _align(n):
+    return n + (-n % 8)
+
+def _column_blocks(col):
+    # returns the header entry and the list of raw data of a column
+    if col is None:
+        col = []
+    if not isinstance(col, list):
+        return dict(kind="array", typecode=_typecode(col)), [col]
+    elif all((isinstance(v, str) for v in col)):
+        encoded = [v.encode("utf8") for v in col]
+        offsets = array("q", [0])
+        pos = 0
+        for v in encoded:
+            pos += len(v)
+            offsets.append(pos)
+        return dict(kind="str"), [offsets, b"".join(encoded)]
+    else:
+        return dict(kind="json"), [json.dumps(col, default=str).encode("utf8")]
+
+def _nbytes(data):
+    if isinstance(data, array):
+        return len(data) * data.itemsize
+    elif isinstance(data, memoryview):
+        return data.nbytes
+    else:
+        return len(data)
+
+def write(filepath, fields, storage, crs=None, type=None, meta=None):
+    """Writes the fields and ColumnarStorage of a dataset to a binary columnar file.
+    The rows are written in storage order.
+
+    Args:
+        filepath: Filepath to write to.
+        fields: List of field names.
+        storage: ColumnarStorage instance holding the rows and geometries.
+        crs (optional): Crs of the dataset, as a proj4 string.
+        type (optional): Geometry type of the dataset.
+        meta (optional): Dictionary of any additional JSON serializable metadata to store in the header.
+    """
+    blocks = []
+    def add_blocks(datas):
+        # returns the positions of the given data blocks, relative to the start of the data section
+        positions = []
+        for data in datas:
+            offset = sum((_align(_nbytes(b)) for b in blocks))
+            blocks.append(data)
+            positions.append([offset, _nbytes(data)])
+        return positions
+
+    columns = []
+    for col in storage.columns:
+        entry,datas = _column_blocks(col)
+        entry["blocks"] = add_blocks(datas)
+        columns.append(entry)
+
+    geometry = dict()
+    for name in GEOMETRY_ARRAYS:
+        arr = getattr(storage, name)
+        geometry[name] = dict(typecode=_typecode(arr), blocks=add_blocks([arr]))
+
+    header = dict(version=1,
+                  byteorder=sys.byteorder,
+                  fields=list(fields),
+                  crs=crs,
+                  type=type,
+                  length=len(storage),
+                  columns=columns,
+                  geometry=geometry,
+                  meta=meta or dict())
+    header = json.dumps(header).encode("utf8")
+    datastart = _align(len(MAGIC) + 8 + len(header))
+
+    with open(filepath, "wb") as fileobj:
+        fileobj.write(MAGIC)
+        fileobj.write(struct.pack("<Q", len(header)))
+        fileobj.write(header)
+        fileobj.write(b"\x00" * (datastart - fileobj.tell()))
+        for data in blocks:
+            fileobj.write(data)
+            fileobj.write(b"\x00" * (-_nbytes(data) % 8))
+
+def read_header(filepath):
+    """Reads and returns the header dictionary of a binary columnar file."""
+    with open(filepath, "rb") as fileobj:
+        if fileobj.read(len(MAGIC)) != MAGIC:
+            raise Exception("Not a valid binary columnar file: {}".format(filepath))
+        size, = struct.unpack("<Q", fileobj.read(8))
+        header = json.loads(fileobj.read(size).decode("utf8"))
+    header["datastart"] = _align(len(MAGIC) + 8 + size)
+    return header
+
+def read(filepath):
+    """Memory-maps a binary columnar file, and returns its header dictionary and a ColumnarStorage instance
+    whose arrays are views into the mapped file. The mapping is copy-on-write, so changing the values of the
+    storage never changes the file.
+    """
+    header = read_header(filepath)
+    start = header["datastart"]
+    swap = header["byteorder"] != sys.byteorder
+
+    with open(filepath, "rb") as fileobj:
+        mapped = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_COPY)
+    buf = memoryview(mapped)
+
+    def getblock(position):
+        offset,nbytes = position
+        return buf[start+offset : start+offset+nbytes]
+
+    def getarray(position, typecode):
+        block = getblock(position)
+        if swap:
+            # written on a machine with different byteorder, so must be copied and converted
+            arr = array(typecode)
+            arr.frombytes(block)
+            arr.byteswap()
+            return arr
+        return block.cast(typecode)
+
+    storage = ColumnarStorage(len(header["fields"]))
+    columns = []
+    for entry in header["columns"]:
+        if entry["kind"] == "array":
+            columns.append(getarray(entry["blocks"][0], entry["typecode"]))
+        elif entry["kind"] == "str":
+            offsets = getarray(entry["blocks"][0], "q")
+            text = getblock(entry["blocks"][1]).tobytes()
+            columns.append([text[offsets[i]:offsets[i+1]].decode("utf8") for i in range(len(offsets)-1)])
+        elif entry["kind"] == "json":
+            columns.append(json.loads(getblock(entry["blocks"][0]).tobytes().decode("utf8")))
+    storage.columns = columns
+
+    for name in GEOMETRY_ARRAYS:
+        entry = header["geometry"][name]
+        setattr(storage, name, getarray(entry["blocks"][0], entry["typecode"]))
+    storage._length = header["length"]
+    storage._mapped = not swap
+
+    return header, storage
+
+def iter_file(filepath):
+    """Returns the fields, a generator of row-geometry pairs, and the crs of a binary columnar file."""
+    header,storage = read(filepath)
+    rowgeoms = ((storage.get_values(i), storage.get_geometry(i)) for i in range(len(storage)))
+    return header["fields"], rowgeoms, header["crs"]
+
+def build_storage(fields, rows, geometries):
+    """Returns a new ColumnarStorage populated with the given rows and geometries."""
+    storage = ColumnarStorage(len(fields))
+    for row,geom in zip(rows, geometries):
+        storage.append(list(row), geom)
+    return storage
+
+# sidecar cache
+
+def cache_path(filepath):
+    """Returns the filepath of the sidecar cache file for a source file."""
+    return filepath + ".pgc"
+
+def cache_key(filepath, options):
+    """Returns the key that identifies a cached version of a source file, based on its path, modification time and size,
+    and the options it was loaded with.
+    """
+    stat = os.stat(filepath)
+    key = dict(source=os.path.abspath(filepath),
+               mtime=stat.st_mtime,
+               size=stat.st_size,
+               options=sorted(((k,repr(v)) for k,v in options.items())))
+    # same form as when read back from json
+    return json.loads(json.dumps(key))
+
+def valid_cache(filepath, options):
+    """Returns the filepath of the sidecar cache file for a source file if it exists and is up to date, otherwise None."""
+    cachepath = cache_path(filepath)
+    if os.path.exists(cachepath):
+        try:
+            header = read_header(cachepath)
+        except Exception:
+            return None
+        if header["meta"].get("cache") == cache_key(filepath, options):
+            return cachepath
+    return None
@@ -0,0 +1,212 @@
+"""
+Incremental reading and writing of GeoJSON and newline-delimited GeoJSON (GeoJSONSeq) files,
+one feature at a time, so that files of any size can be processed in constant memory.
+
+GeoJSON FeatureCollection files are read by decoding each feature object of the "features" array as soon
+as it has been read into a small buffer, without ever decoding the whole document. GeoJSONSeq files hold
+one feature per line, optionally preceded by the ASCII record separator character as in RFC 8142.
+"""
+
+# import builtins
+import io
+import json
+import math
+
+
+
+RS = u"\x1e"
+
+CHUNKSIZE = 1024 * 1024
+
+SEQ_EXTENSIONS = (".geojsonl", ".geojsons", ".geojsonseq")
+
+def is_seq(filepath):
+    """Whether the filepath extension denotes newline-delimited GeoJSON."""
+    return filepath.lower().endswith(SEQ_EXTENSIONS)
+
+
+
+
+# reading
+
+class _Scanner(object):
+    # reads and decodes json values one at a time from a buffered text file
+    def __init__(self, fileobj, chunksize=CHUNKSIZE):
+        self.fileobj = fileobj
+        self.chunksize = chunksize
+        self.decoder = json.JSONDecoder()
+        self.buf = u""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size):
+        # reads more data into the buffer, dropping what has already been consumed
+        data = self.fileobj.read(size)
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+
+    def peek(self):
+        # returns the next non-whitespace character without consuming it, or None at end of file
+        while True:
+            buf,pos = self.buf,self.pos
+            while pos < len(buf) and buf[pos] in u" \t\n\r":
+                pos += 1
+            self.pos = pos
+            if pos < len(buf):
+                return buf[pos]
+            if self.eof:
+                return None
+            self._fill(self.chunksize)
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise Exception("Invalid GeoJSON: expected {} at position {}".format(repr(char), self.pos))
+        self.pos += 1
+
+    def value(self):
+        # decodes the next json value, reading more data until the whole value is in the buffer
+        self.peek()
+        size = self.chunksize
+        while True:
+            try:
+                value,end = self.decoder.raw_decode(self.buf, self.pos)
+                # numbers may continue beyond the end of the buffer
+                if end < len(self.buf) or self.eof or not isinstance(value, (int,float)):
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            # incomplete, read more and try again
+            self._fill(size)
+            size *= 2
+
+def _iter_collection(fileobj, header):
+    # yields the features of a geojson document, and fills the header dict with all other top-level members
+    scanner = _Scanner(fileobj)
+    scanner.expect(u"{")
+    while scanner.peek() not in (u"}", None):
+        key = scanner.value()
+        scanner.expect(u":")
+        if key == "features":
+            scanner.expect(u"[")
+            while scanner.peek() != u"]":
+                yield scanner.value()
+                if scanner.peek() == u",":
+                    scanner.expect(u",")
+            scanner.expect(u"]")
+        else:
+            header[key] = scanner.value()
+        if scanner.peek() == u",":
+            scanner.expect(u",")
+
+    # not a feature collection, but a single feature or geometry
+    if header.get("type") == "Feature":
+        yield header
+    elif header.get("type") not in (None, "FeatureCollection"):
+        yield {"type": "Feature", "properties": {}, "geometry": header}
+
+def _iter_seq(fileobj):
+    # yields the features of a newline-delimited geojson file
+    for line in fileobj:
+        line = line.strip().lstrip(RS)
+        if line:
+            yield json.loads(line)
+
+def iter_features(filepath, encoding="utf8", encoding_errors="strict", header=None):
+    """Yields the GeoJSON feature dictionaries of a GeoJSON or GeoJSONSeq file one at a time.
+
+    Args:
+        filepath: Filepath of the file to read.
+        encoding (optional): Text encoding of the file.
+        encoding_errors (optional): How to handle text that can't be decoded.
+        header (optional): Dictionary to be filled with any other top-level members of a GeoJSON file, such as crs.
+            Only complete once the features have been read.
+    """
+    if header is None:
+        header = dict()
+    with io.open(filepath, "r", encoding=encoding, errors=encoding_errors) as fileobj:
+        if is_seq(filepath):
+            features = _iter_seq(fileobj)
+        else:
+            features = _iter_collection(fileobj, header)
+        for feat in features:
+            yield feat
+
+def read_fields(filepath, encoding="utf8", encoding_errors="strict"):
+    """Reads through the file and returns the list of all property names, in order of first appearance,
+    along with the crs member of the file if any.
+    """
+    fields = []
+    seen = set()
+    header = dict()
+    for feat in iter_features(filepath, encoding, encoding_errors, header=header):
+        for field in (feat.get("properties") or {}):
+            if field not in seen:
+                seen.add(field)
+                fields.append(field)
+    return fields, header.get("crs")
+
+
+
+
+# writing
+
+def _json_value(value):
+    # ensures the value can be written as json
+    if value is None or isinstance(value, (bool,int,str)):
+        return value
+    elif isinstance(value, float):
+        if math.isnan(value) or math.isinf(value):
+            return None
+        return value
+    else:
+        return str(value)
+
+class GeoJSONWriter(object):
+    """
+    Writes features one at a time to a GeoJSON or GeoJSONSeq file.
+    Must be closed when done, or used as a context manager.
+
+    Args:
+        filepath: Filepath to write to. Extensions of .geojsonl, .geojsons, or .geojsonseq write newline-delimited GeoJSON,
+            where .geojsons also prefixes each feature with the record separator character.
+        fields: List of field names.
+        encoding (optional): Text encoding of the file.
+    """
+    def __init__(self, filepath, fields, encoding="utf8"):
+        self.fields = fields
+        self.seq = is_seq(filepath)
+        self.prefix = RS if filepath.lower().endswith(".geojsons") else u""
+        self.fileobj = io.open(filepath, "w", encoding=encoding)
+        self.count = 0
+        if not self.seq:
+            self.fileobj.write(u'{"type": "FeatureCollection", "features": [\n')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, row, geometry):
+        """Writes a feature from a row list and a GeoJSON geometry or None."""
+        properties = dict(zip(self.fields, (_json_value(value) for value in row)))
+        if geometry:
+            geometry = dict(type=geometry["type"], coordinates=geometry["coordinates"])
+        feat = {"type": "Feature", "properties": properties, "geometry": geometry}
+        text = json.dumps(feat, ensure_ascii=False)
+        if self.seq:
+            self.fileobj.write(self.prefix + text + u"\n")
+        else:
+            if self.count:
+                self.fileobj.write(u",\n")
+            self.fileobj.write(text)
+        self.count += 1
+
+    def close(self):
+        if not self.seq:
+            self.fileobj.write(u"\n]}\n")
+        self.fileobj.close()
@@ -5,9 +5,11 @@ all into memory...
 
 # import builtins
 import os
+import io
 import csv
 import codecs
 import itertools
+import struct
 import warnings
 
 try:
@@ -17,16 +19,22 @@ except:
 
 # import fileformat modules
 import shapefile as pyshp
-import pygeoj
+
+# import internal modules
+from ._helpers import geojson_bbox, bbox_overlaps
 
 file_extensions = {".shp": "Shapefile",
                    ".json": "GeoJSON",
                    ".geojson": "GeoJSON",
+                   ".geojsonl": "GeoJSONSeq",
+                   ".geojsons": "GeoJSONSeq",
+                   ".geojsonseq": "GeoJSONSeq",
                    ".xls": "Excel 97",
                    ".xlsx": "Excel",
                    ".dta": "Stata",
                    ".csv": "CSV",
                    ".txt": "Text-Delimited",
+                   ".pgc": "Binary Columnar",
                    }
 
 def detect_filetype(filepath):
@@ -40,17 +48,207 @@ def detect_filetype(filepath):
 
 
 def from_file(filepath, encoding="utf8", encoding_errors="strict", crs=None, **kwargs):
+    """Loads the fields, rows, geometries, and crs of a file into memory.
+    See iter_file() for the arguments, including the select and bbox filters.
+    """
+    fields, rowgeoms, crs = iter_file(filepath, encoding=encoding, encoding_errors=encoding_errors, crs=crs, **kwargs)
+
+    # load to memory in lists
+    rows,geometries = [],[]
+    for row,geom in rowgeoms:
+        rows.append(row)
+        geometries.append(geom)
+
+    return fields, rows, geometries, crs
+
+# delimited text files
+
+DIALECT_ATTRIBUTES = ["delimiter", "doublequote", "escapechar", "lineterminator", "quotechar", "quoting", "skipinitialspace"]
+
+def _parse_cell(string):
+    # converts a text cell to a number if possible
+    try:
+        val = float(string.replace(",","."))
+        if val.is_integer():
+            val = int(val)
+        return val
+    except:
+        if string.upper() == "NULL":
+            return None
+        else:
+            return string
+
+def _parse_column(column):
+    # converts a column of text cells the same way as _parse_cell, 
+    # but tries to convert the entire column at once first, which is much faster
+    try:
+        return [int(cell) for cell in column]
+    except ValueError:
+        pass
+    try:
+        values = [float(cell) for cell in column]
+        return [int(val) if val.is_integer() else val for val in values]
+    except ValueError:
+        return [_parse_cell(cell) for cell in column]
+
+def _xy_geometry(row, xindex, yindex):
+    # creates a point geometry from the x and y values of a row
+    x,y = row[xindex],row[yindex]
+    try:
+        x,y = float(x),float(y)
+        geoj = {"type":"Point", "coordinates":(x,y)}
+    except:
+        try:
+            x,y = float(x.replace(",",".")),float(y.replace(",","."))
+            geoj = {"type":"Point", "coordinates":(x,y)}
+        except:
+            warnings.warn("Could not create point geometry from xfield and yfield values {x} and {y}".format(x=repr(x), y=repr(y)))
+            geoj = None
+    return geoj
+
+def _parse_delimited_chunk(args):
+    # parses a byte range of a delimited text file, returning the parsed rows and any xy geometries
+    # runs in a worker process, so must be a module level function
+    filepath,start,end,fmtparams,encoding,encoding_errors,xyindex = args
+    with open(filepath, "rb") as fileobj:
+        fileobj.seek(start)
+        text = fileobj.read(end - start).decode(encoding, errors=encoding_errors)
+    rows = list(csv.reader(io.StringIO(text, newline=""), **fmtparams))
+    if not rows:
+        return [], None
+
+    # parse column by column
+    widths = set((len(row) for row in rows))
+    if len(widths) == 1:
+        columns = [_parse_column(column) for column in zip(*rows)]
+        rows = [list(row) for row in zip(*columns)]
+    else:
+        # ragged rows
+        width = max(widths)
+        columns = [_parse_column([row[i] if i < len(row) else "" for row in rows]) for i in range(width)]
+        rows = [list(row[:len(rawrow)]) for row,rawrow in zip(zip(*columns), rows)]
+
+    if xyindex:
+        # only return the coordinates, which are much quicker to send back than geojson dictionaries
+        geoms = [_xy_geometry(row, *xyindex) for row in rows]
+        coords = [geom["coordinates"] if geom else None for geom in geoms]
+    else:
+        coords = None
+    return rows, coords
+
+def _read_delimited_parallel(filepath, fmtparams, workers, encoding="utf8", encoding_errors="strict", chunksize=None, **kwargs):
+    """Reads a delimited text file in parallel, by splitting it into chunks of lines that are parsed
+    in a pool of worker processes. Returns the fields and a generator of row-geometry pairs, in the same
+    order as in the file.
+
+    Since the file is split on line boundaries, quoted cells must not contain linebreaks.
+    The "skip", "last", "xfield", and "yfield" options are supported, the same as when reading
+    the file sequentially.
+    """
+    import multiprocessing
+
+    # skip lines and read the header
+    with open(filepath, "rb") as fileobj:
+        for _ in range(kwargs.get("skip", 0)):
+            fileobj.readline()
+        headerline = fileobj.readline().decode(encoding, errors=encoding_errors)
+        fields = [_parse_cell(cell) for cell in next(csv.reader([headerline], **fmtparams))]
+        start = fileobj.tell()
+
+        # find the chunk boundaries, adjusted to the start of the next line
+        filesize = os.path.getsize(filepath)
+        chunksize = chunksize or max((filesize - start) // (workers * 4), 1024*1024)
+        bounds = [start]
+        while bounds[-1] < filesize:
+            fileobj.seek(bounds[-1] + chunksize)
+            fileobj.readline()
+            bounds.append(min(fileobj.tell(), filesize))
+
+    xfield,yfield = kwargs.get("xfield"),kwargs.get("yfield")
+    xyindex = (fields.index(xfield),fields.index(yfield)) if xfield and yfield else None
+    tasks = [(filepath,chunkstart,chunkend,fmtparams,encoding,encoding_errors,xyindex) 
+             for chunkstart,chunkend in zip(bounds[:-1], bounds[1:])]
+
+    def rowgeoms():
+        pool = multiprocessing.Pool(workers)
+        try:
+            # imap returns the chunks in order, while later chunks are parsed in the background
+            for rows,coords in pool.imap(_parse_delimited_chunk, tasks):
+                if coords is None:
+                    for row in rows:
+                        yield row, None
+                else:
+                    for row,xy in zip(rows, coords):
+                        yield row, ({"type":"Point", "coordinates":xy} if xy else None)
+        finally:
+            pool.terminate()
+
+    results = rowgeoms()
+    if "last" in kwargs:
+        # the header row counts as the first row
+        last = kwargs["last"]
+        results = (rowgeom for i,rowgeom in enumerate(results, 1) if i <= last)
+    return fields, results
+
+def iter_shapefile_bboxes(filepath):
+    """Yields the index and bbox of each shape in a shapefile, read directly from the .shx and .shp files
+    without decoding the shapes. Null shapes have a bbox of None.
+    """
+    shxpath = filepath[:-4] + ".shx"
+    with open(shxpath, "rb") as shx, open(filepath, "rb") as shp:
+        shx.seek(100) # skip header
+        i = 0
+        while True:
+            entry = shx.read(8)
+            if len(entry) < 8:
+                break
+            offset,length = struct.unpack(">ii", entry)
+            # offsets are given in 16-bit words, and each record starts with an 8 byte header
+            shp.seek(offset * 2 + 8)
+            shapetype, = struct.unpack("<i", shp.read(4))
+            if shapetype == 0:
+                bbox = None
+            elif shapetype in (1,11,21):
+                # points dont have a bbox, only the point itself
+                x,y = struct.unpack("<2d", shp.read(16))
+                bbox = [x,y,x,y]
+            else:
+                bbox = list(struct.unpack("<4d", shp.read(32)))
+            yield i, bbox
+            i += 1
+
+def iter_file(filepath, encoding="utf8", encoding_errors="strict", crs=None, select=None, bbox=None, fields=None, **kwargs):
+    """Opens a file and returns its fields, a generator of row-geometry pairs, and the crs,
+    without loading the rows and geometries into memory.
+
+    The select and bbox filters are applied while reading, for all file formats. For shapefiles, 
+    the bbox of each shape is read directly from the file, so that only the records and shapes that 
+    pass the filters are ever decoded. 
+
+    Args:
+        filepath: Filepath of the file to read. 
+        encoding (optional): Text encoding of the file. 
+        encoding_errors (optional): How to handle text that can't be decoded, as for the builtin str.decode(). 
+        crs (optional): Overrides the crs of the file. 
+        select (optional): Function that takes a fieldname-value dictionary mapping and returns True for features that should be loaded. 
+        bbox (optional): Only loads features whose geometry bbox overlaps the given [xmin,ymin,xmax,ymax] bbox. 
+            Features without geometry are skipped. 
+        fields (optional): For GeoJSON files, the fields returned by an earlier call for the same file, 
+            so that the file doesn't have to be read through again to find them. The crs is then only the given crs. 
+        **kwargs: File-format specific loading options. For delimited text files, setting workers to more than 1 parses
+            the file in parallel in that many processes, see _read_delimited_parallel(). 
+    """
 
     # TODO: for geoj and delimited should detect and force consistent field types in similar manner as when saving
 
     filetype = detect_filetype(filepath)
-    
-    select = kwargs.get("select")
 
-    def decode(value):
-        if isinstance(value, bytes): 
-            return value.decode(encoding, errors=encoding_errors)
-        else: return value
+    if bbox:
+        # ensure min,min,max,max pattern
+        xs = bbox[0],bbox[2]
+        ys = bbox[1],bbox[3]
+        bbox = [min(xs),min(ys),max(xs),max(ys)]
+    filtered = False # whether the filters were already applied by the format reader
     
     # shapefile
     if filetype == "Shapefile":
@@ -58,15 +256,29 @@ def from_file(filepath, encoding="utf8", encoding_errors="strict", crs=None, **k
         
         # load fields, rows, and geometries
         fields = [fieldinfo[0] for fieldinfo in shapereader.fields[1:]]
-        rows = ( [value for value in record] for record in shapereader.iterRecords() )
         def getgeoj(obj):
             if obj.shapeTypeName == 'NULL':
                 return
             geoj = obj.__geo_interface__
             if hasattr(obj, "bbox"): geoj["bbox"] = list(obj.bbox)
             return geoj
-        geometries = (getgeoj(shape) for shape in shapereader.iterShapes())
-        rowgeoms = zip(rows, geometries)
+
+        if bbox or select:
+            # only decode the records and shapes that pass the filters
+            def filtered_rowgeoms():
+                for i,shapebbox in iter_shapefile_bboxes(filepath):
+                    if bbox and not (shapebbox and bbox_overlaps(shapebbox, bbox)):
+                        continue
+                    row = [value for value in shapereader.record(i)]
+                    if select and not select(dict(zip(fields,row))):
+                        continue
+                    yield row, getgeoj(shapereader.shape(i))
+            rowgeoms = filtered_rowgeoms()
+            filtered = True
+        else:
+            rows = ( [value for value in record] for record in shapereader.iterRecords() )
+            geometries = (getgeoj(shape) for shape in shapereader.iterShapes())
+            rowgeoms = zip(rows, geometries)
         
         # load projection string from .prj file if exists
         if not crs:
@@ -75,59 +287,73 @@ def from_file(filepath, encoding="utf8", encoding_errors="strict", crs=None, **k
             else: crs = None
 
     # geojson file
-    elif filetype == "GeoJSON":
-        geojfile = pygeoj.load(filepath, **kwargs)
+    elif filetype in ("GeoJSON","GeoJSONSeq"):
+        from .fileformats import geojson
 
-        # load fields, rows, and geometries
-        fields = [decode(field) for field in geojfile.common_attributes]
-        rows = ([decode(feat.properties[field]) for field in fields] for feat in geojfile)
-        geometries = (feat.geometry.__geo_interface__ for feat in geojfile)
-        rowgeoms = zip(rows, geometries)
+        # the features are streamed from the file, so first read through it to find all the fields
+        if fields is None:
+            fields,filecrs = geojson.read_fields(filepath, encoding=encoding, encoding_errors=encoding_errors)
+        else:
+            filecrs = None
+
+        # load rows and geometries
+        features = geojson.iter_features(filepath, encoding=encoding, encoding_errors=encoding_errors)
+        def getrow(feat):
+            properties = feat.get("properties") or {}
+            return [properties.get(field) for field in fields]
+        def getgeoj(feat):
+            geoj = feat.get("geometry")
+            if not geoj or not geoj.get("coordinates"):
+                return None
+            return geoj
+        rowgeoms = ((getrow(feat),getgeoj(feat)) for feat in features)
 
         # load crs
         if not crs:
-            crs = geojfile.crs
+            crs = filecrs
+
+    # native binary columnar format
+    elif filetype == "Binary Columnar":
+        from .fileformats import columnar
+        fields,rowgeoms,filecrs = columnar.iter_file(filepath)
+        crs = crs or filecrs
 
     # table files without geometry
     elif filetype in ("Text-Delimited","CSV","Excel 97","Excel","Stata"):
 
         # txt or csv
         if filetype in ("Text-Delimited","CSV"):
-            delimiter = kwargs.get("delimiter")
-            fileobj = open(filepath, "rb")
+            workers = kwargs.pop("workers", None)
             # auto detect delimiter
             # NOTE: only based on first 10 mb, otherwise gets really slow for large files
             # TODO: run sniffer regardless, and allow sending all kwargs to overwrite
             sniffsize = kwargs.pop('sniffsize', 10)
-            dialect = csv.Sniffer().sniff(fileobj.read(1056*sniffsize)) 
-            fileobj.seek(0)
+            with io.open(filepath, "r", encoding=encoding, errors=encoding_errors, newline="") as fileobj:
+                dialect = csv.Sniffer().sniff(fileobj.read(1056*sniffsize))
             # overwrite with user input
             for k,v in kwargs.items():
                 setattr(dialect, k, v)
-            # load and parse
-            rows = csv.reader(fileobj, dialect)
-            def parsestring(string):
-                try:
-                    val = float(string.replace(",","."))
-                    if val.is_integer():
-                        val = int(val)
-                    return val
-                except:
-                    if string.upper() == "NULL":
-                        return None
-                    else:
-                        return string.decode(encoding, errors=encoding_errors)
-            rows = ([parsestring(cell) for cell in row] for row in rows)
-            
-            if "skip" in kwargs:
-                for _ in range(kwargs["skip"]):
-                    next(rows)
+            fmtparams = dict(((k,getattr(dialect,k)) for k in DIALECT_ATTRIBUTES))
 
-            if "last" in kwargs:
-                last = kwargs["last"]
-                rows = (r for i,r in enumerate(rows) if i <= last)
+            if workers and workers > 1:
+                # parse in parallel, including any xy geometries
+                fields,rowgeoms = _read_delimited_parallel(filepath, fmtparams, workers, encoding, encoding_errors, **kwargs)
+                
+            else:
+                # load and parse
+                fileobj = io.open(filepath, "r", encoding=encoding, errors=encoding_errors, newline="")
+                rows = csv.reader(fileobj, **fmtparams)
+                rows = ([_parse_cell(cell) for cell in row] for row in rows)
+                
+                if "skip" in kwargs:
+                    for _ in range(kwargs["skip"]):
+                        next(rows)
 
-            fields = next(rows)
+                if "last" in kwargs:
+                    last = kwargs["last"]
+                    rows = (r for i,r in enumerate(rows) if i <= last)
+
+                fields = next(rows)
 
         # excel
         elif filetype in ("Excel","Excel 97"):
@@ -175,25 +401,17 @@ def from_file(filepath, encoding="utf8", encoding_errors="strict", crs=None, **k
         xfield = kwargs.get("xfield")
         yfield = kwargs.get("yfield")
         
-        if geokey:
+        if filetype in ("Text-Delimited","CSV") and workers and workers > 1:
+            # xy geometries are already created by the workers
+            if geokey:
+                rowgeoms = ((row,geokey(dict(zip(fields,row)))) for row,_ in rowgeoms)
+
+        elif geokey:
             rowgeoms = ((row,geokey(dict(zip(fields,row)))) for row in rows)
             
         elif xfield and yfield:
-            def xygeoj(row):
-                rowdict = dict(zip(fields,row))
-                x,y = rowdict[xfield],rowdict[yfield]
-                try:
-                    x,y = float(x),float(y)
-                    geoj = {"type":"Point", "coordinates":(x,y)}
-                except:
-                    try:
-                        x,y = float(x.replace(",",".")),float(y.replace(",","."))
-                        geoj = {"type":"Point", "coordinates":(x,y)}
-                    except:
-                        warnings.warn("Could not create point geometry from xfield and yfield values {x} and {y}".format(x=repr(x), y=repr(y)))
-                        geoj = None
-                return geoj
-            rowgeoms = ((row,xygeoj(row)) for row in rows)
+            xindex,yindex = fields.index(xfield),fields.index(yfield)
+            rowgeoms = ((row,_xy_geometry(row, xindex, yindex)) for row in rows)
             
         else:
             rowgeoms = ((row,None) for row in rows)
@@ -204,15 +422,14 @@ def from_file(filepath, encoding="utf8", encoding_errors="strict", crs=None, **k
         raise Exception("Could not create vector data from the given filepath: the filetype extension is either missing or not supported")
 
     # filter if needed
-    if select:
-        rowgeoms = ( (row,geom) for row,geom in rowgeoms if select(dict(zip(fields,row))) )
-
-    # load to memory in lists
-    rows,geometries = zip(*rowgeoms)
-    rows = list(rows)
-    geometries = list(geometries)
-
-    return fields, rows, geometries, crs
+    if not filtered:
+        if bbox:
+            rowgeoms = ( (row,geom) for row,geom in rowgeoms 
+                        if geom and bbox_overlaps(geom.get("bbox") or geojson_bbox(geom), bbox) )
+        if select:
+            rowgeoms = ( (row,geom) for row,geom in rowgeoms if select(dict(zip(fields,row))) )
+
+    return fields, rowgeoms, crs
 
 
 
@@ -97,10 +97,6 @@ def where(data, other, condition, **kwargs):
     # same as select by location
     condition = condition.lower()
     
-    # create spatial index
-    if not hasattr(data, "spindex"): data.create_spatial_index()
-    if not hasattr(other, "spindex"): other.create_spatial_index()
-
     out = VectorData()
     out.fields = list(data.fields)
 
@@ -109,10 +105,17 @@ def where(data, other, condition, **kwargs):
         if not maxdist:
             raise Exception("The 'distance' select condition requires a 'radius' arg")
 
-        for feat in data:
+        # create spatial index
+        if not hasattr(other, "spindex"): other.create_spatial_index()
+
+        # get spindex possibilities within the radius of each feature's bbox
+        feats = [feat for feat in data if feat.geometry]
+        bboxes = [(xmin-maxdist, ymin-maxdist, xmax+maxdist, ymax+maxdist) for xmin,ymin,xmax,ymax in (feat.bbox for feat in feats)]
+        candidates = other.quick_overlap_iter(bboxes)
+        for feat,otherfeats in zip(feats, candidates):
             geom = feat.get_shapely()
             
-            for otherfeat in other:
+            for otherfeat in otherfeats:
                 othergeom = otherfeat.get_shapely()
                 
                 if geom.distance(othergeom) <= maxdist:
@@ -122,32 +125,59 @@ def where(data, other, condition, **kwargs):
         return out
 
     elif condition in ("intersects", "within", "contains", "crosses", "touches", "equals"):
-        for feat in data.quick_overlap(other.bbox):
-            geom = feat.get_shapely()
-            matchtest = getattr(geom, condition)
-            
-            for otherfeat in other.quick_overlap(feat.bbox):
-                othergeom = otherfeat.get_shapely()
-                
-                if matchtest(othergeom):
-                    out.add_feature(feat.row, feat.geometry)
-                    break  # only one match is needed
+        if condition in ("intersects", "within") and data.type == "Point" and other.type == "Polygon":
+            feats = [feat for feat in data if feat.geometry]
+            points = all((feat.geometry["type"] == "Point" for feat in feats))
+        else:
+            points = False
+
+        if points:
+            # points in polygons, tested for all points of each polygon at once,
+            # without the need for any spatial index
+            matched = _points_in_polygons(feats, other, boundary=condition == "intersects")
+
+        else:
+            # create spatial index
+            if not hasattr(data, "spindex"): data.create_spatial_index()
+            if not hasattr(other, "spindex"): other.create_spatial_index()
+
+            # get spindex possibilities of the features a batch at a time
+            feats = list(data.quick_overlap(other.bbox))
+            candidates = other.quick_overlap_iter((feat.bbox for feat in feats))
+            matched = []
+            for feat,otherfeats in zip(feats, candidates):
+                if condition == "equals":
+                    matchtest = feat.get_shapely().equals
+                else:
+                    matchtest = getattr(feat.get_prepared(), condition)
+                # only one match is needed
+                matched.append(any((matchtest(otherfeat.get_shapely()) for otherfeat in otherfeats)))
+
+        for feat,match in zip(feats, matched):
+            if match:
+                out.add_feature(feat.row, feat.geometry)
 
         return out
 
     elif condition in ("disjoint",):
+        # create spatial index
+        if not hasattr(data, "spindex"): data.create_spatial_index()
+        if not hasattr(other, "spindex"): other.create_spatial_index()
+
         # first add those whose bboxes clearly dont overlap
         for feat in data.quick_disjoint(other.bbox):
             out.add_feature(feat.row, feat.geometry)
 
         # then check those that might overlap
-        for feat in data.quick_overlap(other.bbox):
-            geom = feat.get_shapely()
+        feats = list(data.quick_overlap(other.bbox))
+        candidates = other.quick_overlap_iter((feat.bbox for feat in feats))
+        for feat,otherfeats in zip(feats, candidates):
+            supergeom = feat.get_prepared()
 
             # has to be disjoint with all those that maybe overlap,
             # ie a feature that intersects at least one feature in the
             # other layer is not disjoint
-            disjoint = all((otherfeat.get_shapely().disjoint(geom) for otherfeat in other.quick_overlap(feat.bbox)))
+            disjoint = all((supergeom.disjoint(otherfeat.get_shapely()) for otherfeat in otherfeats))
 
             if disjoint:
                 out.add_feature(feat.row, feat.geometry)
@@ -157,7 +187,195 @@ def where(data, other, condition, **kwargs):
     else:
         raise Exception("Unknown select condition")
 
-def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False, **kwargs):
+def _point_in_polygon(xs, ys, geometry):
+    # returns two boolean arrays for whether each of the xs,ys points lies in the interior or on the boundary 
+    # of a GeoJSON polygon or multipolygon, by counting the ring edges crossed by a ray from each point, 
+    # for all points and edges at once
+    import numpy as np
+    if geometry["type"] == "Polygon":
+        rings = geometry["coordinates"]
+    else:
+        rings = [ring for poly in geometry["coordinates"] for ring in poly]
+
+    inside = np.zeros(len(xs), dtype=bool)
+    boundary = np.zeros(len(xs), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)[:,:2]
+        if len(ring) < 2:
+            continue
+        x1,y1 = ring[:,0],ring[:,1]
+        x2,y2 = np.roll(x1, -1),np.roll(y1, -1) # also closes unclosed rings
+        # limit the size of the points by edges arrays
+        chunk = max(1, 1000000 // len(ring))
+        for start in range(0, len(xs), chunk):
+            px = xs[start:start+chunk,None]
+            py = ys[start:start+chunk,None]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                crosses = ((y1 > py) != (y2 > py)) & (px < (x2 - x1) * (py - y1) / (y2 - y1) + x1)
+            inside[start:start+chunk] ^= (np.count_nonzero(crosses, axis=1) % 2).astype(bool)
+            onedge = ((((x2 - x1) * (py - y1) - (y2 - y1) * (px - x1)) == 0) &
+                      (px >= np.minimum(x1, x2)) & (px <= np.maximum(x1, x2)) &
+                      (py >= np.minimum(y1, y2)) & (py <= np.maximum(y1, y2)))
+            boundary[start:start+chunk] |= onedge.any(axis=1)
+    return inside & ~boundary, boundary
+
+def _points_in_polygons(feats, polydata, boundary=False):
+    # returns a list of whether each of the point features lies within any of the polygons, 
+    # or on their boundary if boundary is True
+    import numpy as np
+    from .spindex import GridIndex
+    coords = np.array([feat.geometry["coordinates"][:2] for feat in feats], dtype=np.float64).reshape((-1,2))
+    xs,ys = coords[:,0],coords[:,1]
+    matched = np.zeros(len(feats), dtype=bool)
+
+    # find the points within the bbox of each polygon
+    index = GridIndex()
+    index.build(np.arange(len(feats)), np.column_stack([xs,ys,xs,ys]))
+    polys = [poly for poly in polydata if poly.geometry]
+    candidates = index.intersects_many([poly.bbox for poly in polys])
+
+    # test all the remaining points of each polygon at once
+    for poly,positions in zip(polys, candidates):
+        positions = np.array(positions, dtype=np.intp)
+        positions = positions[~matched[positions]]
+        if len(positions):
+            interior,onedge = _point_in_polygon(xs[positions], ys[positions], poly.geometry)
+            matched[positions[interior | onedge if boundary else interior]] = True
+
+    return matched.tolist()
+
+_MULTI_TYPES = {'Point': shapely.geometry.MultiPoint,
+                'LineString': shapely.geometry.MultiLineString,
+                'Polygon': shapely.geometry.MultiPolygon}
+
+def _clip_type(clipname, datatype, othertype):
+    # determine correct output type for each clip operation
+    if clipname == 'intersection':
+        # lowest dimension
+        for typ in ('Point','LineString','Polygon'):
+            if typ in (datatype,othertype):
+                return typ
+    elif clipname == 'union':
+        # highest dimension
+        for typ in ('Polygon','LineString','Point'):
+            if typ in (datatype,othertype):
+                return typ
+    elif clipname == 'difference':
+        # same as main
+        return datatype
+
+def _clip_geometry(geom, othergeom, clipname, newtyp):
+    # performs the clip operation on a pair of shapely geometries, and returns the geojson 
+    # of the result, keeping only the parts of the given geometry type
+    clipfunc = getattr(geom, clipname)
+    try:
+        geom = clipfunc(othergeom)
+    except shapely.errors.TopologicalError:
+        warnings.warn('A clip operation failed due to invalid geometries, replacing with null-geometry')
+        return None
+        
+    if geom:
+        if geom.geom_type == 'GeometryCollection':
+            # only get the subgeoms corresponding to the right type
+            sgeoms = [g for g in geom.geoms if g.geom_type == newtyp] # single geoms
+            mgeoms = [g for g in geom.geoms if g.geom_type == 'Multi'+newtyp] # multi geoms
+            flatmgeoms = [g for mg in mgeoms for g in mg.geoms] # flatten multigeoms
+            geom = _MULTI_TYPES[newtyp](sgeoms + flatmgeoms)
+            return geom.__geo_interface__
+        elif newtyp in geom.geom_type:
+            # normal
+            return geom.__geo_interface__
+        else:
+            # ignore wrong types
+            return None
+
+def _join_chunk(task):
+    # matches and clips a chunk of features against their candidate features in a worker process, 
+    # where geometries are sent as wkb, and returns the matching other ids of each feature along with 
+    # the clipped geojson geometry of each match, or None if not clipping
+    from shapely import wkb
+    condition,clipname,newtyp,feats,others = task
+    othergeoms = dict(((otherid, wkb.loads(otherwkb)) for otherid,otherwkb in others))
+    results = []
+    for pos,featwkb,candidates in feats:
+        geom = wkb.loads(featwkb)
+        if condition in ("intersects", "contains", "covers"):
+            matchtest = getattr(supershapely(geom), condition)
+        else:
+            matchtest = getattr(geom, condition)
+        matches = []
+        for otherid in candidates:
+            othergeom = othergeoms[otherid]
+            if matchtest(othergeom):
+                geoj = _clip_geometry(geom, othergeom, clipname, newtyp) if clipname else None
+                matches.append((otherid, geoj))
+        results.append((pos, matches))
+    return results
+
+def _spatial_join_parallel(data, other, condition, keepall, clipname, workers, out, otheridx):
+    # runs the matching and clipping of spatial_join in a pool of worker processes, 
+    # for spatially coherent chunks of the features, and adds the results to out in the original order
+    import multiprocessing
+
+    feats = list(data.quick_overlap(other.bbox))
+    geomfeats = [pos for pos,feat in enumerate(feats) if feat.geometry]
+    candidates = other.quick_overlap_many([feats[pos].bbox for pos in geomfeats])
+    candidates = dict(((pos, [otherfeat.id for otherfeat in otherfeats]) for pos,otherfeats in zip(geomfeats, candidates)))
+
+    # partition the features into chunks of nearby features, by sorting them into vertical strips by x 
+    # and then by y within each strip, so that each chunk only needs the other features of a small area
+    nchunks = min(workers * 4, len(geomfeats)) or 1
+    centers = dict(((pos, ((feats[pos].bbox[0]+feats[pos].bbox[2])/2.0, (feats[pos].bbox[1]+feats[pos].bbox[3])/2.0)) for pos in geomfeats))
+    bystrip = sorted(geomfeats, key=lambda pos: centers[pos][0])
+    stripsize = -(-len(bystrip) // int(math.ceil(nchunks ** 0.5))) or 1
+    ordered = []
+    for i in range(0, len(bystrip), stripsize):
+        ordered.extend(sorted(bystrip[i:i+stripsize], key=lambda pos: centers[pos][1]))
+    chunksize = -(-len(ordered) // nchunks) or 1
+
+    # send compact wkb geometries to the workers
+    newtyp = _clip_type(clipname, data.type, other.type) if clipname else None
+    otherwkbs = dict()
+    def tasks():
+        for i in range(0, len(ordered), chunksize):
+            chunk = ordered[i:i+chunksize]
+            chunkfeats = [(pos, feats[pos].get_shapely().wkb, candidates[pos]) for pos in chunk]
+            otherids = set((otherid for pos in chunk for otherid in candidates[pos]))
+            for otherid in otherids:
+                if otherid not in otherwkbs:
+                    otherwkbs[otherid] = other[otherid].get_shapely().wkb
+            chunkothers = [(otherid, otherwkbs[otherid]) for otherid in otherids]
+            yield condition, clipname, newtyp, chunkfeats, chunkothers
+
+    matched = dict()
+    pool = multiprocessing.Pool(workers)
+    try:
+        for results in pool.imap_unordered(_join_chunk, tasks()):
+            for pos,matches in results:
+                matched[pos] = matches
+    finally:
+        pool.terminate()
+
+    # add in the original order
+    for pos,feat in enumerate(feats):
+        matches = matched.get(pos)
+        if matches:
+            for otherid,geoj in matches:
+                if not clipname:
+                    geoj = feat.geometry
+                newrow = list(feat.row)
+                newrow += (other[otherid].row[i] for i in otheridx)
+                out.add_feature(newrow, geoj)
+
+        elif keepall:
+            # no matches
+            newrow = list(feat.row)
+            newrow += (None for i in otheridx)
+            out.add_feature(newrow, feat.geometry)
+
+    return out
+
+def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False, workers=None, **kwargs):
     """
     Pairwise joining with all unique pairs that match the spatial "condition" and the optional "subkey" function.
     Returns a new spatially joined dataset.
@@ -188,6 +406,10 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
             The clip argument can also be used to ignore geometries alltogether, especially since joins
             with many matching pairs and duplicate geometries may lead to a large memory footprint. To reduce the memory footprint,
             the clip argument can be set to a function that returns None, returning a non-spatial table without geometries. 
+        workers (optional): If set to a number larger than 1, the features are matched and clipped in parallel in that many
+            worker processes, each handling chunks of nearby features. Only for the "intersects", "within", "contains", 
+            "crosses", "touches", "equals", and "covers" conditions, and without a subkey or clip function, since 
+            functions can't be sent to the worker processes. The results are the same and in the same order as without workers. 
     """
 
     # TODO: switch if point is other
@@ -205,65 +427,21 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
     
     otheridx = [i for i,field in enumerate(other.fields) if field not in data.fields]
 
+    # run in parallel
+    if workers and workers > 1 and condition in ("intersects", "within", "contains", "crosses", "touches", "equals", "covers"):
+        if subkey or (clip and not isinstance(clip, basestring)):
+            raise Exception("The workers option can't be used with a subkey or clip function, since functions can't be sent to the worker processes")
+        return _spatial_join_parallel(data, other, condition, keepall, clip or None, workers, out, otheridx)
+
+    # prep geoms in other
+    othergeoms = dict(((otherfeat.id, otherfeat.get_shapely()) for otherfeat in other if otherfeat.geometry))
+
     if isinstance(clip, basestring):
         clipname = clip
-        
-        # determine correct output type for each operation
-        if clipname == 'intersection':
-            # lowest dimension
-            if 'Point' in (data.type,other.type):
-                newtyp = 'Point'
-                newmultiobj = shapely.geometry.MultiPoint
-            elif 'LineString' in (data.type,other.type):
-                newtyp = 'LineString'
-                newmultiobj = shapely.geometry.MultiLineString
-            elif 'Polygon' in (data.type,other.type):
-                newtyp = 'Polygon'
-                newmultiobj = shapely.geometry.MultiPolygon
-        elif clipname == 'union':
-            # highest dimension
-            if 'Polygon' in (data.type,other.type):
-                newtyp = 'Polygon'
-                newmultiobj = shapely.geometry.MultiPolygon
-            elif 'LineString' in (data.type,other.type):
-                newtyp = 'LineString'
-                newmultiobj = shapely.geometry.MultiLineString
-            elif 'Point' in (data.type,other.type):
-                newtyp = 'Point'
-                newmultiobj = shapely.geometry.MultiPoint
-        elif clipname == 'difference':
-            # same as main
-            newtyp = data.type
-            if 'Point' in newtyp: newmultiobj = shapely.geometry.MultiPoint
-            elif 'LineString' in newtyp: newmultiobj = shapely.geometry.MultiLineString
-            elif 'Polygon' in newtyp: newmultiobj = shapely.geometry.MultiPolygon
-
-        print(newtyp,newmultiobj)
+        newtyp = _clip_type(clipname, data.type, other.type)
             
         def clip(f1,f2):
-            clipfunc = getattr(f1.get_shapely(), clipname)
-            #print 'clipping feat'
-            try:
-                geom = clipfunc(f2._shapely)
-            except shapely.errors.TopologicalError:
-                warnings.warn('A clip operation failed due to invalid geometries, replacing with null-geometry')
-                return None
-                
-            if geom:
-                #print geom.geom_type
-                if geom.geom_type == 'GeometryCollection':
-                    # only get the subgeoms corresponding to the right type
-                    sgeoms = [g for g in geom.geoms if g.geom_type == newtyp] # single geoms
-                    mgeoms = [g for g in geom.geoms if g.geom_type == 'Multi'+newtyp] # multi geoms
-                    flatmgeoms = [g for mg in mgeoms for g in mg.geoms] # flatten multigeoms
-                    geom = newmultiobj(sgeoms + flatmgeoms)
-                    return geom.__geo_interface__
-                elif newtyp in geom.geom_type:
-                    # normal
-                    return geom.__geo_interface__
-                else:
-                    # ignore wrong types
-                    return None            
+            return _clip_geometry(f1.get_shapely(), othergeoms[f2.id], clipname, newtyp)
 
     if condition in ("distance",):
         radius = kwargs.get("radius")
@@ -272,12 +450,6 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
         if not (radius or n):
             raise Exception("The 'distance' join condition requires a 'radius' or 'n' arg")
 
-        # prep geoms in other
-        for otherfeat in other:
-            if not otherfeat.geometry:
-                continue
-            otherfeat._shapely = otherfeat.get_shapely()
-
         # match funcs
         def within(feat, other):
             if geodetic:
@@ -287,19 +459,17 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
             superbuff = supershapely(buff)
             otherfeats = other.quick_overlap(buff.bounds) if hasattr(other, "spindex") else other
             for otherfeat in otherfeats:
-                if superbuff.intersects(otherfeat._shapely):
+                if superbuff.intersects(othergeoms[otherfeat.id]):
                     yield otherfeat
 
         def nearest(feat, otherfeats):
             # TODO: implement optional geodetic distance
-            for otherfeat in sorted(otherfeats, key=lambda otherfeat: geom.distance(otherfeat._shapely)):
+            for otherfeat in sorted(otherfeats, key=lambda otherfeat: geom.distance(othergeoms[otherfeat.id])):
                 yield otherfeat
 
         # begin
         for feat in data:
 
-            #print feat
-            
             if not feat.geometry:
                 if keepall:
                     newrow = list(feat.row)
@@ -308,56 +478,29 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
                 continue
 
             geom = feat.get_shapely()
-            supergeom = supershapely(geom)
 
-            # test conditions
-            # first find overlaps
-            overlaps = []
-            nonoverlaps = []
-            for otherfeat in other.quick_overlap(feat.bbox):
-                if subkey and not subkey(feat,otherfeat):
-                    continue
-                if supergeom.intersects(otherfeat._shapely):
-                    overlaps.append(otherfeat)
-                else:
-                    nonoverlaps.append(otherfeat)
-                if n and len(overlaps) >= n:
-                    # check if sufficient
-                    break
-            
-            # otherwise proceed to nonoverlaps
-            matches = overlaps
-            proceed = len(matches) < n if n else True
-            if proceed:
-                # limit to those within radius
-                if radius:
-                    # test within
-                    # NOTE: seems faster to just use existing spindex and exclude those already added
-                    nonoverlaps = (otherfeat for otherfeat in within(feat, other)
-                                   if otherfeat not in matches)
-                # add remainder of nonoverlaps
-                else:
-                    for otherfeat in other.quick_disjoint(feat.bbox):
-                        nonoverlaps.append(otherfeat)
-                # filter by key
-                if subkey:
-                    nonoverlaps = (otherfeat for otherfeat in nonoverlaps if subkey(feat, otherfeat))
-                # then calc dist for nonoverlaps
+            # find candidates in order of distance
+            if n and not (radius and geodetic):
+                # best-first search of the spatial index, where only as many features
+                # are compared as needed to find the n nearest
+                candidates = other.quick_nearest(geometry=geom, radius=radius)
+            else:
+                # all within radius
+                candidates = within(feat, other)
                 if n:
-                    nonoverlaps = list(nonoverlaps)
-                    #print "nearsort",len(nonoverlaps)
-                    for otherfeat in nearest(feat, nonoverlaps):
-                        # if it gets this far it will be slow regardless of n,
-                        # since all dists have to be calculated in order to sort them
-                        matches.append(otherfeat)
-                        if n and len(matches) >= n:
-                            #print "ne",len(matches)
-                            break
-                else:
-                    # means radius is only criteria,
-                    # so join with all (within radius)
-                    matches.extend(list(nonoverlaps))
-                    #print "wt2",len(matches)
+                    # geodetic radius, so sort the planar distance of only those within it
+                    candidates = nearest(feat, list(candidates))
+
+            # filter by key
+            if subkey:
+                candidates = (otherfeat for otherfeat in candidates if subkey(feat, otherfeat))
+
+            if n:
+                matches = list(itertools.islice(candidates, n))
+            else:
+                # means radius is only criteria,
+                # so join with all (within radius)
+                matches = list(candidates)
 
             # add
             if matches:
@@ -379,14 +522,12 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
         return out
 
     elif condition in ("intersects", "within", "contains", "crosses", "touches", "equals", "covers"):
-        # prep geoms in other
-        for otherfeat in other:
-            if not otherfeat.geometry:
-                continue
-            otherfeat._shapely = otherfeat.get_shapely()
+        # get spindex possibilities of the features a batch at a time
+        feats = list(data.quick_overlap(other.bbox))
+        candidates = other.quick_overlap_iter((feat.bbox if feat.geometry else None for feat in feats))
 
         # begin
-        for feat in data.quick_overlap(other.bbox):
+        for feat,otherfeats in zip(feats, candidates):
 
             #print feat
 
@@ -400,18 +541,18 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
             # match funcs
             geom = feat.get_shapely()
             if condition in ("intersects", "contains", "covers"):
-                supergeom = supershapely(geom)
+                supergeom = feat.get_prepared()
                 matchtest = getattr(supergeom, condition)
             else:
                 matchtest = getattr(geom, condition)
 
-            # get spindex possibilities
-            matches = (otherfeat for otherfeat in other.quick_overlap(feat.bbox))
+            # spindex possibilities
+            matches = otherfeats
             # filter by subkey
             if subkey:
                 matches = (otherfeat for otherfeat in matches if subkey(feat, otherfeat))
             # test spatial
-            matches = [otherfeat for otherfeat in matches if matchtest(otherfeat._shapely)]
+            matches = [otherfeat for otherfeat in matches if matchtest(othergeoms[otherfeat.id])]
             if matches:
                 for match in matches:
                     if clip:
@@ -431,14 +572,12 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
         return out
 
     elif condition in ("disjoint",):
-        # prep geoms in other
-        for otherfeat in other:
-            if not otherfeat.geometry:
-                continue
-            otherfeat._shapely = otherfeat.get_shapely()
+        # get spindex possibilities of the features a batch at a time
+        feats = list(data)
+        candidates = other.quick_overlap_iter((feat.bbox if feat.geometry else None for feat in feats))
 
         # begin
-        for feat in data:
+        for feat,otherfeats in zip(feats, candidates):
 
             # check empty geom
             if not feat.geometry:
@@ -457,13 +596,13 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
 
             # then check those that might overlap
             geom = feat.get_shapely()
-            # get spindex possibilities
-            closeones = (otherfeat for otherfeat in other.quick_overlap(feat.bbox))
+            # spindex possibilities
+            closeones = otherfeats
             # filter by subkey
             if subkey:
                 closeones = (otherfeat for otherfeat in closeones if subkey(feat, otherfeat))
             # test spatial
-            closeones = [otherfeat for otherfeat in closeones if geom.disjoint(otherfeat._shapely)]
+            closeones = [otherfeat for otherfeat in closeones if geom.disjoint(othergeoms[otherfeat.id])]
 
             # add
             matches = nonoverlaps + closeones
@@ -496,9 +635,133 @@ def spatial_join(data, other, condition, subkey=None, keepall=False, clip=False,
 
 
 
+def _sweep(bboxes1, bboxes2):
+    # plane sweep along the x-axis over two lists of bboxes, where None entries are skipped. 
+    # yields ("pair", i, j) for the positions of each pair of overlapping bboxes between the two lists, 
+    # and ("end", side, i) for each bbox once the sweep has passed it, ie when all its pairs have been yielded, 
+    # where side is 0 for the first list and 1 for the second. 
+    # only the bboxes that span the current x position are kept and compared. 
+    import heapq
+    lists = (bboxes1, bboxes2)
+    events = [(bbox[0], side, i) for side,bboxes in enumerate(lists) for i,bbox in enumerate(bboxes) if bbox]
+    events.sort()
+    active = (dict(), dict())
+    ends = []
+    for xmin,side,i in events:
+        # close those that end before this one starts
+        while ends and ends[0][0] < xmin:
+            _,endside,k = heapq.heappop(ends)
+            del active[endside][k]
+            yield "end", endside, k
+        # pair with the open bboxes of the other list that overlap in y
+        _,ymin,xmax,ymax = lists[side][i]
+        for k,otherbbox in active[1-side].items():
+            if otherbbox[1] <= ymax and otherbbox[3] >= ymin:
+                yield ("pair", i, k) if side == 0 else ("pair", k, i)
+        active[side][i] = lists[side][i]
+        heapq.heappush(ends, (xmax, side, i))
+    while ends:
+        _,endside,k = heapq.heappop(ends)
+        yield "end", endside, k
+
+def iter_overlay(data, other, how="intersection"):
+    """
+    Same as overlay(), but yields the output features one at a time as (row, geojson) pairs as soon as they are done,
+    instead of collecting them in a new dataset. Only the features that span the current position of the sweep are kept 
+    in memory, so that the output can be written straight to file, e.g. with `vector.saver.to_file`. 
+    The fields of the rows are the same as for overlay(). 
+    """
+    how = how.lower()
+    if how not in ("intersection", "union", "difference", "symmetric_difference"):
+        raise Exception("Unknown overlay operation: {}".format(how))
+    if data.type != "Polygon" or other.type != "Polygon":
+        raise Exception("Overlay is only possible between polygon datasets")
+
+    feats = ([feat for feat in data if feat.geometry], [feat for feat in other if feat.geometry])
+    otheridx = [i for i,field in enumerate(other.fields) if field not in data.fields]
+    emptyrows = ([None for _ in data.fields], [None for _ in otheridx])
+
+    def outrow(feat, otherfeat):
+        if how == "difference":
+            return list(feat.row)
+        row = list(feat.row) if feat else list(emptyrows[0])
+        row += (otherfeat.row[i] for i in otheridx) if otherfeat else emptyrows[1]
+        return row
+
+    # the candidate partners of each open feature, on each side
+    partners = (dict(), dict())
+    sides = (0,) if how == "difference" else (0,1)
+
+    for event in _sweep([feat.bbox for feat in feats[0]], [feat.bbox for feat in feats[1]]):
+        if event[0] == "pair":
+            _,i,j = event
+            partners[0].setdefault(i, []).append(j)
+            partners[1].setdefault(j, []).append(i)
+            continue
+
+        # a feature the sweep has passed, so all its partners are known
+        _,side,i = event
+        feat = feats[side][i]
+        candidates = [feats[1-side][k] for k in partners[side].pop(i, [])]
+        if side == 1 and how not in ("union", "symmetric_difference"):
+            continue
+
+        # only keep partners whose geometries overlap
+        supergeom = feat.get_prepared()
+        hits = [otherfeat for otherfeat in candidates if supergeom.intersects(otherfeat.get_shapely())]
+        geom = feat.get_shapely()
+
+        # the pieces where both overlap, clipped in one batch per feature of the main dataset
+        if side == 0 and how in ("intersection", "union"):
+            for otherfeat in hits:
+                geoj = _clip_geometry(geom, otherfeat.get_shapely(), "intersection", "Polygon")
+                if geoj:
+                    yield outrow(feat, otherfeat), geoj
+
+        # the remaining piece not covered by any feature of the other dataset
+        if side in sides and how != "intersection":
+            if hits:
+                covered = shapely.ops.unary_union([otherfeat.get_shapely() for otherfeat in hits])
+                geoj = _clip_geometry(geom, covered, "difference", "Polygon")
+            else:
+                geoj = feat.geometry
+            if geoj:
+                yield (outrow(feat, None) if side == 0 else outrow(None, feat)), geoj
+
+def overlay(data, other, how="intersection"):
+    """
+    Overlays two polygon datasets, and returns a new dataset of the pieces where they overlap and/or not. 
+    Much faster than clipping with spatial_join() for large overlays, e.g. where both datasets cover the same area. 
+
+    A plane sweep over the bboxes of both datasets, sorted by their left edge, finds all pairs of features 
+    with overlapping bboxes, while only keeping track of the features that span the current position of the sweep. 
+    Once the sweep has passed a feature, all its pieces are clipped in one go, and the parts of it that are not covered 
+    by any features of the other dataset are found by subtracting their dissolved union. 
+
+    Output features are in the order in which the sweep passes them, not the original order. 
+    Pieces that are only lines or points, i.e. where polygons just touch, are dropped. 
+
+    Arguments:
+        data: The main polygon VectorData dataset. 
+        other: The other polygon VectorData dataset. 
+        how (optional): The overlay operation, one of:
+            - "intersection" (default): the pieces covered by both datasets, with the fields of both. 
+            - "union": the pieces covered by both, as well as the pieces only covered by one of them, 
+                where the fields of the other are None. 
+            - "difference": the pieces of the main dataset not covered by the other, with the fields of the main dataset. 
+            - "symmetric_difference": the pieces only covered by one of the datasets. 
+    """
+    out = VectorData()
+    out.fields = list(data.fields)
+    if how.lower() != "difference":
+        out.fields += (field for field in other.fields if field not in data.fields)
+    for row,geoj in iter_overlay(data, other, how):
+        out.add_feature(row, geoj)
+    return out
+
 # File management
 
-def split(data, key, breaks="unique", **kwargs):
+def split(data, key, breaks="unique", sort=False, **kwargs):
     """
     Splits a vector data layer into multiple ones based on a key which can be
     a field name, a list of field names, or a function. The default is to
@@ -508,6 +771,10 @@ def split(data, key, breaks="unique", **kwargs):
     follow the input and behavior of the ClassyPie package's split and unique
     functions. 
 
+    Unique splits are found by hashing the key values and are yielded in the
+    order they were first seen, unless sort is True, in which case they are
+    yielded in sorted key order. 
+
     Iterates through each new split layer one at a time. 
     """
     
@@ -521,8 +788,17 @@ def split(data, key, breaks="unique", **kwargs):
             keywrap = lambda f: f[key]
 
     from .. import classypie as cp
-    if breaks == "unique":
+    if breaks == "unique" and sort:
         grouped = cp.unique(data, key=keywrap, **kwargs)
+    elif breaks == "unique":
+        from . import sql
+        only,exclude = kwargs.get("only"),kwargs.get("exclude")
+        feats = data
+        if only:
+            feats = (f for f in data if keywrap(f) in only)
+        elif exclude:
+            feats = (f for f in data if keywrap(f) not in exclude)
+        grouped = sql.hash_groupby(feats, keywrap)
     else:
         grouped = cp.split(data, breaks=breaks, key=keywrap, **kwargs)
         
@@ -801,11 +1077,14 @@ def cut(data, cutter):
     if not hasattr(cutter, "spindex"): cutter.create_spatial_index()
 
     # cut
-    for feat in data.quick_overlap(cutter.bbox):
+    feats = list(data.quick_overlap(cutter.bbox))
+    candidates = cutter.quick_overlap_iter((feat.bbox for feat in feats))
+    for feat,cutfeats in zip(feats, candidates):
         geom = feat.get_shapely()
+        supergeom = feat.get_prepared()
 
-        cutgeoms = (cutfeat.get_shapely() for cutfeat in cutter.quick_overlap(feat.bbox))
-        cutgeoms = (cutgeom for cutgeom in cutgeoms if cutgeom.intersects(geom))
+        cutgeoms = (cutfeat.get_shapely() for cutfeat in cutfeats)
+        cutgeoms = (cutgeom for cutgeom in cutgeoms if supergeom.intersects(cutgeom))
         def flat(g):
             if hasattr(g, "geoms"):
                 return g.geoms
@@ -3,10 +3,10 @@
 # import builtins
 import itertools
 import math
+import io
 
 # import fileformats
 import shapefile as pyshp
-import pygeoj
 
 # PY3 fix
 try: 
@@ -14,6 +14,10 @@ try:
     zip = itertools.izip
 except:
     pass
+try:
+    basestring
+except NameError:
+    basestring = str
 
 
 NaN = float("nan")
@@ -21,13 +25,221 @@ NaN = float("nan")
 def is_missing(value):
     return value in (None,"") or (isinstance(value, float) and math.isnan(value))
 
-def to_file(fields, rows, geometries, filepath, encoding="utf8", maxprecision=12, **kwargs):
+class FieldTypeDetector(object):
+    """
+    Detects the field types, lengths, and decimals needed to save the rows of a table,
+    in a single pass where each row updates all the fields at once. 
+
+    Args:
+        fields: List of field names.
+        maxprecision (optional): Max number of decimals to store for floats.
+    """
+    def __init__(self, fields, maxprecision=12):
+        self.fields = fields
+        self.maxprecision = maxprecision
+        self.types = ["N" for _ in fields] # assume number until proven otherwise
+        self.lengths = [1 for _ in fields]
+        self.decimals = [0 for _ in fields]
+
+    def update(self, row):
+        """Updates the field types with the values of a row."""
+        types,lengths,decimals = self.types,self.lengths,self.decimals
+        for i,value in enumerate(row):
+            if value is None or value == "":
+                # empty value, so just keep assuming same type
+                continue
+            
+            if types[i] == "C":
+                # already text, only the length can change
+                length = len(value) if isinstance(value, str) else len(str(value))
+                if length > lengths[i]:
+                    lengths[i] = length
+                continue
+
+            if type(value) is int:
+                # fast path for the most common case
+                _strnr = str(value)
+            else:
+                try:
+                    # make nr fieldtype if content can be made into nr
+
+                    # convert to nr or throw exception if text
+                    nr = float(value)
+                    
+                    if math.isnan(nr):
+                        if not isinstance(value, basestring):
+                            # missing value
+                            continue
+                        # rare special case where text is 'nan', is a valid input to float, so raise exception to treat as text
+                        raise ValueError()
+
+                    # TODO: also how to handle inf? math.isinf(). Treat as text or nr? 
+                    if math.isinf(nr):
+                        raise NotImplementedError("Saving infinity values not yet implemented")
+
+                    # detect nr type
+                    if nr.is_integer():
+                        _strnr = str(int(nr))
+                    else:
+                        # get max decimals, capped to max precision
+                        _strnr = format(nr, ".%sf"%self.maxprecision).rstrip("0")
+                        decimals[i] = max(( len(_strnr.split(".")[1]), decimals[i] ))
+                except (ValueError,TypeError):
+                    # but turn to text if any of the cells cannot be made to float bc they are txt
+                    types[i] = "C"
+                    _strnr = value if isinstance(value, str) else str(value)
+            if len(_strnr) > lengths[i]:
+                lengths[i] = len(_strnr)
+
+    def fieldtypes(self):
+        """Returns the detected (fieldtype, func, fieldlen, decimals) tuple of each field,
+        where func converts a value to be written to the field.
+        """
+        return [_fieldtype(*spec) for spec in zip(self.types, self.lengths, self.decimals)]
+
+def _fieldtype(fieldtype, fieldlen, decimals):
+    # returns a (fieldtype, func, fieldlen, decimals) tuple, where func converts a value to be written to the field
+    if fieldtype == "N" and decimals == 0:
+        func = lambda v: "" if is_missing(v) else int(float(v))
+    elif fieldtype in ("N","F"):
+        func = lambda v: "" if is_missing(v) else float(v)
+    else:
+        func = lambda v: v #encoding are handled later
+    return (fieldtype,func,fieldlen,decimals)
+
+def detect_fieldtypes(fields, rows, maxprecision=12):
+    """Detects and returns the (fieldtype, func, fieldlen, decimals) tuple of each field
+    in a single pass over the rows. See FieldTypeDetector. 
+    """
+    detector = FieldTypeDetector(fields, maxprecision)
+    for row in rows:
+        detector.update(row)
+    return detector.fieldtypes()
+
+def parse_fieldtypes(fields, fieldtypes):
+    """Returns the (fieldtype, func, fieldlen, decimals) tuple of each field from user-given field types.
+
+    Args:
+        fields: List of field names.
+        fieldtypes: The field type of each field, either as a list in the same order as the fields
+            or as a dict of field names to field types. Each field type is either a (fieldtype, fieldlen, decimals)
+            tuple, or just the fieldtype letter as used by the shapefile format, ie "N" for integers, 
+            "F" for floats, or "C" for text, in which case default lengths and decimals are used.
+    """
+    if isinstance(fieldtypes, dict):
+        missing = [field for field in fields if field not in fieldtypes]
+        if missing:
+            raise Exception("The given fieldtypes are missing the following fields: {}".format(missing))
+        fieldtypes = [fieldtypes[field] for field in fields]
+    if len(fieldtypes) != len(fields):
+        raise Exception("The number of given fieldtypes must be the same as the number of fields")
+    
+    defaults = {"N": (18,0), "F": (19,8), "C": (254,0)}
+    parsed = []
+    for spec in fieldtypes:
+        if isinstance(spec, basestring):
+            if spec not in defaults:
+                raise Exception("Fieldtype must be one of N, F, or C, not {}".format(repr(spec)))
+            spec = (spec,) + defaults[spec]
+        parsed.append(_fieldtype(*spec))
+    return parsed
+
+def _spill(rows, geometries):
+    # writes the rows and geometries to a temporary file while they are being iterated,
+    # returns a function for reading them back from the file once exhausted
+    import pickle
+    import tempfile
+    fileobj = tempfile.TemporaryFile()
+    def write():
+        for row,geom in zip(rows, geometries):
+            row = list(row)
+            pickle.dump((row,geom), fileobj, pickle.HIGHEST_PROTOCOL)
+            yield row
+    def read():
+        fileobj.seek(0)
+        try:
+            while True:
+                yield pickle.load(fileobj)
+        except EOFError:
+            pass
+        finally:
+            fileobj.close()
+    return write(), read
+
+def _lockstep(rowgeoms):
+    # splits an iterable of row-geometry pairs into rows and geometries to be iterated in lockstep,
+    # where the geometry of each row is handed over when the row is read
+    current = dict()
+    def iterrows():
+        for row,geom in rowgeoms:
+            current["geometry"] = geom
+            yield row
+    def itergeoms():
+        while True:
+            yield current.pop("geometry")
+    return iterrows(), itergeoms()
+
+def prepare_fieldtypes(fields, rows, geometries, fieldtypes=None, sample=None, spill=False, maxprecision=12):
+    """Determines the field types needed to save the given rows, and returns the fieldtypes along with the rows and 
+    geometries to be written. 
+
+    The rows are only read once if possible. The rows and geometries are read once for detecting the fieldtypes
+    and once for writing if they can be iterated multiple times, and otherwise they are spilled to a temporary file 
+    while detecting so that they can be read back for writing. 
+    
+    Args:
+        fields: List of field names.
+        rows: List or iterable of rows.
+        geometries: List or iterable of geometries in the same order as the rows.
+        fieldtypes (optional): The field types to use instead of detecting them, see parse_fieldtypes(). 
+            The rows are then only iterated once. 
+        sample (optional): Only detect the field types from the first n rows, which are held in memory, 
+            so that all the rows are only iterated once. Values in the remaining rows must then fit the detected types. 
+        spill (optional): If True, always spills the rows and geometries to a temporary file when detecting
+            instead of iterating them twice, eg when iterating them is costly. 
+        maxprecision (optional): Max number of decimals to store for floats.
+    """
+    if fieldtypes:
+        return parse_fieldtypes(fields, fieldtypes), rows, geometries
+
+    if sample:
+        rowgeoms = zip(rows, geometries)
+        samples = [(list(row),geom) for row,geom in itertools.islice(rowgeoms, sample)]
+        fieldtypes = detect_fieldtypes(fields, (row for row,geom in samples), maxprecision)
+        rows,geometries = _lockstep(itertools.chain(samples, rowgeoms))
+        return fieldtypes, rows, geometries
+
+    if spill or iter(rows) is rows or iter(geometries) is geometries:
+        # iterators can only be read once, so store them in a temporary file while detecting
+        rowiter,read = _spill(rows, geometries)
+        fieldtypes = detect_fieldtypes(fields, rowiter, maxprecision)
+        rows,geometries = _lockstep(read())
+        return fieldtypes, rows, geometries
+
+    fieldtypes = detect_fieldtypes(fields, rows, maxprecision)
+    return fieldtypes, rows, geometries
+
+def to_file(fields, rows, geometries, filepath, encoding="utf8", maxprecision=12, fieldtypes=None, sample=None, spill=False, **kwargs):
+    """Saves the given fields, rows, and geometries to a file, based on the filepath extension.
+
+    Args:
+        fields: List of field names.
+        rows: List or iterable of rows. 
+        geometries: List or iterable of GeoJSON geometries or None, in the same order as the rows. 
+        filepath: Filepath to save to.
+        encoding (optional): Text encoding of the file.
+        maxprecision (optional): Max number of decimals to store for floats.
+        fieldtypes (optional): Explicit field types, instead of detecting them from the values (shapefile and GeoJSON only). 
+            See prepare_fieldtypes().
+        sample (optional): Detect field types from the first n rows only (shapefile and GeoJSON only). 
+            See prepare_fieldtypes().
+        spill (optional): Spill the rows to a temporary file when detecting field types instead of 
+            reading them twice (shapefile and GeoJSON only). See prepare_fieldtypes().
+        **kwargs: Other format-specific options.
+    """
 
     def encode(value):
-        if isinstance(value, int):
-            # ints are kept as ints
-            return value
-        elif isinstance(value, float):
+        if isinstance(value, float):
             if value.is_integer():
                 return int(value)
             elif math.isnan(value):
@@ -35,76 +247,17 @@ def to_file(fields, rows, geometries, filepath, encoding="utf8", maxprecision=12
             else:
                 # floats are rounded
                 return round(value, maxprecision)
-        elif isinstance(value, str):
-            # unicode is custom encoded into bytestring
-            return value.encode(encoding)
-        elif value is None:
+        elif value is None or isinstance(value, (int,str)):
             return value
         else:
             # brute force anything else to string representation
-            return bytes(value)
-
-    def detect_fieldtypes(fields, rows):
-        # TODO: allow other data types such as dates etc...
-        # set fields with correct fieldtype
-        fieldtypes = []
-        for fieldindex,fieldname in enumerate(fields):
-            fieldlen = 1
-            decimals = 0
-            fieldtype = "N" # assume number until proven otherwise
-            for row in rows:
-                value = row[fieldindex]
-                
-                if is_missing(value):
-                    # empty value, so just keep assuming same type
-                    pass
-                
-                else:
-                    try:
-                        # make nr fieldtype if content can be made into nr
-
-                        # convert to nr or throw exception if text
-                        value = float(value)
-
-                        # rare special case where text is 'nan', is a valid input to float, so raise exception to treat as text
-                        if math.isnan(value):
-                            raise ValueError()
-
-                        # TODO: also how to handle inf? math.isinf(). Treat as text or nr? 
-                        if math.isinf(value):
-                            raise NotImplementedError("Saving infinity values not yet implemented")
-
-                        # detect nr type
-                        if value.is_integer():
-                            _strnr = bytes(value)
-                        else:
-                            # get max decimals, capped to max precision
-                            _strnr = format(value, ".%sf"%maxprecision).rstrip("0")
-                            decimals = max(( len(_strnr.split(".")[1]), decimals ))
-                        fieldlen = max(( len(_strnr), fieldlen ))
-                    except ValueError:
-                        # but turn to text if any of the cells cannot be made to float bc they are txt
-                        fieldtype = "C"
-                        value = value if isinstance(value, str) else bytes(value)
-                        fieldlen = max(( len(value), fieldlen ))
-                        
-            if fieldtype == "N" and decimals == 0:
-                fieldlen -= 2 # bc above we measure lengths for ints as if they were floats, ie with an additional ".0"
-                func = lambda v: "" if is_missing(v) else int(float(v))
-            elif fieldtype == "N" and decimals:
-                func = lambda v: "" if is_missing(v) else float(v)
-            elif fieldtype == "C":
-                func = lambda v: v #encoding are handled later
-            else:
-                raise Exception("Unexpected bug: Detected field should be always N or C")
-            fieldtypes.append( (fieldtype,func,fieldlen,decimals) )
-        return fieldtypes
+            return str(value)
     
     # shapefile
     if filepath.endswith(".shp"):
         shapewriter = pyshp.Writer(filepath, encoding='utf8')
 
-        fieldtypes = detect_fieldtypes(fields,rows)
+        fieldtypes,rows,geometries = prepare_fieldtypes(fields, rows, geometries, fieldtypes, sample, spill, maxprecision)
         
         # set fields with correct fieldtype
         for fieldname,(fieldtype,func,fieldlen,decimals) in zip(fields, fieldtypes):
@@ -113,7 +266,10 @@ def to_file(fields, rows, geometries, filepath, encoding="utf8", maxprecision=12
         
         # iterate through original shapes
         for row,geoj in zip(rows, geometries):
-            shapewriter.shape(geoj)
+            if geoj:
+                shapewriter.shape(geoj)
+            else:
+                shapewriter.null()
             row = [func(value) for (typ,func,length,deci),value in zip(fieldtypes,row)]
             shapewriter.record(*row)
             
@@ -121,30 +277,25 @@ def to_file(fields, rows, geometries, filepath, encoding="utf8", maxprecision=12
         shapewriter.close()
 
     # geojson file
-    elif filepath.endswith((".geojson",".json")):
-        geojwriter = pygeoj.new()
-        fieldtypes = detect_fieldtypes(fields,rows)
-        for row,geom in zip(rows,geometries):
-            # encode row values
-            row = (func(value) for (typ,func,length,deci),value in zip(fieldtypes,row))
-            row = (encode(value) for value in row)
-            rowdict = dict(zip(fields, row))
-            # create and add feature
-            geojwriter.add_feature(properties=rowdict,
-                                   geometry=geom)
-        # save
-        geojwriter.save(filepath, encoding=encoding)
+    elif filepath.endswith((".geojson",".json",".geojsonl",".geojsons",".geojsonseq")):
+        from .fileformats.geojson import GeoJSONWriter
+        fieldtypes,rows,geometries = prepare_fieldtypes(fields, rows, geometries, fieldtypes, sample, spill, maxprecision)
+        with GeoJSONWriter(filepath, fields, encoding=encoding) as writer:
+            for row,geom in zip(rows,geometries):
+                row = [None if typ == "N" and is_missing(value) else func(value)
+                       for (typ,func,length,deci),value in zip(fieldtypes,row)]
+                writer.write(row, geom)
 
     # normal table file without geometry
     elif filepath.endswith((".txt",".csv")):
         import csv
         
         # TODO: Add option of saving geoms as strings in separate fields
-        with open(filepath, "wb") as fileobj:
+        with io.open(filepath, "w", encoding=encoding, newline="") as fileobj:
             csvopts = dict()
             csvopts["delimiter"] = kwargs.get("delimiter", ";") # tab is best for automatically opening in excel...
             writer = csv.writer(fileobj, **csvopts)
-            writer.writerow([f.encode(encoding) for f in fields])
+            writer.writerow(fields)
             for row,geometry in zip(rows, geometries):
                 writer.writerow([encode(val) for val in row])
 
@@ -165,6 +316,11 @@ def to_file(fields, rows, geometries, filepath, encoding="utf8", maxprecision=12
             # save
             wb.save(filepath)
             
+    elif filepath.endswith(".pgc"):
+        from .fileformats import columnar
+        storage = columnar.build_storage(fields, rows, geometries)
+        columnar.write(filepath, fields, storage, crs=kwargs.get("crs"), type=kwargs.get("type"))
+
     else:
         raise Exception("Could not save the vector data to the given filepath: the filetype extension is either missing or not supported")
 
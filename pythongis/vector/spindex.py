@@ -1,7 +1,13 @@
 
 # various spatial index classes
 
+import os
+import json
+
+from ._helpers import bbox_overlaps
+
 class Rtree(object):
+    type = 'rtree'
 
     def __init__(self, **kwargs):
         backend = kwargs.pop('backend', None)
@@ -14,19 +20,47 @@ class Rtree(object):
             self._backend = _RtreeBackend(**kwargs)
         elif backend == 'pyrtree':
             self._backend = _PyrTreeBackend(**kwargs)
+        elif backend == 'packed':
+            self._backend = _PackedRtreeBackend(**kwargs)
         else:
             raise Exception('No such Rtree backend: {}'.format(backend))
 
     def insert(self, id, bbox):
         self._backend.insert(id, bbox)
 
+    def delete(self, id):
+        """Removes an item from the index."""
+        self._backend.delete(id)
+
+    def load(self, items):
+        """Inserts many (id, bbox) items at once, allowing bulk loading backends to build the tree faster."""
+        if hasattr(self._backend, 'load'):
+            self._backend.load(items)
+        else:
+            for id,bbox in items:
+                self._backend.insert(id, bbox)
+
     def intersects(self, bbox):
         return self._backend.intersects(bbox)
 
-    def nearest(self, bbox, **kwargs):
-        return self._backend.nearest(bbox, **kwargs)
+    def intersects_many(self, bboxes):
+        """Returns a list of the ids of the items intersecting each of the given bboxes, answering all the queries at once
+        where the backend supports it.
+        """
+        return self._backend.intersects_many(bboxes)
+
+    def nearest(self, bbox, num_results=1, radius=None):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance.
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        return self._backend.nearest(bbox, num_results=num_results, radius=radius)
 
 class QuadTree(object):
+    type = 'quadtree'
 
     def __init__(self, **kwargs):
         backend = kwargs.pop('backend', None)
@@ -38,64 +72,893 @@ class QuadTree(object):
     def insert(self, id, bbox):
         self._backend.insert(id, bbox)
 
+    def delete(self, id):
+        """Removes an item from the index."""
+        self._backend.delete(id)
+
+    def load(self, items):
+        """Inserts many (id, bbox) items at once."""
+        for id,bbox in items:
+            self._backend.insert(id, bbox)
+
     def intersects(self, bbox):
         return self._backend.intersects(bbox)
 
-    def nearest(self, bbox, **kwargs):
-        return self._backend.nearest(bbox, **kwargs)
+    def intersects_many(self, bboxes):
+        """Returns a list of the ids of the items intersecting each of the given bboxes, answering all the queries at once
+        where the backend supports it.
+        """
+        return self._backend.intersects_many(bboxes)
+
+    def nearest(self, bbox, num_results=1, radius=None):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance.
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        return self._backend.nearest(bbox, num_results=num_results, radius=radius)
+
+class GridIndex(object):
+    """
+    Spatial index specialised for point data, that bins the points into a uniform grid of cells. 
+    Only works for point geometries, ie where each bbox has the same min and max coordinates. 
+    
+    In addition to the usual index methods, it can answer many bbox or distance queries 
+    at once in a single vectorized operation, see intersects_many() and within_distance_many(). 
+    """
+    type = 'grid'
+
+    def __init__(self, **kwargs):
+        backend = kwargs.pop('backend', None)
+        if backend is None or backend == 'grid':
+            self._backend = _GridBackend(**kwargs)
+        else:
+            raise Exception('No such GridIndex backend: {}'.format(backend))
+
+    def insert(self, id, bbox):
+        self._backend.insert(id, bbox)
+
+    def delete(self, id):
+        """Removes an item from the index."""
+        self._backend.delete(id)
+
+    def load(self, items):
+        """Inserts many (id, bbox) items at once, building the grid in one go."""
+        self._backend.load(items)
+
+    def build(self, ids, bboxes):
+        """Builds the grid from a sequence or array of ids and a corresponding (n,4) array of point bboxes, 
+        replacing any existing items. Faster than load() for large numpy arrays. 
+        """
+        self._backend.build(ids, bboxes)
+
+    def intersects(self, bbox):
+        return self._backend.intersects(bbox)
+
+    def intersects_many(self, bboxes):
+        """Returns a list of the ids of the points intersecting each of the given bboxes."""
+        return self._backend.intersects_many(bboxes)
+
+    def within_distance_many(self, points, radius):
+        """Returns a list of the ids of the points within the given radius of each of the given x,y points.
+        The radius is either a single number or one for each point. 
+        """
+        return self._backend.within_distance_many(points, radius)
+
+    def nearest(self, bbox, num_results=1, radius=None):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance.
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        return self._backend.nearest(bbox, num_results=num_results, radius=radius)
+
+# persistent index files
+
+def index_path(filepath):
+    """Returns the filepath of the sidecar spatial index file for a source file."""
+    return filepath + ".pgi"
+
+def index_key(filepath, count, options=None):
+    """Returns the key that identifies a spatial index built for a source file, based on its path, modification time, 
+    the number of features loaded from it, and the options it was loaded with.
+    """
+    stat = os.stat(filepath)
+    key = dict(source=os.path.abspath(filepath),
+               mtime=stat.st_mtime,
+               count=count,
+               options=sorted(((k,repr(v)) for k,v in (options or {}).items())))
+    # same form as when read back from json
+    return json.loads(json.dumps(key))
+
+def save_index(index, filepath, key):
+    """Saves a spatial index to a file along with the key that identifies what it was built for. 
+    The index is saved as a json header followed by plain numpy arrays of its ids and bboxes (or for the packed 
+    and grid backends, the arrays of the built index), so loading it never runs any code from the file. 
+    Only indexes whose ids are all integers or all strings can be saved, and not the 'rtree' (libspatialindex) backend.
+    """
+    import numpy as np
+    options,arrays = index._backend._dump()
+    arrays = [np.asarray(arr) for arr in arrays]
+    for i,arr in enumerate(arrays):
+        if arr.dtype == object:
+            # ids of a single type can be stored as a plain array
+            values = arr.tolist()
+            plain = np.asarray(values)
+            if plain.dtype == object or plain.tolist() != values:
+                raise Exception("Only spatial indexes whose ids are all integers or all strings can be saved")
+            arrays[i] = plain
+    header = dict(key=key, type=index.type, backend=index._backend.name, options=options, arrays=len(arrays))
+    with open(filepath, "wb") as fileobj:
+        # the header is written separately so it can be checked without loading the index
+        fileobj.write((json.dumps(header) + "\n").encode("utf8"))
+        for arr in arrays:
+            np.save(fileobj, arr, allow_pickle=False)
+
+def load_index(filepath, key, type=None, backend=None):
+    """Loads and returns a spatial index saved with save_index(), if the file exists and was saved with the same key, 
+    and with the given type and backend if specified. Returns None otherwise.
+    """
+    import numpy as np
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, "rb") as fileobj:
+        try:
+            header = json.loads(fileobj.readline().decode("utf8"))
+        except ValueError:
+            return None
+        if header["key"] != key:
+            return None
+        if (type and type != header["type"]) or (backend and backend != header["backend"]):
+            return None
+        arrays = [np.load(fileobj, allow_pickle=False) for _ in range(header["arrays"])]
+    cls = dict(rtree=Rtree, quadtree=QuadTree, grid=GridIndex)[header["type"]]
+    index = cls(backend=header["backend"], **header["options"])
+    index._backend._restore(arrays)
+    return index
+
+# nearest search
+
+def bbox_distance(bbox, other):
+    """Returns the shortest distance between two xmin,ymin,xmax,ymax bboxes, or 0 if they overlap."""
+    dx = max(0, other[0] - bbox[2], bbox[0] - other[2])
+    dy = max(0, other[1] - bbox[3], bbox[1] - other[3])
+    return (dx*dx + dy*dy) ** 0.5
+
+def best_first_nearest(expand, root, num_results=None, radius=None):
+    """
+    Yields (id, distance) pairs of the items of a tree of nodes in order of increasing distance, by best-first search. 
+    Nodes and items are kept in a single priority queue, and the nearest one is always processed next, so the search 
+    stops as soon as enough items are found, or the next node is farther away than the radius. 
+
+    Args:
+        expand: Function that takes a node and returns a list of (distance, node) pairs of its child nodes, and a list
+            of (distance, id) pairs of its items. Node distances must never be more than the distance of any item below
+            them, while item distances must be exact. Items found more than once are only yielded the first time. 
+        root: The root node of the tree. 
+        num_results (optional): Max number of results, defaults to all. 
+        radius (optional): Max distance of results, defaults to no limit. 
+    """
+    import heapq
+    # queue of (distance, counter, isitem, node or id), where the counter avoids comparing the nodes
+    queue = [(0, 0, False, root)]
+    counter = 1
+    found = set()
+    while queue:
+        dist,_,isitem,obj = heapq.heappop(queue)
+        if radius is not None and dist > radius:
+            return
+        if isitem:
+            if obj not in found:
+                found.add(obj)
+                yield obj, dist
+                if num_results and len(found) >= num_results:
+                    return
+        else:
+            nodes,items = expand(obj)
+            for childdist,node in nodes:
+                heapq.heappush(queue, (childdist, counter, False, node))
+                counter += 1
+            for itemdist,id in items:
+                if id not in found:
+                    heapq.heappush(queue, (itemdist, counter, True, id))
+                    counter += 1
+
+def expanding_nearest(query, bbox, bounds, count, num_results=None, radius=None):
+    """
+    Yields (id, distance) pairs of the indexed items whose bboxes are nearest to the given bbox, 
+    in order of increasing bbox distance, for any index that can only answer intersection queries. 
+    Used as a fallback by indexes whose nodes can't be searched directly, see best_first_nearest(). 
+
+    Searches increasingly larger windows around the bbox, each twice the distance of the previous, 
+    and only yields the items within the distance of the current window. Items found beyond it are
+    left for a later window, which guarantees that items are yielded strictly in order of distance. 
+
+    Args:
+        query: Function that takes a bbox and returns (id, bbox) pairs of all items intersecting it. 
+        bbox: The bbox to search from. 
+        bounds: The total bounds of all items in the index. 
+        count: The number of items in the index. 
+        num_results (optional): Max number of results, defaults to all. 
+        radius (optional): Max distance of results, defaults to no limit. 
+    """
+    if not count or not bounds:
+        return
+    xmin,ymin,xmax,ymax = bbox
+    width,height = bounds[2]-bounds[0], bounds[3]-bounds[1]
+
+    # no item can be farther than this
+    maxdist = bbox_distance(bbox, bounds) + (width*width + height*height) ** 0.5
+    if radius is not None:
+        maxdist = min(maxdist, radius)
+
+    # begin with a window that should contain about one item if they were evenly distributed
+    step = max(width, height) / float(count) ** 0.5
+    dist = min(bbox_distance(bbox, bounds) + step, maxdist)
+    found = set()
+    while True:
+        window = [xmin-dist, ymin-dist, xmax+dist, ymax+dist]
+        candidates = dict()
+        for id,itembbox in query(window):
+            if id not in found:
+                itemdist = bbox_distance(bbox, itembbox)
+                if itemdist <= dist:
+                    candidates[id] = itemdist
+        for id,itemdist in sorted(candidates.items(), key=lambda pair: pair[1]):
+            yield id, itemdist
+            found.add(id)
+            if num_results and len(found) >= num_results:
+                return
+        if dist >= maxdist:
+            return
+        dist = min(dist * 2 or maxdist, maxdist)
 
 # backends
 
-class _RtreeBackend(object):
+class _Backend(object):
+    # base class that keeps track of the bbox of each item, for deleting them and measuring distances
+
+    def __init__(self):
+        self._bboxes = dict()
+
+    def _add(self, id, bbox):
+        bbox = tuple(bbox)
+        self._bboxes[id] = bbox
+        return bbox
+
+    def intersects_many(self, bboxes):
+        return [list(self.intersects(bbox)) for bbox in bboxes]
+
+    def _dump(self):
+        # returns the options to create the backend again, and arrays of the ids and bboxes of all items
+        if self._bboxes:
+            ids,bboxes = zip(*self._bboxes.items())
+        else:
+            ids,bboxes = [],[]
+        return self._options, [_id_array(ids), bboxes]
+
+    def _restore(self, arrays):
+        ids,bboxes = arrays
+        for id,bbox in zip(ids.tolist(), bboxes.reshape((-1,4)).tolist()):
+            self.insert(id, bbox)
+
+class _RtreeBackend(_Backend):
+    name = 'rtree'
 
     def __init__(self, **kwargs):
         import rtree
+        _Backend.__init__(self)
         self._backend = rtree.index.Index(**kwargs)
 
+    def _dump(self):
+        raise Exception("The 'rtree' (libspatialindex) backend can't be saved")
+
     def insert(self, id, bbox):
+        bbox = self._add(id, bbox)
         self._backend.insert(id, bbox)
 
+    def delete(self, id):
+        bbox = self._bboxes.pop(id, None)
+        if bbox:
+            self._backend.delete(id, bbox)
+
     def intersects(self, bbox):
         return self._backend.intersection(bbox)
 
-    def nearest(self, bbox, **kwargs):
-        return self._backend.nearest(bbox, **kwargs)
+    def nearest(self, bbox, num_results=1, radius=None, **kwargs):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance, 
+        using the nearest search of libspatialindex. 
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        bboxes = self._bboxes
+        if not bboxes:
+            return
+        found = 0
+        # libspatialindex returns all items tied with the last one, so the count is checked here too
+        for id in self._backend.nearest(tuple(bbox), num_results or len(bboxes)):
+            if radius is not None and bbox_distance(bbox, bboxes[id]) > radius:
+                return
+            yield id
+            found += 1
+            if num_results and found >= num_results:
+                return
 
-class _PyrTreeBackend(object):
+class _PyrTreeBackend(_Backend):
+    name = 'pyrtree'
 
     def __init__(self, **kwargs):
         import pyrtree
+        _Backend.__init__(self)
+        self._options = kwargs
         self._backend = pyrtree.RTree(**kwargs)
         self._new_rect = pyrtree.Rect
 
     def insert(self, id, bbox):
+        bbox = self._add(id, bbox)
         rect = self._new_rect(*bbox)
-        self._backend.insert(id, rect)
+        # store the bbox along with the id, to tell if the item has since been deleted or changed
+        self._backend.insert((id, bbox), rect)
+
+    def delete(self, id):
+        # pyrtree can't delete items, so they are only forgotten, and skipped when found
+        self._bboxes.pop(id, None)
 
     def intersects(self, bbox):
         rect = self._new_rect(*bbox)
-        
-        res = (node.leaf_obj() for node in self._backend.query_rect(rect)
-               if node.is_leaf())
-        return res
+        bboxes = self._bboxes
+        seen = set()
+        for node in self._backend.query_rect(rect):
+            if node.is_leaf():
+                id,itembbox = node.leaf_obj()
+                if bboxes.get(id) == itembbox and id not in seen:
+                    seen.add(id)
+                    yield id
+
+    def nearest(self, bbox, num_results=1, radius=None, **kwargs):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance, 
+        by best-first search of the nodes of the tree. 
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        bboxes = self._bboxes
 
-    def nearest(self, bbox, **kwargs):
-        raise NotImplemented
+        def expand(node):
+            nodes,items = [],[]
+            for child in node.children():
+                if child.is_leaf():
+                    id,itembbox = child.leaf_obj()
+                    # skip items that have since been deleted or changed
+                    if bboxes.get(id) == itembbox:
+                        items.append((bbox_distance(bbox, itembbox), id))
+                else:
+                    # pyrtree moves the same cursor object to each child in turn, so a copy is queued
+                    rect = child.rect
+                    nodes.append((bbox_distance(bbox, (rect.x, rect.y, rect.xx, rect.yy)), child.lift()))
+            return nodes, items
 
-class _PyqTreeBackend(object):
+        for id,dist in best_first_nearest(expand, self._backend.cursor, num_results, radius):
+            yield id
+
+class _PyqTreeBackend(_Backend):
+    name = 'pyqtree'
 
     def __init__(self, **kwargs):
         import pyqtree
+        _Backend.__init__(self)
+        self._options = kwargs
         self._backend = pyqtree.Index(**kwargs)
 
     def insert(self, id, bbox):
+        bbox = self._add(id, bbox)
         self._backend.insert(id, bbox)
 
+    def delete(self, id):
+        bbox = self._bboxes.pop(id, None)
+        if bbox:
+            self._backend.remove(id, bbox)
+
     def intersects(self, bbox):
         return self._backend.intersect(bbox)
 
-    def nearest(self, bbox, **kwargs):
-        raise NotImplemented
+    def nearest(self, bbox, num_results=1, radius=None, **kwargs):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance, 
+        by best-first search of the quads of the tree. 
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        inf = float('inf')
+
+        # each quad is searched along with the region it covers, bounded by the centers of its parents. 
+        # items are stored in every quad whose region they overlap, or in a parent quad if they span its center, 
+        # so the nearest point of an item is always in the region of a quad that holds it, 
+        # which makes the region distance a lower bound of the distance of the items found there. 
+        def expand(node):
+            quad,(xmin,ymin,xmax,ymax) = node
+            items = [(bbox_distance(bbox, item.rect), item.item) for item in quad.nodes]
+            nodes = []
+            if quad.children:
+                cx,cy = quad.center
+                regions = [(xmin,ymin,cx,cy), (xmin,cy,cx,ymax), (cx,ymin,xmax,cy), (cx,cy,xmax,ymax)]
+                for child,region in zip(quad.children, regions):
+                    nodes.append((bbox_distance(bbox, region), (child, region)))
+            return nodes, items
+
+        root = (self._backend, (-inf,-inf,inf,inf))
+        for id,dist in best_first_nearest(expand, root, num_results, radius):
+            yield id
+
+class _StaticBackend(object):
+    # base class for indexes that are built all at once and can't be changed afterwards, 
+    # where subclasses implement build(ids, bboxes), and _items() to return the ids and bboxes they were built with. 
+    # items inserted since the index was built are kept aside in a small dict that is searched along with the index, 
+    # and deleted items are only marked as such and skipped. once either grows larger than the square root of the 
+    # number of items, the index is built again, so that the cost of rebuilding is spread across many edits. 
+    _min_rebuild = 256
+
+    def _reset(self):
+        self._pending = dict() # items inserted since the index was built
+        self._deleted = set() # ids of items in the index that have since been deleted
+
+    def insert(self, id, bbox):
+        self._pending[id] = tuple(bbox)
+        self._check_rebuild()
+
+    def delete(self, id):
+        if self._pending.pop(id, None) is None:
+            self._deleted.add(id)
+            self._check_rebuild()
+
+    def load(self, items):
+        for id,bbox in items:
+            self._pending[id] = tuple(bbox)
+        self._rebuild()
+
+    def _check_rebuild(self):
+        limit = max(self._min_rebuild, len(self._ids) ** 0.5)
+        if len(self._pending) > limit or len(self._deleted) > limit:
+            self._rebuild()
+
+    def _rebuild(self):
+        # builds the index again with all current items
+        if self._pending or self._deleted:
+            deleted = self._deleted
+            items = [(id,bbox) for id,bbox in zip(*self._items()) if id not in deleted]
+            items.extend(self._pending.items())
+            if items:
+                ids,bboxes = zip(*items)
+            else:
+                ids,bboxes = [],[]
+            self.build(ids, bboxes)
+
+    def __len__(self):
+        self._rebuild()
+        return len(self._ids)
+
+    def _pending_intersects(self, bbox):
+        xmin,ymin,xmax,ymax = bbox
+        return [id for id,(x1,y1,x2,y2) in self._pending.items() 
+                if x1 <= xmax and x2 >= xmin and y1 <= ymax and y2 >= ymin]
+
+    def _skip_deleted(self, ids):
+        if self._deleted:
+            deleted = self._deleted
+            ids = [id for id in ids if id not in deleted]
+        return ids
+
+    def _split(self, query, positions, nqueries):
+        # takes the query number and item position of each match, sorted by query, and returns the list of ids of each query
+        import numpy as np
+        if not nqueries:
+            return []
+        counts = np.bincount(query, minlength=nqueries)
+        results = [ids.tolist() for ids in np.split(self._ids[positions], np.cumsum(counts)[:-1])]
+        if self._deleted:
+            results = [self._skip_deleted(ids) for ids in results]
+        return results
+
+class _PackedRtreeBackend(_StaticBackend):
+    """
+    Static R-tree, bulk loaded with the Sort-Tile-Recursive (STR) algorithm and packed into flat numpy arrays,
+    without any dependencies other than numpy. 
+
+    The items are sorted into tiles by their center x and then y coordinates, and consecutive groups of node_capacity
+    items make up the leaf nodes, which are grouped the same way into parent nodes up to a single root node. 
+    All nodes are stored level by level in a single array of bboxes, so that the children of a node are found 
+    by position alone, and no node objects are needed. Queries process one tree level at a time, testing all 
+    the candidate children of that level at once. 
+
+    Since the tree is static, items inserted after it was built are kept aside in a small list that is searched
+    along with the tree, and deleted items are only marked as such and skipped, until the tree is built again. 
+
+    Args:
+        node_capacity (optional): Max number of children per node.
+    """
+
+    name = 'packed'
+
+    def __init__(self, node_capacity=16):
+        import numpy as np
+        self.node_capacity = node_capacity
+        self.build([], np.empty((0,4)))
+
+    def build(self, ids, bboxes):
+        """Builds the tree from a sequence of ids and a corresponding sequence or (n,4) array of xmin,ymin,xmax,ymax bboxes,
+        replacing any existing items.
+        """
+        import numpy as np
+        M = self.node_capacity
+        ids = _id_array(ids)
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1,4))
+        n = len(bboxes)
+
+        # sort the items into STR order
+        if n:
+            P = -(-n // M) # nr of leaf nodes
+            S = int(np.ceil(np.sqrt(P))) # nr of vertical slices
+            cx = bboxes[:,0] + bboxes[:,2]
+            cy = bboxes[:,1] + bboxes[:,3]
+            xrank = np.empty(n, dtype=np.intp)
+            xrank[np.argsort(cx, kind='stable')] = np.arange(n)
+            slices = xrank // (S * M)
+            order = np.lexsort((cy, slices))
+            ids = ids[order]
+            bboxes = bboxes[order]
+
+        # group consecutive nodes into parents, level by level, from the items up to the root
+        levels = [bboxes]
+        while len(levels[-1]) > 1:
+            children = levels[-1]
+            starts = np.arange(0, len(children), M)
+            parents = np.empty((len(starts),4))
+            parents[:,0] = np.minimum.reduceat(children[:,0], starts)
+            parents[:,1] = np.minimum.reduceat(children[:,1], starts)
+            parents[:,2] = np.maximum.reduceat(children[:,2], starts)
+            parents[:,3] = np.maximum.reduceat(children[:,3], starts)
+            levels.append(parents)
+
+        self._ids = ids
+        self._levels = levels
+        self._reset()
+
+    def _items(self):
+        return self._ids.tolist(), self._levels[0].tolist()
+
+    def _dump(self):
+        self._rebuild()
+        return dict(node_capacity=self.node_capacity), [self._ids] + self._levels
+
+    def _restore(self, arrays):
+        self._ids = arrays[0]
+        self._levels = arrays[1:]
+        self._reset()
+
+    def intersects(self, bbox):
+        import numpy as np
+        xmin,ymin,xmax,ymax = bbox
+        results = self._pending_intersects(bbox)
+        if not len(self._ids):
+            return results
+        M = self.node_capacity
+        xmin,ymin,xmax,ymax = bbox
+        levels = self._levels
+        
+        # start with the top level, then test the children of each hit, down to the items
+        candidates = np.arange(len(levels[-1]))
+        for level in range(len(levels)-1, -1, -1):
+            boxes = levels[level]
+            hits = candidates[(boxes[candidates,0] <= xmax) & (boxes[candidates,2] >= xmin) &
+                              (boxes[candidates,1] <= ymax) & (boxes[candidates,3] >= ymin)]
+            if level == 0 or not len(hits):
+                break
+            candidates = (hits[:,None] * M + np.arange(M)).ravel()
+            candidates = candidates[candidates < len(levels[level-1])]
+        return self._skip_deleted(self._ids[hits].tolist()) + results
+
+    def intersects_many(self, bboxes):
+        """Returns a list of the ids of the items intersecting each of the given bboxes. 
+        All the queries descend the tree together, as arrays of (query, node) pairs that are tested one level at a time. 
+        """
+        import numpy as np
+        M = self.node_capacity
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1,4))
+        levels = self._levels
+        if len(self._ids):
+            ntop = len(levels[-1])
+            query = np.repeat(np.arange(len(bboxes)), ntop)
+            node = np.tile(np.arange(ntop), len(bboxes))
+            for level in range(len(levels)-1, -1, -1):
+                boxes = levels[level][node]
+                qboxes = bboxes[query]
+                keep = ((boxes[:,0] <= qboxes[:,2]) & (boxes[:,2] >= qboxes[:,0]) & 
+                        (boxes[:,1] <= qboxes[:,3]) & (boxes[:,3] >= qboxes[:,1]))
+                query,node = query[keep],node[keep]
+                if level == 0 or not len(query):
+                    break
+                query = np.repeat(query, M)
+                node = (node[:,None] * M + np.arange(M)).ravel()
+                valid = node < len(levels[level-1])
+                query,node = query[valid],node[valid]
+            results = self._split(query, node, len(bboxes))
+        else:
+            results = [[] for _ in range(len(bboxes))]
+        if self._pending:
+            for bbox,ids in zip(bboxes.tolist(), results):
+                ids.extend(self._pending_intersects(bbox))
+        return results
+
+    def nearest(self, bbox, num_results=1, radius=None, **kwargs):
+        """Yields the ids of the items whose bboxes are nearest the given bbox, in order of increasing distance, 
+        by best-first search of the tree. Since the distance to a node is never more than the distance to any of its
+        items, the search stops as soon as the next node in the queue is farther away than the radius. 
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        import heapq
+        import numpy as np
+        M = self.node_capacity
+        xmin,ymin,xmax,ymax = bbox
+        levels = self._levels
+        deleted = self._deleted
+
+        def distances(boxes):
+            dx = np.maximum(0, np.maximum(boxes[:,0] - xmax, xmin - boxes[:,2]))
+            dy = np.maximum(0, np.maximum(boxes[:,1] - ymax, ymin - boxes[:,3]))
+            return np.hypot(dx, dy)
+
+        # queue of (distance, level, index), where the nearest node or item is always processed first
+        # items not yet in the tree are added as level -1, indexing into the pending items
+        top = len(levels) - 1
+        queue = [(dist,top,i) for i,dist in enumerate(distances(levels[top]).tolist())] if len(self._ids) else []
+        pending = list(self._pending.items())
+        queue.extend(((bbox_distance(bbox, itembbox),-1,i) for i,(id,itembbox) in enumerate(pending)))
+        heapq.heapify(queue)
+        found = 0
+        while queue and (not num_results or found < num_results):
+            dist,level,i = heapq.heappop(queue)
+            if radius is not None and dist > radius:
+                break
+            if level == -1:
+                yield pending[i][0]
+                found += 1
+            elif level == 0:
+                id = self._ids[i:i+1].tolist()[0]
+                if id not in deleted:
+                    yield id
+                    found += 1
+            else:
+                childlevel = level - 1
+                start = i * M
+                stop = min(start + M, len(levels[childlevel]))
+                for j,childdist in zip(range(start, stop), distances(levels[childlevel][start:stop]).tolist()):
+                    heapq.heappush(queue, (childdist,childlevel,j))
+
+class _GridBackend(_StaticBackend):
+    """
+    Uniform grid index for points, stored in flat numpy arrays. 
+    
+    The points are sorted by the row-major number of the grid cell they fall in, and an array of offsets
+    gives the position of the first point of each cell, so that each row of cells covered by a query is 
+    a single contiguous slice of the sorted points. Batch queries find the slices of all the queries at once, 
+    and then test all the candidate points at once. 
+
+    Args:
+        cellsize (optional): Width and height of each grid cell. Defaults to a size where each cell holds
+            about per_cell points if they were evenly distributed. 
+        per_cell (optional): Average number of points per cell, when determining the default cellsize. 
+    """
+
+    name = 'grid'
+
+    def __init__(self, cellsize=None, per_cell=4):
+        self.cellsize = cellsize
+        self.per_cell = per_cell
+        self.build([], [])
+
+    def build(self, ids, bboxes):
+        """Builds the grid from a sequence of ids and a corresponding sequence or (n,4) array of point bboxes, 
+        replacing any existing items.
+        """
+        import numpy as np
+        ids = _id_array(ids)
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1,4))
+        if np.any(bboxes[:,0] != bboxes[:,2]) or np.any(bboxes[:,1] != bboxes[:,3]):
+            raise Exception("The grid index only supports point geometries")
+        x,y = bboxes[:,0],bboxes[:,1]
+        n = len(ids)
+
+        # determine the grid
+        if n:
+            xmin,ymin,xmax,ymax = x.min(),y.min(),x.max(),y.max()
+        else:
+            xmin = ymin = xmax = ymax = 0.0
+        width,height = xmax-xmin, ymax-ymin
+        cellsize = self.cellsize
+        if not cellsize:
+            if width and height:
+                cellsize = (width * height * self.per_cell / float(n)) ** 0.5
+            else:
+                cellsize = max(width, height) * self.per_cell / float(n or 1)
+            cellsize = cellsize or 1.0
+        # dont allow many more cells than points
+        maxcells = 4 * n + 16
+        while (int(_cell(width, 0, cellsize)) + 1) * (int(_cell(height, 0, cellsize)) + 1) > maxcells:
+            cellsize *= 2
+        nx = int(_cell(width, 0, cellsize)) + 1
+        ny = int(_cell(height, 0, cellsize)) + 1
+
+        # sort the points by cell
+        cx = np.minimum(_cell(x, xmin, cellsize).astype(np.intp), nx-1)
+        cy = np.minimum(_cell(y, ymin, cellsize).astype(np.intp), ny-1)
+        cells = cy * nx + cx
+        order = np.argsort(cells, kind='stable')
+        counts = np.bincount(cells, minlength=nx*ny)
+        starts = np.zeros(nx*ny+1, dtype=np.intp)
+        np.cumsum(counts, out=starts[1:])
+
+        self._ids = ids[order]
+        self._x = x[order]
+        self._y = y[order]
+        self._starts = starts
+        self._origin = (xmin, ymin)
+        self._grid = (nx, ny, cellsize)
+        self._reset()
+
+    def insert(self, id, bbox):
+        if bbox[0] != bbox[2] or bbox[1] != bbox[3]:
+            raise Exception("The grid index only supports point geometries")
+        _StaticBackend.insert(self, id, bbox)
+
+    def _items(self):
+        x,y = self._x.tolist(),self._y.tolist()
+        return self._ids.tolist(), [(px,py,px,py) for px,py in zip(x,y)]
+
+    def _dump(self):
+        import numpy as np
+        self._rebuild()
+        nx,ny,cellsize = self._grid
+        grid = np.array([self._origin[0], self._origin[1], nx, ny, cellsize], dtype=np.float64)
+        return dict(cellsize=self.cellsize, per_cell=self.per_cell), [self._ids, self._x, self._y, self._starts, grid]
+
+    def _restore(self, arrays):
+        self._ids,self._x,self._y,self._starts,grid = arrays
+        xmin,ymin,nx,ny,cellsize = grid.tolist()
+        self._origin = (xmin, ymin)
+        self._grid = (int(nx), int(ny), cellsize)
+        self._reset()
+
+    def _candidates(self, bboxes):
+        # returns the query number and point position of all points in the cells covered by each of the bboxes
+        import numpy as np
+        nx,ny,cellsize = self._grid
+        x0,y0 = self._origin
+        starts = self._starts
+
+        # cell ranges of each query, skipping those outside the grid
+        ix0 = _cell(bboxes[:,0], x0, cellsize)
+        iy0 = _cell(bboxes[:,1], y0, cellsize)
+        ix1 = _cell(bboxes[:,2], x0, cellsize)
+        iy1 = _cell(bboxes[:,3], y0, cellsize)
+        valid = (ix1 >= 0) & (iy1 >= 0) & (ix0 <= nx-1) & (iy0 <= ny-1)
+        ix0 = np.clip(ix0, 0, nx-1).astype(np.intp)
+        iy0 = np.clip(iy0, 0, ny-1).astype(np.intp)
+        ix1 = np.clip(ix1, 0, nx-1).astype(np.intp)
+        iy1 = np.clip(iy1, 0, ny-1).astype(np.intp)
+
+        # expand to one contiguous slice of points for each row of cells of each query
+        nrows = np.where(valid, iy1 - iy0 + 1, 0)
+        query = np.repeat(np.arange(len(bboxes)), nrows)
+        row = iy0[query] + _ranks(nrows)
+        start = starts[row * nx + ix0[query]]
+        stop = starts[row * nx + ix1[query] + 1]
+
+        # expand to each point of the slices
+        lengths = stop - start
+        query = np.repeat(query, lengths)
+        positions = np.repeat(start, lengths) + _ranks(lengths)
+        return query, positions
+
+    def intersects_many(self, bboxes):
+        import numpy as np
+        bboxes = np.asarray(bboxes, dtype=np.float64).reshape((-1,4))
+        query,positions = self._candidates(bboxes)
+        x,y = self._x[positions],self._y[positions]
+        qboxes = bboxes[query]
+        keep = (x >= qboxes[:,0]) & (x <= qboxes[:,2]) & (y >= qboxes[:,1]) & (y <= qboxes[:,3])
+        results = self._split(query[keep], positions[keep], len(bboxes))
+        if self._pending:
+            for bbox,ids in zip(bboxes.tolist(), results):
+                ids.extend(self._pending_intersects(bbox))
+        return results
+
+    def intersects(self, bbox):
+        return self.intersects_many([bbox])[0]
+
+    def within_distance_many(self, points, radius):
+        import numpy as np
+        points = np.asarray(points, dtype=np.float64).reshape((-1,2))
+        radius = np.broadcast_to(np.asarray(radius, dtype=np.float64), (len(points),))
+        bboxes = np.column_stack([points[:,0]-radius, points[:,1]-radius, points[:,0]+radius, points[:,1]+radius])
+        query,positions = self._candidates(bboxes)
+        dx = self._x[positions] - points[query,0]
+        dy = self._y[positions] - points[query,1]
+        keep = dx*dx + dy*dy <= radius[query] ** 2
+        results = self._split(query[keep], positions[keep], len(points))
+        if self._pending:
+            for (px,py),rad,ids in zip(points.tolist(), radius.tolist(), results):
+                ids.extend((id for id,(x,y,_,_) in self._pending.items() if (x-px)**2 + (y-py)**2 <= rad**2))
+        return results
+
+    def _query(self, bbox):
+        # returns (id, bbox) pairs of all points intersecting the bbox
+        import numpy as np
+        bboxes = np.asarray([bbox], dtype=np.float64)
+        query,positions = self._candidates(bboxes)
+        x,y = self._x[positions],self._y[positions]
+        keep = (x >= bbox[0]) & (x <= bbox[2]) & (y >= bbox[1]) & (y <= bbox[3])
+        deleted = self._deleted
+        for id,px,py in zip(self._ids[positions[keep]].tolist(), x[keep].tolist(), y[keep].tolist()):
+            if id not in deleted:
+                yield id, (px,py,px,py)
+        for item in self._pending.items():
+            if bbox_overlaps(bbox, item[1]):
+                yield item
+
+    def nearest(self, bbox, num_results=1, radius=None, **kwargs):
+        """Yields the ids of the points nearest the given bbox, in order of increasing distance. 
+        Since the grid has no hierarchy of nodes to search best-first, this falls back to searching increasingly 
+        larger windows of cells with expanding_nearest(). 
+        """
+        count = len(self._ids) + len(self._pending)
+        bounds = None
+        if len(self._ids):
+            bounds = [self._x.min(), self._y.min(), self._x.max(), self._y.max()]
+        for _,itembbox in self._pending.items():
+            if bounds:
+                bounds = [min(bounds[0],itembbox[0]), min(bounds[1],itembbox[1]), max(bounds[2],itembbox[2]), max(bounds[3],itembbox[3])]
+            else:
+                bounds = list(itembbox)
+        for id,dist in expanding_nearest(self._query, bbox, bounds, count, num_results, radius):
+            yield id
 
+def _cell(values, origin, cellsize):
+    # returns the cell number of coordinates along one axis of a grid. 
+    # the points and the queries must be assigned to cells with the exact same formula, 
+    # or points on cell edges can end up in a cell next to the one that is searched
+    import numpy as np
+    return np.floor((values - origin) / cellsize)
 
+def _id_array(ids):
+    # returns an array of the ids, which is kept as an object array unless all the ids are integers, 
+    # since numpy would otherwise turn eg mixed int and str ids into str
+    import numpy as np
+    arr = np.asarray(ids)
+    if arr.dtype.kind not in 'iu':
+        ids = list(ids)
+        arr = np.empty(len(ids), dtype=object)
+        arr[:] = ids
+    return arr
 
+def _ranks(lengths):
+    # returns the position of each element within its group, for consecutive groups of the given lengths,
+    # eg [2,3] -> [0,1,0,1,2]
+    import numpy as np
+    total = lengths.sum()
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(total) - offsets
@@ -1,5 +1,5 @@
 
-import itertools, operator
+import itertools, operator, collections
 from .data import *
 
 import shapely, shapely.ops, shapely.geometry
@@ -12,130 +12,612 @@ except NameError:
     basestring = (bytes,str) # PY3
     
 
-# TODO: when multiple input, uses all possible combinations, but need a way to use spatial indexes etc
+# SQL components
 
+# incremental statistics
 
-# SQL components
+DISTINCT_EXACT_LIMIT = 1000
 
-def aggreg(iterable, aggregfuncs, geomfunc=None):
-    """Each func must be able to take an iterable and return a single item.
-    Aggregfuncs is a series of 3-tuples: an output column name, a value function or value hash index on which to base the aggregation, and a valid string or custom function for aggregating the retieved values.
+DISTINCT_PRECISION = 12
+
+class Accumulator(object):
+    """
+    Base class for a statistic that is updated one value at a time, without having to keep all the values in memory.
+    Subclasses implement add() and result(), where result() is only called after at least one value has been added. 
+    If numeric is True, only values that can be converted to float are added, and are converted before being added. 
     """
-    def lookup_geomfunc(agg):
-        # handle aliases
-        if agg == "dissolve":
-            agg = "union"
-        elif agg == "unique":
-            agg = "difference"
-
-        # detect
-        if agg == "intersection":
-            def _func(fs):
-                gs = (f.get_shapely() for f in fs if f.geometry)
-                cur = next(gs)
-                for g in gs:
-                    if not g.is_empty:
-                        cur = cur.intersection(g)
-                return cur.__geo_interface__
-            
-        elif agg == "difference":
-            def _func(fs):
-                gs = (f.get_shapely() for f in fs if f.geometry)
-                cur = next(gs)
-                for g in gs:
-                    if not g.is_empty:
-                        cur = cur.difference(g)
-                return cur.__geo_interface__
-
-        elif agg == "union":
-            def _func(fs):
-                gs = [f.get_shapely() for f in fs if f.geometry]
-                if len(gs) > 1:
-                    print(gs)
-                    from shapely.ops import cascaded_union
-                    return cascaded_union(gs).__geo_interface__
-                elif len(gs) == 1:
-                    return gs[0].__geo_interface__
-
-        elif hasattr(agg, "__call__"):
-            # agg is not a string but a custom function
-            return agg
+    numeric = False
 
-        else:
-            raise Exception("geomfunc must be a callable function or a valid set geometry string name")
+    def add(self, value):
+        raise NotImplementedError
 
-        return _func
-    
-    def lookup_aggfunc(agg):
-        # handle aliases
-        if agg in ("average","avg"):
-            agg = "mean"
-
-        # detect
-        if agg == "count": return len
-        elif agg == "sum": return sum
-        elif agg == "max": return max
-        elif agg == "min": return min
-        elif agg == "first": return lambda seq: seq.__getitem__(0)
-        elif agg == "last": return lambda seq: seq.__getitem__(-1)
-        elif agg == "majority": return lambda seq: max(itertools.groupby(sorted(seq)), key=lambda gidgroup: len(list(gidgroup[1])))[0]
-        elif agg == "minority": return lambda seq: min(itertools.groupby(sorted(seq)), key=lambda gidgroup: len(list(gidgroup[1])))[0]
-        elif agg == "mean": return lambda seq: sum(seq)/float(len(seq))
-        elif isinstance(agg, basestring) and agg.endswith("concat"):
-            delim = agg[:-6]
-            return lambda seq: delim.join((str(v) for v in seq))
-        elif hasattr(agg, "__call__"):
-            # agg is not a string but a function
-            return agg
-        else:
-            raise Exception("aggfunc must be a callable function or a valid statistics string name")
-
-    def check_valfunc(valfunc):
-        if hasattr(valfunc,"__call__"):
-            pass
-        elif isinstance(valfunc,basestring):
-            hashindex = valfunc
-            valfunc = lambda f: f[hashindex]
+    def result(self):
+        raise NotImplementedError
+
+class Count(Accumulator):
+    def __init__(self):
+        self.n = 0
+    def add(self, value):
+        self.n += 1
+    def result(self):
+        return self.n
+
+class Sum(Accumulator):
+    numeric = True
+    def __init__(self):
+        self.total = 0.0
+    def add(self, value):
+        self.total += value
+    def result(self):
+        return self.total
+
+class Mean(Accumulator):
+    numeric = True
+    def __init__(self):
+        self.total = 0.0
+        self.n = 0
+    def add(self, value):
+        self.total += value
+        self.n += 1
+    def result(self):
+        return self.total / self.n
+
+class Min(Accumulator):
+    numeric = True
+    def __init__(self):
+        self.value = None
+    def add(self, value):
+        if self.value is None or value < self.value:
+            self.value = value
+    def result(self):
+        return self.value
+
+class Max(Accumulator):
+    numeric = True
+    def __init__(self):
+        self.value = None
+    def add(self, value):
+        if self.value is None or value > self.value:
+            self.value = value
+    def result(self):
+        return self.value
+
+class Var(Accumulator):
+    """Population variance, updated with Welford's algorithm."""
+    numeric = True
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    def add(self, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+    def result(self):
+        return self.m2 / self.n
+
+class Stdev(Var):
+    """Population standard deviation."""
+    def result(self):
+        return math.sqrt(self.m2 / self.n)
+
+class Majority(Accumulator):
+    """Most common value, where ties go to the lowest value."""
+    def __init__(self):
+        self.counts = dict()
+    def add(self, value):
+        self.counts[value] = self.counts.get(value, 0) + 1
+    def result(self):
+        best = max(self.counts.values())
+        return min((val for val,count in self.counts.items() if count == best))
+
+class Minority(Majority):
+    """Least common value, where ties go to the lowest value."""
+    def result(self):
+        best = min(self.counts.values())
+        return min((val for val,count in self.counts.items() if count == best))
+
+class First(Accumulator):
+    def __init__(self):
+        self.value = None
+        self.empty = True
+    def add(self, value):
+        if self.empty:
+            self.value = value
+            self.empty = False
+    def result(self):
+        return self.value
+
+class Last(Accumulator):
+    def __init__(self):
+        self.value = None
+    def add(self, value):
+        self.value = value
+    def result(self):
+        return self.value
+
+class Concat(Accumulator):
+    def __init__(self, delim=""):
+        self.delim = delim
+        self.texts = []
+    def add(self, value):
+        self.texts.append(str(value))
+    def result(self):
+        return self.delim.join(self.texts)
+
+def _hash64(value):
+    # well mixed 64-bit hash of a value, since python hashes eg small ints to themselves
+    h = hash(value) & 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    h = ((h ^ (h >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return h ^ (h >> 31)
+
+class DistinctCount(Accumulator):
+    """
+    Number of distinct values. Counted exactly up to DISTINCT_EXACT_LIMIT distinct values, after which it switches 
+    to a HyperLogLog estimate with 2**DISTINCT_PRECISION registers, using constant memory with a typical error of 
+    about 1.6 percent. 
+    """
+    def __init__(self):
+        self.seen = set()
+        self.registers = None
+    def add(self, value):
+        if self.registers is None:
+            self.seen.add(value)
+            if len(self.seen) > DISTINCT_EXACT_LIMIT:
+                self.registers = [0] * (1 << DISTINCT_PRECISION)
+                for val in self.seen:
+                    self._add_hashed(val)
+                self.seen = None
         else:
-            raise Exception("valfunc for field '%s' must be a callable function or a string of the hash index for retrieving the value"%name)
-        return valfunc
-    
-    aggregfuncs = [(name,check_valfunc(valfunc),aggname,lookup_aggfunc(aggname)) for name,valfunc,aggname in aggregfuncs]
+            self._add_hashed(value)
+    def _add_hashed(self, value):
+        h = _hash64(value)
+        p = DISTINCT_PRECISION
+        index = h >> (64 - p)
+        rest = h & ((1 << (64 - p)) - 1)
+        rank = (64 - p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    def result(self):
+        if self.registers is None:
+            return len(self.seen)
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum((2.0 ** -r for r in self.registers))
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # small range correction
+            estimate = m * math.log(m / float(zeros))
+        return int(round(estimate))
 
-    def make_number(value):
-        try: return float(value)
-        except: return None
+class _Collect(Accumulator):
+    # custom aggregation function that needs the list of all values
+    def __init__(self, func):
+        self.func = func
+        self.values = []
+    def add(self, value):
+        self.values.append(value)
+    def result(self):
+        return self.func(self.values)
 
-    def is_missing(val):
-        return val is None or (isinstance(val, float) and math.isnan(val))
+def accumulator(agg):
+    """Returns a new Accumulator instance for a statistic name, or for a custom function that takes the list of all values.
 
-    iterable = list(iterable)
-    row = []
-    for _,valfunc,aggname,aggfunc in aggregfuncs:
-        values = (valfunc(item) for item in iterable)
+    Valid statistic names are count, sum, mean (or average/avg), min, max, var (or variance), stdev (or stddev/std), majority, 
+    minority, first, last, distinct, and concat, where any text in front of concat is used as the delimiter (eg ", concat"). 
+    """
+    # handle aliases
+    if agg in ("average","avg"):
+        agg = "mean"
+    elif agg == "variance":
+        agg = "var"
+    elif agg in ("stddev","std"):
+        agg = "stdev"
 
-        # missing values are not considered when calculating stats
-        values = [val for val in values if not is_missing(val)] 
+    # detect
+    if agg == "count": return Count()
+    elif agg == "sum": return Sum()
+    elif agg == "mean": return Mean()
+    elif agg == "max": return Max()
+    elif agg == "min": return Min()
+    elif agg == "var": return Var()
+    elif agg == "stdev": return Stdev()
+    elif agg == "first": return First()
+    elif agg == "last": return Last()
+    elif agg == "majority": return Majority()
+    elif agg == "minority": return Minority()
+    elif agg == "distinct": return DistinctCount()
+    elif isinstance(agg, basestring) and agg.endswith("concat"):
+        return Concat(agg[:-6])
+    elif hasattr(agg, "__call__"):
+        # agg is not a string but a function
+        return _Collect(agg)
+    else:
+        raise Exception("aggfunc must be a callable function or a valid statistics string name")
+
+def _lookup_geomfunc(agg):
+    # handle aliases
+    if agg == "dissolve":
+        agg = "union"
+    elif agg == "unique":
+        agg = "difference"
+
+    # detect
+    if agg == "intersection":
+        def _func(fs):
+            gs = (f.get_shapely() for f in fs if f.geometry)
+            cur = next(gs)
+            for g in gs:
+                if not g.is_empty:
+                    cur = cur.intersection(g)
+            return cur.__geo_interface__
         
-        if aggname in ("sum","max","min","mean"):
-            # only consider number values if numeric stats
-            values = [make_number(value) for value in values if make_number(value) != None]
+    elif agg == "difference":
+        def _func(fs):
+            gs = (f.get_shapely() for f in fs if f.geometry)
+            cur = next(gs)
+            for g in gs:
+                if not g.is_empty:
+                    cur = cur.difference(g)
+            return cur.__geo_interface__
 
-        if values:
-            aggval = aggfunc(values)
-        else:
-            aggval = "" # or best with None
-            
-        row.append(aggval)
+    elif agg == "union":
+        def _func(fs):
+            gs = [f.get_shapely() for f in fs if f.geometry]
+            if len(gs) > 1:
+                from shapely.ops import cascaded_union
+                return cascaded_union(gs).__geo_interface__
+            elif len(gs) == 1:
+                return gs[0].__geo_interface__
 
-    if geomfunc:
-        geomfunc = lookup_geomfunc(geomfunc)
-        geom = geomfunc(iterable)
-        return row,geom
+    elif hasattr(agg, "__call__"):
+        # agg is not a string but a custom function
+        return agg
 
     else:
+        raise Exception("geomfunc must be a callable function or a valid set geometry string name")
+
+    return _func
+
+def _check_valfunc(name, valfunc):
+    if hasattr(valfunc,"__call__"):
+        pass
+    elif isinstance(valfunc,basestring):
+        hashindex = valfunc
+        valfunc = lambda f: f[hashindex]
+    else:
+        raise Exception("valfunc for field '%s' must be a callable function or a string of the hash index for retrieving the value"%name)
+    return valfunc
+
+class Aggregator(object):
+    """
+    Calculates a row of aggregate statistics in a single pass, by adding one item at a time. 
+    Only the items needed by a geomfunc or custom aggregation functions are kept in memory. 
+
+    Example:
+        agg = Aggregator([("total", "pop", "sum"), ("cities", "name", "distinct")])
+        for feat in data:
+            agg.add(feat)
+        row = agg.result()
+
+    Attributes:
+        n: Number of items added so far. 
+    """
+    def __init__(self, aggregfuncs, geomfunc=None):
+        """
+        Args:
+            aggregfuncs: A series of 3-tuples: an output column name, a value function or value hash index on which to base 
+                the aggregation, and a statistic name or custom function for aggregating the retrieved values. 
+                See accumulator() for valid statistic names. 
+            geomfunc (optional): Name of a set geometry operation (intersection, union/dissolve, or difference/unique) or 
+                a custom function that takes the list of added items and returns a GeoJSON geometry. 
+        """
+        self._aggregfuncs = aggregfuncs
+        self._specs = [(_check_valfunc(name, valfunc), aggname) for name,valfunc,aggname in aggregfuncs]
+        self._geomfunc = geomfunc and _lookup_geomfunc(geomfunc)
+        self.reset()
+
+    def reset(self):
+        """Starts over with no items added."""
+        self.n = 0
+        self._accums = [accumulator(aggname) for _,aggname in self._specs]
+        self._counts = [0 for _ in self._specs]
+        self._items = [] if self._geomfunc else None
+
+    def new(self):
+        """Returns a new empty Aggregator with the same aggregation rules."""
+        new = Aggregator.__new__(Aggregator)
+        new._aggregfuncs = self._aggregfuncs
+        new._specs = self._specs
+        new._geomfunc = self._geomfunc
+        new.reset()
+        return new
+
+    def add(self, item):
+        """Updates the statistics with an item."""
+        self.n += 1
+        counts = self._counts
+        for i,accum in enumerate(self._accums):
+            val = self._specs[i][0](item)
+            # missing values are not considered when calculating stats
+            if val is None or (isinstance(val, float) and math.isnan(val)):
+                continue
+            if accum.numeric:
+                # only consider number values if numeric stats
+                try:
+                    val = float(val)
+                except (TypeError, ValueError):
+                    continue
+            accum.add(val)
+            counts[i] += 1
+        if self._items is not None:
+            self._items.append(item)
+
+    def result(self):
+        """Returns the row of aggregated values, or a row-geometry tuple if geomfunc was set. 
+        Statistics without any valid values are set to an empty string. 
+        """
+        row = [accum.result() if count else ""
+               for accum,count in zip(self._accums, self._counts)]
+        if self._geomfunc:
+            return row, self._geomfunc(self._items)
         return row
 
+# sliding windows
+
+class _WindowKernel(object):
+    # statistic over the values in a sliding window, where values are removed in the same order they were added
+    numeric = False
+    drifts = False # whether floating point errors accumulate, so must be recalculated now and then
+    def add(self, pos, value):
+        raise NotImplementedError
+    def remove(self, pos, value):
+        raise NotImplementedError
+
+class _WindowCount(_WindowKernel):
+    def __init__(self):
+        self.n = 0
+    def add(self, pos, value):
+        self.n += 1
+    def remove(self, pos, value):
+        self.n -= 1
+    def result(self):
+        return self.n
+
+class _WindowSum(_WindowKernel):
+    numeric = True
+    drifts = True
+    def __init__(self):
+        self.total = 0.0
+        self.n = 0
+    def add(self, pos, value):
+        self.total += value
+        self.n += 1
+    def remove(self, pos, value):
+        self.total -= value
+        self.n -= 1
+    def result(self):
+        return self.total
+
+class _WindowMean(_WindowSum):
+    def result(self):
+        return self.total / self.n
+
+class _WindowVar(_WindowKernel):
+    # welford's algorithm, which can also be reversed to remove values
+    numeric = True
+    drifts = True
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    def add(self, pos, value):
+        self.n += 1
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (value - self.mean)
+    def remove(self, pos, value):
+        self.n -= 1
+        if self.n == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.n
+        self.m2 -= delta * (value - self.mean)
+    def result(self):
+        return max(self.m2, 0.0) / self.n
+
+class _WindowStdev(_WindowVar):
+    def result(self):
+        return math.sqrt(max(self.m2, 0.0) / self.n)
+
+class _WindowMin(_WindowKernel):
+    # monotonic deque of (position,value) candidates, where the first is the current min
+    numeric = True
+    def __init__(self):
+        self.candidates = collections.deque()
+    def better(self, value, other):
+        return value <= other
+    def add(self, pos, value):
+        candidates = self.candidates
+        while candidates and self.better(value, candidates[-1][1]):
+            candidates.pop()
+        candidates.append((pos, value))
+    def remove(self, pos, value):
+        if self.candidates[0][0] == pos:
+            self.candidates.popleft()
+    def result(self):
+        return self.candidates[0][1]
+
+class _WindowMax(_WindowMin):
+    def better(self, value, other):
+        return value >= other
+
+class _WindowValues(_WindowKernel):
+    # the valid values currently in the window, in order
+    def __init__(self, func):
+        self.func = func
+        self.values = collections.deque()
+    def add(self, pos, value):
+        self.values.append(value)
+    def remove(self, pos, value):
+        self.values.popleft()
+    def result(self):
+        return self.func(self.values)
+
+class _WindowCounts(_WindowKernel):
+    # counts of each distinct value in the window
+    def __init__(self, func):
+        self.func = func
+        self.counts = dict()
+    def add(self, pos, value):
+        self.counts[value] = self.counts.get(value, 0) + 1
+    def remove(self, pos, value):
+        count = self.counts[value] - 1
+        if count:
+            self.counts[value] = count
+        else:
+            del self.counts[value]
+    def result(self):
+        return self.func(self.counts)
+
+def _most_common(counts):
+    best = max(counts.values())
+    return min((val for val,count in counts.items() if count == best))
+
+def _least_common(counts):
+    best = min(counts.values())
+    return min((val for val,count in counts.items() if count == best))
+
+def _window_kernel(agg):
+    # returns a new window kernel for a statistic name or custom function
+    if agg in ("average","avg"):
+        agg = "mean"
+    elif agg == "variance":
+        agg = "var"
+    elif agg in ("stddev","std"):
+        agg = "stdev"
+
+    if agg == "count": return _WindowCount()
+    elif agg == "sum": return _WindowSum()
+    elif agg == "mean": return _WindowMean()
+    elif agg == "max": return _WindowMax()
+    elif agg == "min": return _WindowMin()
+    elif agg == "var": return _WindowVar()
+    elif agg == "stdev": return _WindowStdev()
+    elif agg == "first": return _WindowValues(lambda values: values[0])
+    elif agg == "last": return _WindowValues(lambda values: values[-1])
+    elif agg == "majority": return _WindowCounts(_most_common)
+    elif agg == "minority": return _WindowCounts(_least_common)
+    elif agg == "distinct": return _WindowCounts(len)
+    elif isinstance(agg, basestring) and agg.endswith("concat"):
+        delim = agg[:-6]
+        return _WindowValues(lambda values: delim.join((str(v) for v in values)))
+    elif hasattr(agg, "__call__"):
+        # agg is not a string but a custom function of the list of values
+        return _WindowValues(lambda values: agg(list(values)))
+    else:
+        raise Exception("aggfunc must be a callable function or a valid statistics string name")
+
+class SlidingWindow(object):
+    """
+    Calculates a row of aggregate statistics over the last n items added, the same way as aggreg(). 
+
+    Count, sum, mean, var, and stdev are kept as running totals that are updated as items enter and leave the window, 
+    and min and max with monotonic deques, so each item takes constant time regardless of the window size. 
+    Majority, minority, and distinct keep counts of the values in the window, while first, last, concat and custom functions 
+    work on the values in the window. 
+
+    Example:
+        window = SlidingWindow(7, [("weekly", "rain", "sum")])
+        for feat in data:
+            window.add(feat)
+            feat["weekly"] = window.result()[0]
+    """
+    def __init__(self, n, aggregfuncs):
+        """
+        Args:
+            n: Number of items in the window. 
+            aggregfuncs: A series of 3-tuples: an output column name, a value function or value hash index on which to base 
+                the aggregation, and a statistic name or custom function for aggregating the retrieved values. 
+        """
+        self.n = n
+        self._aggregfuncs = aggregfuncs
+        self._specs = [(_check_valfunc(name, valfunc), aggname) for name,valfunc,aggname in aggregfuncs]
+        self._kernels = [_window_kernel(aggname) for _,aggname in self._specs]
+        self._counts = [0 for _ in self._specs]
+        self._window = collections.deque() # the values of each field for each item, with None for missing values
+        self._pos = 0
+        self._expired = 0
+
+    def new(self):
+        """Returns a new empty SlidingWindow with the same size and aggregation rules."""
+        return SlidingWindow(self.n, self._aggregfuncs)
+
+    def add(self, item):
+        """Adds an item to the window, and removes the oldest item if the window is full."""
+        pos = self._pos
+        self._pos += 1
+        values = []
+        counts = self._counts
+        for i,kernel in enumerate(self._kernels):
+            val = self._specs[i][0](item)
+            # missing values are not considered when calculating stats
+            if val is None or (isinstance(val, float) and math.isnan(val)):
+                val = None
+            elif kernel.numeric:
+                # only consider number values if numeric stats
+                try:
+                    val = float(val)
+                except (TypeError, ValueError):
+                    val = None
+            if val is not None:
+                kernel.add(pos, val)
+                counts[i] += 1
+            values.append(val)
+        window = self._window
+        window.append((pos, values))
+
+        if len(window) > self.n:
+            oldpos,oldvalues = window.popleft()
+            for i,val in enumerate(oldvalues):
+                if val is not None:
+                    self._kernels[i].remove(oldpos, val)
+                    counts[i] -= 1
+            self._expired += 1
+            if self._expired >= self.n:
+                # recalculate the running totals once per window length, so that rounding errors dont accumulate
+                self._expired = 0
+                self._resync()
+
+    def _resync(self):
+        for i,kernel in enumerate(self._kernels):
+            if kernel.drifts:
+                kernel = self._kernels[i] = _window_kernel(self._specs[i][1])
+                for pos,values in self._window:
+                    if values[i] is not None:
+                        kernel.add(pos, values[i])
+
+    def result(self):
+        """Returns the row of aggregated values for the items currently in the window. 
+        Statistics without any valid values are set to an empty string. 
+        """
+        return [kernel.result() if count else ""
+                for kernel,count in zip(self._kernels, self._counts)]
+
+def aggreg(iterable, aggregfuncs, geomfunc=None):
+    """Aggregates an iterable of items into a single row, in a single pass over the items. 
+    Aggregfuncs is a series of 3-tuples: an output column name, a value function or value hash index on which to base the aggregation, 
+    and a valid string or custom function for aggregating the retieved values. See Aggregator and accumulator() for details. 
+    Returns the row list, or a row-geometry tuple if geomfunc is set. 
+    """
+    agg = Aggregator(aggregfuncs, geomfunc)
+    for item in iterable:
+        agg.add(item)
+    return agg.result()
+
 def select(iterable, columnfuncs, geomfunc=None):
     if geomfunc:
         # iterate and yield rows and geoms
@@ -155,8 +637,8 @@ def where(iterable, condition):
         if condition(item):
             yield item
 
-def groupby(iterable, key):
-    
+def _keyfunc(key):
+    # returns a function for a key function, hash index, or list of hash indexes
     if hasattr(key,"__call__"):
         pass
     elif isinstance(key,basestring):
@@ -167,10 +649,200 @@ def groupby(iterable, key):
         key = lambda f: tuple((f[h] for h in hashindexes))
     else:
         raise Exception("groupby key must be a callable function or a string or list/tuple of strings of the hash index(es) for retrieving the value(s)")
+    return key
+
+def _hashable(value):
+    # hashable version of a key value that is not, such as a geojson dictionary or a list
+    if isinstance(value, dict):
+        return tuple(sorted(((k,_hashable(v)) for k,v in value.items())))
+    elif isinstance(value, (list,tuple)):
+        return tuple((_hashable(v) for v in value))
+    else:
+        return value
+
+GROUPBY_PARTITIONS = 16
+
+def _spilled_groups(groups, rest, key):
+    # continues grouping by writing the groups so far and all remaining items to partition files on disk, 
+    # then groups each partition in memory and merges them back together in first-seen order
+    import pickle, tempfile, heapq
+    partitions = [tempfile.TemporaryFile() for _ in range(GROUPBY_PARTITIONS)]
+    results = []
+    try:
+        def write(hkey, keyval, seq, items):
+            fobj = partitions[hash(hkey) % GROUPBY_PARTITIONS]
+            pickle.dump((hkey, keyval, seq, items), fobj, pickle.HIGHEST_PROTOCOL)
+
+        for hkey,(keyval,items,seq) in groups.items():
+            write(hkey, keyval, seq, items)
+        groups.clear()
+        for seq,item in rest:
+            keyval = key(item)
+            try:
+                hash(keyval)
+                hkey = keyval
+            except TypeError:
+                hkey = _hashable(keyval)
+            write(hkey, keyval, seq, [item])
+
+        def records(fobj):
+            fobj.seek(0)
+            while True:
+                try:
+                    yield pickle.load(fobj)
+                except EOFError:
+                    break
+
+        # group each partition and write its groups in first-seen order
+        for fobj in partitions:
+            pgroups = dict()
+            for hkey,keyval,seq,items in records(fobj):
+                group = pgroups.get(hkey)
+                if group is None:
+                    pgroups[hkey] = [seq, keyval, items]
+                else:
+                    group[2].extend(items)
+            fobj.close()
+            result = tempfile.TemporaryFile()
+            results.append(result)
+            for seq,keyval,items in sorted(pgroups.values(), key=lambda group: group[0]):
+                pickle.dump((seq, keyval, items), result, pickle.HIGHEST_PROTOCOL)
+            del pgroups
 
-    iterable = sorted(iterable, key=key)
-    for groupid,items in itertools.groupby(iterable, key=key):
-        yield items
+        # merge the partitions, only holding one group per partition in memory
+        merged = heapq.merge(*[records(result) for result in results], key=lambda group: group[0])
+        for seq,keyval,items in merged:
+            yield keyval, items
+    finally:
+        for fobj in partitions + results:
+            fobj.close()
+
+def hash_groupby(iterable, key, maxgroups=None):
+    """Groups the items of an iterable by hashing their key values, in a single pass and in the order that each group was first seen.
+    Key values that are not hashable, such as lists or GeoJSON dictionaries, are grouped by their contents. 
+
+    Args:
+        iterable: Iterable of items to group. 
+        key: A function, hash index, or list of hash indexes that returns the key value of an item. 
+        maxgroups (optional): If the number of groups exceeds this, the groups and the remaining items are spilled to partition files
+            on disk, and then grouped one partition at a time, so that memory use stays bounded. The items must then be picklable. 
+            Defaults to no limit. 
+
+    Yields:
+        (keyvalue, items) pairs, where items is the list of items in the group in their original order. 
+    """
+    key = _keyfunc(key)
+    groups = dict() # hashable key -> items, in first-seen order
+    firstseen = dict() # hashable key -> position of first item
+    originals = dict() # hashable key -> key value, for key values that are not hashable
+    items = enumerate(iterable)
+    for seq,item in items:
+        keyval = key(item)
+        try:
+            groups[keyval].append(item)
+            continue
+        except KeyError:
+            hkey = keyval
+        except TypeError:
+            hkey = _hashable(keyval)
+            group = groups.get(hkey)
+            if group is not None:
+                group.append(item)
+                continue
+        # new group
+        if maxgroups and len(groups) >= maxgroups:
+            # too many groups to hold in memory
+            spilled = dict(((hk,(originals.get(hk, hk),its,firstseen[hk])) for hk,its in groups.items()))
+            groups.clear()
+            rest = itertools.chain([(seq, item)], items)
+            for group in _spilled_groups(spilled, rest, key):
+                yield group
+            return
+        groups[hkey] = [item]
+        firstseen[hkey] = seq
+        if hkey is not keyval:
+            originals[hkey] = keyval
+
+    for hkey,items in groups.items():
+        yield originals.get(hkey, hkey), items
+
+def groupby(iterable, key, sort=False, maxgroups=None):
+    """Groups the items of an iterable by a key function, hash index, or list of hash indexes, and yields the list of items in each group. 
+
+    By default the groups are found by hashing the key values in a single pass, and are yielded in the order they were first seen. 
+    See hash_groupby() for how the maxgroups option limits memory use. If sort is True, the items are instead sorted by their key values, 
+    which must then be comparable, and the groups are yielded in sorted key order. 
+    """
+    if sort:
+        key = _keyfunc(key)
+        iterable = sorted(iterable, key=key)
+        for groupid,items in itertools.groupby(iterable, key=key):
+            yield list(items)
+    else:
+        for groupid,items in hash_groupby(iterable, key, maxgroups=maxgroups):
+            yield items
+
+def hash_join(left, right, leftkey, rightkey, keepall=False, buildleft=False):
+    """Joins two iterables of items on equal keys, by first building a hash table of one side and then streaming
+    the left items through it. Keys only need to be hashable, not comparable. 
+
+    Yields (leftitem, rightitems) pairs in the order of the left items, where rightitems is the list of matching 
+    right items in their original order. Left items without matches are skipped, or yielded with an empty list if keepall is True.
+
+    Args:
+        left: Iterable of left items. 
+        right: Iterable of right items. 
+        leftkey: Function that returns the key of a left item. 
+        rightkey: Function that returns the key of a right item. 
+        keepall (optional): Whether to also yield the left items without matches. 
+        buildleft (optional): If True, the keys of the left items are hashed first, so that only the right items that 
+            match are kept in memory. Faster when the left side is the smaller one, but the left items are read into memory. 
+    """
+    table = dict()
+    if buildleft:
+        left = list(left)
+        wanted = set((leftkey(item) for item in left))
+        for item in right:
+            keyval = rightkey(item)
+            if keyval in wanted:
+                table.setdefault(keyval, []).append(item)
+    else:
+        for item in right:
+            table.setdefault(rightkey(item), []).append(item)
+
+    # probe
+    for item in left:
+        matches = table.get(leftkey(item))
+        if matches:
+            yield item, matches
+        elif keepall:
+            yield item, []
+
+def merge_join(left, right, leftkey, rightkey, keepall=False):
+    """Same as hash_join(), but for items that are already sorted by their keys in ascending order. 
+    Both sides are streamed in a single pass, so only the right items of the current key are kept in memory. 
+    """
+    groups = itertools.groupby(right, key=rightkey)
+    group = next(groups, None)
+    if group:
+        groupkey,groupitems = group[0],list(group[1])
+    prevkey = None
+    for i,item in enumerate(left):
+        keyval = leftkey(item)
+        if i and keyval < prevkey:
+            raise Exception("Merge join requires the left items to be sorted by key")
+        prevkey = keyval
+        # advance the right side up to the current key
+        while group and groupkey < keyval:
+            group = next(groups, None)
+            if group:
+                if group[0] < groupkey:
+                    raise Exception("Merge join requires the right items to be sorted by key")
+                groupkey,groupitems = group[0],list(group[1])
+        if group and groupkey == keyval:
+            yield item, groupitems
+        elif keepall:
+            yield item, []
 
 def limit(iterable, n):
     for i,item in enumerate(iterable):
@@ -179,6 +851,346 @@ def limit(iterable, n):
         else:
             break
 
+# query plans
+
+INDEX_PREDICATES = ("intersects", "contains", "contains_properly", "covers", "covered_by", "crosses", 
+                    "equals", "overlaps", "touches", "within")
+
+PREPARED_PREDICATES = ("intersects", "contains", "contains_properly", "covers", "crosses", "disjoint", 
+                       "overlaps", "touches", "within")
+
+JOIN_BATCHSIZE = 1000
+
+def _spatial_test(predicate, feat, otherfeat):
+    # whether the geometry of feat has the spatial relationship with the geometry of otherfeat
+    if not feat.geometry or not otherfeat.geometry:
+        return False
+    if predicate in PREPARED_PREDICATES:
+        geom = feat.get_prepared()
+    else:
+        geom = feat.get_shapely()
+    return getattr(geom, predicate)(otherfeat.get_shapely())
+
+def _describe_source(source):
+    name = getattr(source, "name", None) or type(source).__name__
+    try:
+        return "{} ({} items)".format(name, len(source))
+    except TypeError:
+        return "{}".format(name)
+
+class Query(object):
+    """
+    Lazy query plan over one or more sources, which is only executed when iterated. 
+
+    Each method returns a new Query with the added step, so queries can be built up and reused in several steps. 
+    When the query runs, conditions that only involve one source are applied to that source before it is combined with 
+    the others, conditions involving several sources are applied as soon as those sources have been combined, and 
+    spatial predicates between two sources are run as joins that look up the matching features via the spatial index
+    instead of testing all combinations. Use explain() to see how a query will be run. 
+
+    With a single source, the select, geomselect, where, and groupby functions take each item of the source, otherwise they 
+    take a tuple with one item from each source. 
+
+    Example:
+        q = Query(countries, cities)
+        q = q.where(lambda city: city["pop"] > 1000000, sources=1)
+        q = q.where("contains", sources=(0,1))
+        q = q.select([("country", lambda items: items[0]["name"]), ("city", lambda items: items[1]["name"])], 
+                     geomselect=lambda items: items[1].geometry)
+        print(q.explain())
+        data = q.to_data()
+
+    Attributes:
+        sources: List of the iterables being queried. 
+        fields: The column names of the selected rows. 
+    """
+    def __init__(self, *sources):
+        """Starts a new query over one or more iterables, such as VectorData instances.
+        Spatial predicates can only use a spatial index of a source that has the quick_overlap_many() method. 
+        """
+        if not sources:
+            raise Exception("Query must have at least one source")
+        self.sources = list(sources)
+        self._filters = [] # (sourceindexes or None, condition)
+        self._spatial = [] # (predicate, sourceindex, othersourceindex)
+        self._select = None
+        self._geomselect = None
+        self._groupby = None
+        self._groupsort = False
+        self._limit = None
+
+    def __repr__(self):
+        return "<Query: sources={} fields={}>".format(len(self.sources), self.fields)
+
+    def __iter__(self):
+        """
+        Runs the query, yielding each row list, or row-geometry tuple if geomselect was set. 
+        """
+        return self._run()
+
+    @property
+    def fields(self):
+        return [each[0] for each in self._select or []]
+
+    def _copy(self):
+        new = Query(*self.sources)
+        new._filters = list(self._filters)
+        new._spatial = list(self._spatial)
+        new._select = self._select
+        new._geomselect = self._geomselect
+        new._groupby = self._groupby
+        new._groupsort = self._groupsort
+        new._limit = self._limit
+        return new
+
+    def _source_index(self, i):
+        if not isinstance(i, int) or not -len(self.sources) <= i < len(self.sources):
+            raise Exception("Invalid source index: {}".format(i))
+        return i % len(self.sources)
+
+    ### STEPS ###
+
+    def where(self, condition, sources=None):
+        """Returns a new query that only keeps the items for which the condition is True. 
+
+        Args:
+            condition: A function that returns True or False, or the name of a spatial predicate between two sources
+                (intersects, contains, contains_properly, covers, covered_by, crosses, disjoint, equals, overlaps, touches, 
+                or within). 
+            sources (optional): Which sources the condition involves. If an index, the condition takes a single item of that 
+                source and is applied before the source is combined with the others. If a tuple of indexes, the condition 
+                takes a tuple with one item from each of those sources, and is applied as soon as they have been combined. 
+                Defaults to all sources, in which case the condition takes the same input as the select functions. 
+                For spatial predicates this must be a pair of sources (defaults to (0,1)), where eg "within" keeps the 
+                combinations where the item of the first source is within the item of the second. 
+        """
+        new = self._copy()
+        if isinstance(condition, basestring):
+            i,j = (0,1) if sources is None else sources
+            i,j = self._source_index(i),self._source_index(j)
+            if i == j:
+                raise Exception("Spatial predicates must be between two different sources")
+            if condition not in INDEX_PREDICATES and condition != "disjoint":
+                raise Exception("Unknown spatial predicate: {}".format(condition))
+            new._spatial.append((condition, i, j))
+        elif hasattr(condition, "__call__"):
+            if isinstance(sources, int):
+                sources = self._source_index(sources)
+            elif sources is not None:
+                sources = tuple((self._source_index(i) for i in sources))
+            new._filters.append((sources, condition))
+        else:
+            raise Exception("where condition must be a callable function or the name of a spatial predicate")
+        return new
+
+    def select(self, columnfuncs, geomselect=None):
+        """Returns a new query that outputs the given columns. 
+
+        Args:
+            columnfuncs: Sequence of (name,func) pairs, where each func returns the column value. If grouped, these are 
+                instead (name,valfunc,aggfunc) tuples as used by aggreg(). 
+            geomselect (optional): A function that returns the output GeoJSON geometry, or if grouped a function or 
+                aggregate geometry name as used by aggreg(). 
+        """
+        new = self._copy()
+        new._select = list(columnfuncs)
+        new._geomselect = geomselect
+        return new
+
+    def groupby(self, key, sort=False):
+        """Returns a new query that groups the items by a key function or hash index(es), where each group outputs a single 
+        row as aggregated by the select columns. The groups are in the order they were first seen, or in the order of their 
+        keys if sort is True. 
+        """
+        new = self._copy()
+        new._groupby = key
+        new._groupsort = sort
+        return new
+
+    def limit(self, n):
+        """Returns a new query that only outputs the first n rows."""
+        new = self._copy()
+        new._limit = n
+        return new
+
+    ### PLANNING ###
+
+    def _plan(self):
+        # decides how to run the query, returning the pushed down conditions for each source, 
+        # the joins needed to combine each source with the previous ones, and the remaining conditions
+        count = len(self.sources)
+        scanfilters = [[] for _ in range(count)]
+        joinfilters = [[] for _ in range(count)]
+        finalfilters = []
+        for sources,condition in self._filters:
+            if sources is None:
+                finalfilters.append(condition)
+            elif isinstance(sources, int):
+                scanfilters[sources].append(condition)
+            else:
+                joinfilters[max(sources) if sources else 0].append((sources, condition))
+
+        joins = [None]
+        for k in range(1, count):
+            probe = None
+            tests = []
+            for predicate,i,j in self._spatial:
+                if max(i,j) != k:
+                    continue
+                if (probe is None and predicate in INDEX_PREDICATES 
+                    and hasattr(self.sources[k], "quick_overlap_many")):
+                    probe = (predicate, i, j)
+                else:
+                    tests.append((predicate, i, j))
+            joins.append(dict(probe=probe, tests=tests, filters=joinfilters[k]))
+
+        return scanfilters, joins, joinfilters[0], finalfilters
+
+    def explain(self):
+        """Returns a text description of how the query will be run, as a tree of steps where each step
+        takes the output of the steps indented below it. 
+        """
+        scanfilters,joins,_,finalfilters = self._plan()
+        lines = []
+        def add(depth, text):
+            lines.append("  " * depth + text)
+
+        depth = 0
+        if self._limit:
+            add(depth, "Limit {}".format(self._limit))
+            depth += 1
+        geomtext = ", with geometry" if self._geomselect else ""
+        if self._groupby:
+            add(depth, "Aggregate {} columns{}".format(len(self.fields), geomtext))
+            add(depth + 1, "{} group by {}".format("Sort" if self._groupsort else "Hash",
+                                                    self._groupby if isinstance(self._groupby, (basestring,list,tuple)) else "key function"))
+            depth += 2
+        else:
+            add(depth, "Select {} columns{}".format(len(self.fields), geomtext))
+            depth += 1
+        if finalfilters:
+            add(depth, "Filter {} condition(s) on all sources".format(len(finalfilters)))
+            depth += 1
+
+        def add_scan(depth, k):
+            if scanfilters[k]:
+                add(depth, "Filter {} condition(s) on source {}".format(len(scanfilters[k]), k))
+                depth += 1
+            add(depth, "Scan source {}: {}".format(k, _describe_source(self.sources[k])))
+
+        def add_joins(depth, k):
+            if k == 0:
+                add_scan(depth, 0)
+                return
+            join = joins[k]
+            extra = []
+            if join["tests"]:
+                extra.append(", ".join(("{}({},{})".format(*test) for test in join["tests"])))
+            if join["filters"]:
+                extra.append("{} condition(s)".format(len(join["filters"])))
+            extra = " where " + " and ".join(extra) if extra else ""
+            if join["probe"]:
+                predicate,i,j = join["probe"]
+                add(depth, "Index join source {} on {}({},{}){}".format(k, predicate, i, j, extra))
+            else:
+                add(depth, "Nested loop join source {}{}".format(k, extra))
+            add_joins(depth + 1, k - 1)
+            add_scan(depth + 1, k)
+
+        add_joins(depth, len(self.sources) - 1)
+        return "\n".join(lines)
+
+    ### EXECUTION ###
+
+    def _scan(self, k, filters):
+        source = self.sources[k]
+        if filters:
+            return (item for item in source if all((cond(item) for cond in filters)))
+        return iter(source)
+
+    def _join(self, partials, k, join, filters):
+        # combines each partial list of items from the previous sources with the matching items of source k
+        source = self.sources[k]
+        def keep(items):
+            for predicate,i,j in join["tests"]:
+                if not _spatial_test(predicate, items[i], items[j]):
+                    return False
+            for sources,condition in join["filters"]:
+                if not condition(tuple((items[i] for i in sources))):
+                    return False
+            return True
+
+        if join["probe"]:
+            predicate,i,j = join["probe"]
+            if not hasattr(source, "spindex"):
+                source.create_spatial_index()
+            other = j if i == k else i
+            passed = dict() # pushed down conditions only evaluated once per item
+            def candidate_ok(item):
+                ok = passed.get(item.id)
+                if ok is None:
+                    ok = passed[item.id] = all((cond(item) for cond in filters))
+                return ok
+            # look up the candidates of many partials at a time
+            while True:
+                batch = list(itertools.islice(partials, JOIN_BATCHSIZE))
+                if not batch:
+                    break
+                bboxes = [items[other].bbox if items[other].geometry else None for items in batch]
+                for items,candidates in zip(batch, source.quick_overlap_many(bboxes)):
+                    for item in candidates:
+                        if filters and not candidate_ok(item):
+                            continue
+                        newitems = items + [item]
+                        if _spatial_test(predicate, newitems[i], newitems[j]) and keep(newitems):
+                            yield newitems
+        else:
+            others = list(self._scan(k, filters))
+            for items in partials:
+                for item in others:
+                    newitems = items + [item]
+                    if keep(newitems):
+                        yield newitems
+
+    def _items(self):
+        # yields each item, or tuple of items, that satisfy all the conditions
+        scanfilters,joins,firstfilters,finalfilters = self._plan()
+        if len(self.sources) == 1:
+            items = self._scan(0, scanfilters[0])
+            for sources,condition in firstfilters:
+                items = (item for item in items if condition(item if isinstance(sources, int) else (item,)))
+        else:
+            items = ([item] for item in self._scan(0, scanfilters[0]))
+            for sources,condition in firstfilters:
+                items = (its for its in items if condition(tuple((its[0] for _ in sources))))
+            for k in range(1, len(self.sources)):
+                items = self._join(items, k, joins[k], scanfilters[k])
+            items = (tuple(its) for its in items)
+        for condition in finalfilters:
+            items = where(items, condition)
+        return items
+
+    def _run(self):
+        if self._select is None:
+            raise Exception("Query must select some columns before it can be run")
+        items = self._items()
+        if self._groupby:
+            groups = groupby(items, self._groupby, sort=self._groupsort)
+            if self._limit:
+                groups = limit(groups, self._limit)
+            # NOTE: columnfuncs and geomfunc must expect an iterable as input and return a single row,geom pair
+            for group in groups:
+                yield aggreg(group, self._select, self._geomselect)
+        else:
+            if self._limit:
+                items = limit(items, self._limit)
+            for row in select(items, self._select, self._geomselect):
+                yield row
+
+    def to_data(self):
+        """Runs the query and returns the results as a new VectorData instance."""
+        return query_to_data(self)
+
 def query(_from, _select, _geomselect=None, _where=None, _groupby=None, _limit=None):
     """Takes a series of sql generator components, runs them, and iterates over the resulting feature-geom tuples.
 
@@ -186,68 +1198,37 @@ def query(_from, _select, _geomselect=None, _where=None, _groupby=None, _limit=N
     All combinations of items from the iterables are then tupled together and passed to the remaining _select, _where_, and _groupby args.
     This allows us to involve items from all the iterables in the functions that define our queries.
     The final _select function should return a row list, and the _geomselect should return a geojson dictionary.
-    """
-    # INSTEAD MAKE INTO CLASS
-    # WITH .fields attr
-    # AND .__iter__()
-    # AND .get_vectordata()
-    # AND MAKE EACH YIELDED ROW A VECTOR FEATURE CLASS
-    # THIS WAY ALLOWING CHAINED QUERIES
-
-    # parse args
-    iterables = _from
-    columnfuncs = _select
-    geomfunc = _geomselect
-    condition = _where
-    key = _groupby
-    n = _limit
-    
-    # first yield header as list of column names
-    colnames = [each[0] for each in columnfuncs]
-    yield colnames
-
-    # make an iterable that yields every combinaion of all input iterables' items
-    if len(iterables) == 1:
-        iterable = iterables[0]
-    else:
-        iterable = itertools.product(*iterables)
-
-    # iterate and add
-    if key:
-        groups = groupby(iterable, key)
 
-        # limit
-        if n:
-            groups = limit(groups, n)
-        
-        for items in groups:
-            # filter
-            if condition:
-                items = where(items, condition)
-                
-            # aggregate
-            # NOTE: columnfuncs and geomfunc must expect an iterable as input and return a single row,geom pair
-            item = aggreg(items, columnfuncs, geomfunc)
-            yield item
-            
-    else:
-        # filter
-        if condition:
-            iterable = where(iterable, condition)
-
-        # limit
-        if n:
-            iterable = limit(iterable, n)
+    The first item yielded is the header list of column names. See Query for building queries step by step, 
+    with conditions that can be pushed down to each source and spatial joins that use the spatial index. 
+    """
+    q = Query(*_from).select(_select, _geomselect)
+    if _where:
+        q = q.where(_where)
+    if _groupby:
+        q = q.groupby(_groupby)
+    if _limit:
+        q = q.limit(_limit)
 
-        # select
-        for item in select(iterable, columnfuncs, geomfunc):
-            yield item
+    # first yield header as list of column names
+    yield q.fields
+    for item in q:
+        yield item
 
 def query_to_data(_query):
+    """Runs a Query, or the generator returned by query(), and streams the resulting rows into a new VectorData instance.
+    Rows without a geometry are skipped. 
+    """
     # create table and columns
     out = VectorData()
-    header = next(_query)
-    out.fields = [name for name in header]
+    if isinstance(_query, Query):
+        out.fields = list(_query.fields)
+        if not _query._geomselect:
+            raise Exception("Query must have a geomselect in order to be converted to VectorData")
+    else:
+        _query = iter(_query)
+        header = next(_query)
+        out.fields = [name for name in header]
 
     # add each feature
     for row,geom in _query:
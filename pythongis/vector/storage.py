@@ -0,0 +1,727 @@
+"""
+Alternative storage backends for holding the rows and geometries of a vector dataset.
+
+By default a VectorData instance keeps each feature as a separate Feature object with its own
+row list and GeoJSON geometry dictionary. For very large datasets this is costly in terms of
+memory and makes whole-column operations slow. The backends in this module instead keep the
+data in a few large containers, and the dataset's features become lightweight views into them.
+"""
+
+# import builtins
+import os
+import json
+import tempfile
+from array import array
+
+
+
+NaN = float("nan")
+
+GEOMETRY_TYPES = [None, "Point", "MultiPoint", "LineString", "MultiLineString", "Polygon", "MultiPolygon"]
+
+GEOMETRY_ARRAYS = ["geomtypes", "geom_start", "geom_end", "part_start", "part_end", "ring_start", "ring_end", "coords", "bboxes"]
+
+def _typecode(col):
+    # arrays and memoryviews name their typecode differently
+    return getattr(col, "typecode", None) or col.format
+
+def _to_array(col):
+    # copies an array or memoryview into a new array
+    new = array(_typecode(col))
+    if isinstance(col, memoryview):
+        new.frombytes(col.cast("B"))
+    else:
+        new.extend(col)
+    return new
+
+def _copy(col):
+    if isinstance(col, list):
+        return col[:]
+    return _to_array(col)
+
+
+
+
+class ColumnarStorage(object):
+    """
+    Columnar storage of rows and geometries.
+
+    Each field is stored as a single column. Columns where all values are ints or all values are floats
+    are stored as compact typed arrays, and are automatically loosened to ordinary lists as soon as a
+    value of a different type (including None) is written to them.
+
+    Geometries are stored as packed coordinate arrays along with offset arrays. Each geometry consists of
+    one or more parts, each part consists of one or more rings (or line or point sequences), and each ring
+    consists of one or more coordinates. This way all GeoJSON geometry types can be represented using the same
+    flat arrays. Only x and y coordinates are stored. The bounding box of each geometry is stored as well.
+
+    Rows are referenced by their position in the storage, which never changes. Replacing a geometry appends
+    the new coordinates to the end of the arrays, so the old ones linger as unused space until compact() is called.
+
+    The arrays may also be memory-mapped from a file in the binary columnar format (see `fileformats.columnar`), in which
+    case they are memoryviews that are only copied into ordinary arrays once rows or geometries are added.
+
+    Attributes:
+        columns: List of column containers, one for each field.
+        geomtypes: Array of geometry type codes for each row, looked up in GEOMETRY_TYPES, where 0 means null-geometry.
+        coords: Packed array of x,y coordinates.
+        bboxes: Packed array of xmin,ymin,xmax,ymax for each row.
+    """
+    def __init__(self, fieldcount=0):
+        self.columns = [None for _ in range(fieldcount)]
+        self._length = 0
+
+        # geometries
+        self.geomtypes = array("b")
+        self.geom_start = array("q")
+        self.geom_end = array("q")
+        self.part_start = array("q")
+        self.part_end = array("q")
+        self.ring_start = array("q")
+        self.ring_end = array("q")
+        self.coords = array("d")
+        self.bboxes = array("d")
+
+        # whether any of the arrays are read from a memory-mapped file, see fileformats.columnar
+        self._mapped = False
+
+    def __len__(self):
+        return self._length
+
+    # columns
+
+    def _new_column(self, values):
+        # start out with the most compact container and loosen up if needed
+        values = list(values)
+        if values and all((type(v) is int for v in values)):
+            try:
+                return array("q", values)
+            except OverflowError:
+                return values
+        elif values and all((type(v) is float for v in values)):
+            return array("d", values)
+        else:
+            return values
+
+    def _loosen(self, colindex):
+        col = self.columns[colindex]
+        if not isinstance(col, list):
+            col = col.tolist()
+            self.columns[colindex] = col
+        return col
+
+    def _fits(self, col, value):
+        if isinstance(col, list):
+            return True
+        elif _typecode(col) == "q":
+            return type(value) is int and -2**63 <= value < 2**63
+        elif _typecode(col) == "d":
+            return type(value) is float
+
+    def get_value(self, i, colindex):
+        return self.columns[colindex][i]
+
+    def set_value(self, i, colindex, value):
+        col = self.columns[colindex]
+        if not self._fits(col, value):
+            col = self._loosen(colindex)
+        col[i] = value
+
+    def get_values(self, i):
+        return [col[i] for col in self.columns]
+
+    def get_row(self, i):
+        return RowView(self, i)
+
+    def set_row(self, i, row):
+        if len(row) != len(self.columns):
+            raise Exception("Row list must be of same length as the number of columns")
+        for colindex,value in enumerate(row):
+            self.set_value(i, colindex, value)
+
+    def column(self, colindex):
+        """Returns the column container for the given column index, in storage order.
+        Should be treated as read-only."""
+        return self.columns[colindex]
+
+    def fill_column(self, colindex, value):
+        """Sets all values of a column to the same value."""
+        self.columns[colindex] = self._new_column([value]) * self._length
+
+    def insert_column(self, colindex=None, values=None):
+        """Inserts a new column at the given index position (default is last), populated with the given values or None."""
+        if values is None:
+            col = [None] * self._length
+        else:
+            col = self._new_column(values)
+            if len(col) != self._length:
+                raise Exception("Column values must be of same length as the number of rows")
+        if colindex is None:
+            self.columns.append(col)
+        else:
+            self.columns.insert(colindex, col)
+
+    def delete_column(self, colindex):
+        del self.columns[colindex]
+
+    # geometries
+
+    def has_geometry(self, i):
+        return self.geomtypes[i] != 0
+
+    def get_bbox(self, i):
+        if not self.geomtypes[i]:
+            return None
+        return list(self.bboxes[i*4:i*4+4])
+
+    def set_bbox(self, i, bbox):
+        self.bboxes[i*4:i*4+4] = array("d", bbox)
+
+    def _ring(self, r):
+        coords = self.coords
+        return [(coords[c*2],coords[c*2+1]) for c in range(self.ring_start[r], self.ring_end[r])]
+
+    def get_geometry(self, i):
+        code = self.geomtypes[i]
+        if not code:
+            return None
+
+        geotype = GEOMETRY_TYPES[code]
+        parts = [[self._ring(r) for r in range(self.part_start[p], self.part_end[p])]
+                 for p in range(self.geom_start[i], self.geom_end[i])]
+        if geotype == "Point":
+            coords = parts[0][0][0]
+        elif geotype == "MultiPoint":
+            coords = [part[0][0] for part in parts]
+        elif geotype == "LineString":
+            coords = parts[0][0]
+        elif geotype == "MultiLineString":
+            coords = [part[0] for part in parts]
+        elif geotype == "Polygon":
+            coords = parts[0]
+        elif geotype == "MultiPolygon":
+            coords = parts
+
+        return {"type": geotype, "coordinates": coords, "bbox": self.get_bbox(i)}
+
+    def _unmap(self):
+        # memory-mapped arrays cant grow, so copy them into ordinary arrays
+        if self._mapped:
+            for name in GEOMETRY_ARRAYS:
+                setattr(self, name, _to_array(getattr(self, name)))
+            self.columns = [_to_array(col) if isinstance(col, memoryview) else col for col in self.columns]
+            self._mapped = False
+
+    def _encode_geometry(self, geometry):
+        # writes the geometry to the end of the packed arrays
+        # and returns the type code, part offsets, and bbox
+        self._unmap()
+        if not geometry:
+            return 0, (0, 0), (NaN,)*4
+
+        geotype = geometry["type"]
+        coords = geometry["coordinates"]
+        if geotype == "Point":
+            parts = [[[coords]]]
+        elif geotype == "MultiPoint":
+            parts = [[[p]] for p in coords]
+        elif geotype == "LineString":
+            parts = [[coords]]
+        elif geotype == "MultiLineString":
+            parts = [[line] for line in coords]
+        elif geotype == "Polygon":
+            parts = [coords]
+        elif geotype == "MultiPolygon":
+            parts = coords
+        else:
+            raise Exception("Columnar storage does not support geometry type: {}".format(geotype))
+
+        if not parts:
+            return 0, (0, 0), (NaN,)*4
+
+        xmin = ymin = float("inf")
+        xmax = ymax = float("-inf")
+        geom_start = len(self.part_start)
+        for part in parts:
+            self.part_start.append(len(self.ring_start))
+            for ring in part:
+                self.ring_start.append(len(self.coords) // 2)
+                for p in ring:
+                    x,y = p[0],p[1]
+                    self.coords.append(x)
+                    self.coords.append(y)
+                    if x < xmin: xmin = x
+                    if x > xmax: xmax = x
+                    if y < ymin: ymin = y
+                    if y > ymax: ymax = y
+                self.ring_end.append(len(self.coords) // 2)
+            self.part_end.append(len(self.ring_start))
+        geom_end = len(self.part_start)
+
+        return GEOMETRY_TYPES.index(geotype), (geom_start, geom_end), (xmin,ymin,xmax,ymax)
+
+    def set_geometry(self, i, geometry):
+        code,(start,end),bbox = self._encode_geometry(geometry)
+        self.geomtypes[i] = code
+        self.geom_start[i] = start
+        self.geom_end[i] = end
+        self.set_bbox(i, bbox)
+
+    # rows
+
+    def append(self, row, geometry):
+        """Appends a new row list and GeoJSON geometry (or None), and returns its row index."""
+        self._unmap()
+        if self._length == 0 and len(self.columns) != len(row):
+            # columns not yet decided
+            self.columns = [None for _ in row]
+        elif len(row) != len(self.columns):
+            raise Exception("Row list must be of same length as the number of columns")
+
+        for colindex,value in enumerate(row):
+            col = self.columns[colindex]
+            if col is None:
+                self.columns[colindex] = self._new_column([value])
+            else:
+                if not self._fits(col, value):
+                    col = self._loosen(colindex)
+                col.append(value)
+
+        code,(start,end),bbox = self._encode_geometry(geometry)
+        self.geomtypes.append(code)
+        self.geom_start.append(start)
+        self.geom_end.append(end)
+        self.bboxes.extend(bbox)
+
+        self._length += 1
+        return self._length - 1
+
+    def ids(self):
+        """Returns the row indexes in storage order."""
+        return range(self._length)
+
+    def iter_rows(self, ids=None):
+        """Yields the row list of each of the given row indexes, defaulting to all rows in storage order."""
+        for i in (self.ids() if ids is None else ids):
+            yield self.get_values(i)
+
+    def iter_geometries(self, ids=None):
+        """Yields the GeoJSON geometry or None of each of the given row indexes, defaulting to all rows in storage order."""
+        for i in (self.ids() if ids is None else ids):
+            yield self.get_geometry(i)
+
+    def iter_bboxes(self):
+        """Yields the row index and bbox of all rows with geometry, in storage order."""
+        geomtypes,bboxes = self.geomtypes,self.bboxes
+        for i in range(self._length):
+            if geomtypes[i]:
+                yield i, list(bboxes[i*4:i*4+4])
+
+    def delete(self, i):
+        """Releases the geometry of a deleted row. The row index itself is never reused."""
+        self.set_geometry(i, None)
+
+    def compact(self):
+        """Rewrites the geometry arrays to reclaim the unused space left behind by replaced geometries."""
+        geoms = [self.get_geometry(i) for i in range(self._length)]
+        for name in GEOMETRY_ARRAYS:
+            setattr(self, name, array(_typecode(getattr(self, name))))
+        self._mapped = False
+        for geom in geoms:
+            code,(start,end),bbox = self._encode_geometry(geom)
+            self.geomtypes.append(code)
+            self.geom_start.append(start)
+            self.geom_end.append(end)
+            self.bboxes.extend(bbox)
+
+    def copy(self):
+        new = ColumnarStorage()
+        new.columns = [_copy(col) if col is not None else None for col in self.columns]
+        new._length = self._length
+        for name in GEOMETRY_ARRAYS:
+            setattr(new, name, _copy(getattr(self, name)))
+        return new
+
+
+
+class SqliteStorage(object):
+    """
+    On-disk storage of rows and geometries in a SQLite database file.
+
+    All rows are kept in a single table, with one column for each field, the geometry as WKB, and its bbox.
+    The bboxes are also kept in an R*Tree virtual table, which serves as a ready-made spatial index.
+    Only the values that are currently being accessed are held in memory, so the size of the dataset is
+    limited by disk space rather than memory.
+
+    The field names, geometry type, and crs of the dataset are stored alongside the data, so a previously built database
+    can be reopened directly without having to parse the original file again. Changes are written to the database file
+    when commit() is called.
+
+    Rows are referenced by their position in the storage, which is the same as their id in the database table.
+
+    Attributes:
+        path: Filepath of the database file.
+        columns: List of the database column names, one for each field.
+        meta: Dictionary of metadata stored in the database file, such as fields, type, and crs.
+    """
+    def __init__(self, path=None, fieldcount=0):
+        """Opens the database file at the given path, or creates it if it does not exist yet.
+        If no path is given, creates a new temporary database file.
+        """
+        import sqlite3
+
+        if path is None:
+            fd,path = tempfile.mkstemp(suffix=".sqlite")
+            os.close(fd)
+            os.remove(path)
+        self.path = path
+        self._db = sqlite3.connect(path)
+
+        exists = self._db.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='features'").fetchone()
+        if exists:
+            self.meta = dict(((k,json.loads(v)) for k,v in self._db.execute("SELECT key, value FROM meta")))
+            self.columns = self.meta["columns"]
+            self._colcounter = self.meta["colcounter"]
+            maxid = self._db.execute("SELECT MAX(id) FROM features").fetchone()[0]
+            self._length = 0 if maxid is None else maxid + 1
+        else:
+            self._db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            self._db.execute("CREATE TABLE features (id INTEGER PRIMARY KEY, geomtype INTEGER, geom BLOB, "
+                             "xmin REAL, ymin REAL, xmax REAL, ymax REAL)")
+            self._db.execute("CREATE VIRTUAL TABLE bboxes USING rtree(id, xmin, xmax, ymin, ymax)")
+            self.meta = dict()
+            self.columns = []
+            self._colcounter = 0
+            self._length = 0
+            for _ in range(fieldcount):
+                self.insert_column()
+
+    def __len__(self):
+        return self._length
+
+    def commit(self, **meta):
+        """Writes all changes to the database file, along with any given metadata key-values."""
+        self.meta.update(meta)
+        self.meta["columns"] = self.columns
+        self.meta["colcounter"] = self._colcounter
+        self._db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                             ((k,json.dumps(v)) for k,v in self.meta.items()))
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+    # columns
+
+    def get_value(self, i, colindex):
+        row = self._db.execute("SELECT {} FROM features WHERE id = ?".format(self.columns[colindex]), (i,)).fetchone()
+        return row[0]
+
+    def set_value(self, i, colindex, value):
+        self._db.execute("UPDATE features SET {} = ? WHERE id = ?".format(self.columns[colindex]), (value, i))
+
+    def get_values(self, i):
+        if not self.columns:
+            return []
+        row = self._db.execute("SELECT {} FROM features WHERE id = ?".format(", ".join(self.columns)), (i,)).fetchone()
+        return list(row)
+
+    def get_row(self, i):
+        return RowView(self, i)
+
+    def set_row(self, i, row):
+        if len(row) != len(self.columns):
+            raise Exception("Row list must be of same length as the number of columns")
+        if self.columns:
+            assign = ", ".join(("{} = ?".format(col) for col in self.columns))
+            self._db.execute("UPDATE features SET {} WHERE id = ?".format(assign), list(row) + [i])
+
+    def column(self, colindex):
+        """Returns a list of all the values of a column, positioned by their row index."""
+        col = [None] * self._length
+        for i,value in self._db.execute("SELECT id, {} FROM features".format(self.columns[colindex])):
+            col[i] = value
+        return col
+
+    def fill_column(self, colindex, value):
+        """Sets all values of a column to the same value."""
+        self._db.execute("UPDATE features SET {} = ?".format(self.columns[colindex]), (value,))
+
+    def insert_column(self, colindex=None, values=None):
+        """Inserts a new column at the given index position (default is last), populated with the given values or None."""
+        name = "c{}".format(self._colcounter)
+        self._colcounter += 1
+        self._db.execute("ALTER TABLE features ADD COLUMN {}".format(name))
+        if values is not None:
+            values = list(values)
+            if len(values) != self._length:
+                raise Exception("Column values must be of same length as the number of rows")
+            self._db.executemany("UPDATE features SET {} = ? WHERE id = ?".format(name),
+                                 ((value,i) for i,value in enumerate(values)))
+        if colindex is None:
+            self.columns.append(name)
+        else:
+            self.columns.insert(colindex, name)
+
+    def delete_column(self, colindex):
+        name = self.columns.pop(colindex)
+        try:
+            self._db.execute("ALTER TABLE features DROP COLUMN {}".format(name))
+        except Exception:
+            # older sqlite versions cant drop columns, so just leave it unused
+            pass
+
+    # geometries
+
+    def has_geometry(self, i):
+        row = self._db.execute("SELECT geomtype FROM features WHERE id = ?", (i,)).fetchone()
+        return bool(row and row[0])
+
+    def get_bbox(self, i):
+        row = self._db.execute("SELECT geomtype, xmin, ymin, xmax, ymax FROM features WHERE id = ?", (i,)).fetchone()
+        if not row or not row[0]:
+            return None
+        return list(row[1:])
+
+    def set_bbox(self, i, bbox):
+        xmin,ymin,xmax,ymax = bbox
+        self._db.execute("UPDATE features SET xmin = ?, ymin = ?, xmax = ?, ymax = ? WHERE id = ?", (xmin,ymin,xmax,ymax,i))
+        self._db.execute("INSERT OR REPLACE INTO bboxes VALUES (?, ?, ?, ?, ?)", (i,xmin,xmax,ymin,ymax))
+
+    def get_geometry(self, i):
+        import shapely.wkb
+        row = self._db.execute("SELECT geomtype, geom, xmin, ymin, xmax, ymax FROM features WHERE id = ?", (i,)).fetchone()
+        if not row or not row[0]:
+            return None
+        geoj = shapely.wkb.loads(bytes(row[1])).__geo_interface__
+        geoj["type"] = GEOMETRY_TYPES[row[0]]
+        geoj["bbox"] = list(row[2:])
+        return geoj
+
+    def _encode_geometry(self, geometry):
+        # returns the type code, wkb, and bbox of a geojson geometry
+        if not geometry or not geometry["coordinates"]:
+            return 0, None, (None,)*4
+
+        import shapely.wkb
+        from shapely.geometry import shape
+        geotype = geometry["type"]
+        if geotype not in GEOMETRY_TYPES:
+            raise Exception("Sqlite storage does not support geometry type: {}".format(geotype))
+        shp = shape(geometry)
+        return GEOMETRY_TYPES.index(geotype), shapely.wkb.dumps(shp), shp.bounds
+
+    def set_geometry(self, i, geometry):
+        code,wkb,bbox = self._encode_geometry(geometry)
+        self._db.execute("UPDATE features SET geomtype = ?, geom = ?, xmin = ?, ymin = ?, xmax = ?, ymax = ? WHERE id = ?",
+                         (code,wkb) + tuple(bbox) + (i,))
+        self._db.execute("DELETE FROM bboxes WHERE id = ?", (i,))
+        if code:
+            xmin,ymin,xmax,ymax = bbox
+            self._db.execute("INSERT INTO bboxes VALUES (?, ?, ?, ?, ?)", (i,xmin,xmax,ymin,ymax))
+
+    def intersecting(self, bbox):
+        """Yields the row index of all rows whose bbox intersects the given bbox, using the R*Tree index."""
+        xmin,ymin,xmax,ymax = bbox
+        cursor = self._db.execute("SELECT id FROM bboxes WHERE xmin <= ? AND xmax >= ? AND ymin <= ? AND ymax >= ?",
+                                  (xmax,xmin,ymax,ymin))
+        for row in cursor:
+            yield row[0]
+
+    def intersecting_bboxes(self, bbox):
+        """Same as intersecting(), but yields the row index and bbox of each row."""
+        xmin,ymin,xmax,ymax = bbox
+        cursor = self._db.execute("SELECT id, xmin, ymin, xmax, ymax FROM bboxes WHERE xmin <= ? AND xmax >= ? AND ymin <= ? AND ymax >= ?",
+                                  (xmax,xmin,ymax,ymin))
+        for row in cursor:
+            yield row[0], row[1:]
+
+    def spatial_index(self):
+        """Returns a spatial index that searches the storage's R*Tree index directly."""
+        return _SqliteIndex(self)
+
+    # rows
+
+    def append(self, row, geometry):
+        """Appends a new row list and GeoJSON geometry (or None), and returns its row index."""
+        if self._length == 0 and len(self.columns) != len(row):
+            # columns not yet decided
+            while self.columns:
+                self.delete_column(0)
+            for _ in row:
+                self.insert_column()
+        elif len(row) != len(self.columns):
+            raise Exception("Row list must be of same length as the number of columns")
+
+        i = self._length
+        code,wkb,bbox = self._encode_geometry(geometry)
+        colnames = "".join((", "+col for col in self.columns))
+        marks = ", ?" * len(self.columns)
+        self._db.execute("INSERT INTO features (id, geomtype, geom, xmin, ymin, xmax, ymax{}) VALUES (?, ?, ?, ?, ?, ?, ?{})".format(colnames, marks),
+                         (i,code,wkb) + tuple(bbox) + tuple(row))
+        if code:
+            xmin,ymin,xmax,ymax = bbox
+            self._db.execute("INSERT INTO bboxes VALUES (?, ?, ?, ?, ?)", (i,xmin,xmax,ymin,ymax))
+
+        self._length += 1
+        return i
+
+    def delete(self, i):
+        """Deletes a row. The row index itself is never reused."""
+        self._db.execute("DELETE FROM features WHERE id = ?", (i,))
+        self._db.execute("DELETE FROM bboxes WHERE id = ?", (i,))
+
+    def ids(self):
+        """Returns the row indexes in storage order."""
+        return (row[0] for row in self._db.execute("SELECT id FROM features ORDER BY id"))
+
+    def iter_rows(self, ids=None):
+        """Yields the row list of each of the given row indexes, defaulting to all rows in storage order."""
+        for i in (self.ids() if ids is None else ids):
+            yield self.get_values(i)
+
+    def iter_geometries(self, ids=None):
+        """Yields the GeoJSON geometry or None of each of the given row indexes, defaulting to all rows in storage order."""
+        for i in (self.ids() if ids is None else ids):
+            yield self.get_geometry(i)
+
+    def iter_bboxes(self):
+        """Yields the row index and bbox of all rows with geometry, in storage order."""
+        cursor = self._db.execute("SELECT id, xmin, ymin, xmax, ymax FROM features WHERE geomtype > 0 ORDER BY id")
+        for row in cursor:
+            yield row[0], list(row[1:])
+
+    def ordered_ids(self, colindex):
+        """Returns the row indexes sorted by the values of a column."""
+        cursor = self._db.execute("SELECT id FROM features ORDER BY {}, id".format(self.columns[colindex]))
+        return (row[0] for row in cursor)
+
+    def copy(self):
+        """Copies the database to a new temporary database file."""
+        self.commit()
+        new = SqliteStorage()
+        self._db.backup(new._db)
+        new.meta = dict(self.meta)
+        new.columns = list(self.columns)
+        new._colcounter = self._colcounter
+        new._length = self._length
+        return new
+
+
+
+
+class _SqliteIndex(object):
+    # spatial index interface to the R*Tree index of a sqlite storage,
+    # which is already kept up to date as the rows are added and changed
+    def __init__(self, storage):
+        self._storage = storage
+
+    def insert(self, id, bbox):
+        pass
+
+    def delete(self, id):
+        pass
+
+    def load(self, items):
+        pass
+
+    def intersects(self, bbox):
+        return self._storage.intersecting(bbox)
+
+    def intersects_many(self, bboxes):
+        return [list(self._storage.intersecting(bbox)) for bbox in bboxes]
+
+    def nearest(self, bbox, num_results=1, radius=None):
+        """Yields the row indexes of the rows whose bboxes are nearest the given bbox, in order of increasing distance, 
+        by best-first search of the nodes of the R*Tree. The nodes are read from the node table that sqlite keeps
+        for the R*Tree, where each node is a blob of a 2 byte depth (only set for the root node, number 1), a 2 byte
+        number of cells, and then each cell as an 8 byte child node number or row index followed by the 4 byte float
+        xmin, xmax, ymin and ymax, all big-endian. 
+
+        Args:
+            bbox: The bbox to search from. 
+            num_results (optional): Max number of results to return, or None for all. Defaults to 1. 
+            radius (optional): Max distance of results. 
+        """
+        import struct
+        from .spindex import bbox_distance, best_first_nearest
+        db = self._storage._db
+
+        # nodes are (depth, number) pairs, where depth -1 are the rows found in the leaf nodes.
+        # the node bboxes are stored as floats rounded outwards, so the exact bbox of each row is read before it is returned
+        def expand(node):
+            depth,number = node
+            if depth == -1:
+                rowbbox = db.execute("SELECT xmin, ymin, xmax, ymax FROM features WHERE id = ?", (number,)).fetchone()
+                return [], [(bbox_distance(bbox, rowbbox), number)]
+            data = db.execute("SELECT data FROM bboxes_node WHERE nodeno = ?", (number,)).fetchone()[0]
+            rootdepth,count = struct.unpack_from(">HH", data)
+            if depth is None:
+                depth = rootdepth
+            nodes = []
+            for i in range(count):
+                child,xmin,xmax,ymin,ymax = struct.unpack_from(">q4f", data, 4 + i*24)
+                nodes.append((bbox_distance(bbox, (xmin,ymin,xmax,ymax)), (depth-1, child)))
+            return nodes, []
+
+        for id,dist in best_first_nearest(expand, (None, 1), num_results, radius):
+            yield id
+
+
+
+
+class RowView(object):
+    """
+    List-like view of a single row in a storage backend.
+    Supports getting and setting values via indexing, iteration, len(), and concatenation with lists.
+    The length of the row cannot be changed, use the VectorData add_field and drop_field methods instead.
+    """
+    def __init__(self, storage, i):
+        self._storage = storage
+        self._i = i
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def __len__(self):
+        return len(self._storage.columns)
+
+    def __iter__(self):
+        return iter(self._storage.get_values(self._i))
+
+    def __getitem__(self, colindex):
+        if isinstance(colindex, slice):
+            return list(self)[colindex]
+        if colindex < 0:
+            colindex += len(self)
+        return self._storage.get_value(self._i, colindex)
+
+    def __setitem__(self, colindex, value):
+        if isinstance(colindex, slice):
+            raise Exception("Can only set one row value at a time")
+        if colindex < 0:
+            colindex += len(self)
+        self._storage.set_value(self._i, colindex, value)
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def append(self, value):
+        raise Exception("Cannot change the length of a stored row, use add_field() on the dataset instead")
+
+    insert = append
+
+    def __delitem__(self, colindex):
+        raise Exception("Cannot change the length of a stored row, use drop_field() on the dataset instead")
+
+
+
@@ -1,10 +1,221 @@
+"""
+Streaming vector data that doesnt hold in memory.
 
+Features are read from the source file one at a time, passed through a chain of lazy
+generator stages, and written straight to the output file.
+"""
 
-class Streaming(object):
+# import builtins
+import itertools
+
+# import internal modules
+from . import loader
+from . import saver
+from .data import Feature, VectorData, ID_generator, _parse_crs
+
+# PY3 fix
+try:
+    zip = itertools.izip
+except:
     pass
 
 
-# streaming vector data that doesnt hold in memory
-# either via generators and stepwise reading and writing
-# or via loading into sqlite db
-# ...
+
+class Streaming(object):
+    """
+    Class representing a vector dataset that is streamed from its source file instead of being loaded into memory.
+
+    Iterating over a Streaming instance reads the source file and yields its features one by one. Each time it is iterated,
+    the source file is read anew, so memory use stays constant regardless of the size of the file.
+
+    The select(), compute(), keep_fields(), drop_fields(), and reproject() methods do not process anything right away,
+    but instead return a new Streaming instance where the operation is added as a lazy generator stage on top
+    of the previous ones. This way several operations can be chained and then applied in a single pass when the
+    results are saved with save(), or loaded into memory with load().
+
+    Example:
+        stream = Streaming("buildings.shp")
+        stream = stream.select(lambda f: f["height"] > 10).compute("area", lambda f: f.area).keep_fields(["id","area"])
+        stream.save("tall_buildings.shp")
+
+    Attributes:
+        filepath: The source file being streamed.
+        name:
+        type: The geometry type of the stream, only known after the first geometry has been read.
+        fields: The field names of the features yielded by this stream.
+        crs:
+    """
+    def __init__(self, filepath=None, name=None, crs=None, **kwargs):
+        """Opens a vector file for streaming.
+
+        Args:
+            filepath: Filepath of the dataset to stream.
+            name (optional): Gives the dataset a name.
+            crs (optional): The coordinate system specified as a Proj4 string, defaults to the crs of the file or unprojected WGS84.
+            **kwargs: File-format specific loading options, same as for VectorData. See `vector.loader` for details.
+        """
+        self.filepath = filepath
+        self.name = name or filepath
+        self.type = None
+        self._id_generator = ID_generator()
+        self._fieldindex = dict()
+
+        if filepath:
+            # only read the fields and crs for now, and reuse them each time the file is read
+            fields,_,crs = loader.iter_file(filepath, crs=crs, **kwargs)
+            self.fields = list(fields)
+            self._kwargs = dict(kwargs, crs=crs, fields=list(fields))
+            self._source = self._read
+        else:
+            self.fields = []
+            self._source = lambda: iter([])
+        self.crs = _parse_crs(crs)
+
+    def __repr__(self):
+        return "<Streaming vector data: type={type} fields={fields} filepath='{filepath}'>".format(type=self.type,
+                                                                                                   fields=len(self.fields),
+                                                                                                   filepath=self.filepath)
+
+    def __iter__(self):
+        """
+        Reads and yields each feature from the source, passing it through each of the chained stages.
+        """
+        return self._source()
+
+    @property
+    def __geo_interface__(self):
+        return dict(type="FeatureCollection",
+                    features=(feat.__geo_interface__ for feat in self))
+
+    def field_index(self, field):
+        """Returns the index position of a field name."""
+        i = self._fieldindex.get(field)
+        if i is None or i >= len(self.fields) or self.fields[i] != field:
+            self._fieldindex = dict((fn,i) for i,fn in reversed(list(enumerate(self.fields))))
+            i = self._fieldindex.get(field)
+            if i is None:
+                raise ValueError("%s is not a field" % field)
+        return i
+
+    def _read(self):
+        _,rowgeoms,_ = loader.iter_file(self.filepath, **self._kwargs)
+        for id,(row,geom) in enumerate(rowgeoms):
+            yield Feature(self, row, geom, id=id)
+
+    def _stage(self, func, fields=None, crs=None):
+        # returns a new stream that applies func to each of the features of this stream
+        # func takes the new stream and a feature of this stream, and returns a new feature or None to skip it
+        new = Streaming(name=self.name)
+        new.filepath = self.filepath
+        new.type = self.type
+        new.fields = list(self.fields if fields is None else fields)
+        new.crs = self.crs if crs is None else crs
+        def source():
+            for feat in self:
+                feat = func(new, feat)
+                if feat is not None:
+                    yield feat
+        new._source = source
+        return new
+
+    ### LAZY STAGES ###
+
+    def select(self, func):
+        """Returns a new stream that only yields the features for which func returns True.
+        Func takes a Feature instance as input.
+        """
+        def stage(new, feat):
+            if func(feat):
+                return Feature(new, feat.row, feat.geometry, id=feat.id)
+        return self._stage(stage)
+
+    def compute(self, field, value):
+        """Returns a new stream where the row field of each feature is set to the given value.
+        If the value is a function, it will take each Feature object as input and uses it to calculate and return a new value.
+        If the field name does not already exist, one will be created.
+        """
+        if hasattr(value, "__call__"):
+            valfunc = value
+        else:
+            valfunc = lambda f: value
+
+        if field in self.fields:
+            fields = self.fields
+            extra = []
+        else:
+            fields = self.fields + [field]
+            extra = [None]
+
+        def stage(new, feat):
+            feat = Feature(new, feat.row + extra, feat.geometry, id=feat.id)
+            feat[field] = valfunc(feat)
+            return feat
+        return self._stage(stage, fields=fields)
+
+    def keep_fields(self, fields):
+        """Returns a new stream that only keeps the fields specified, in the given order."""
+        for kf in fields:
+            if kf not in self.fields:
+                raise Exception("%s is not a field" % kf)
+        indexes = [self.field_index(kf) for kf in fields]
+
+        def stage(new, feat):
+            row = feat.row
+            return Feature(new, [row[i] for i in indexes], feat.geometry, id=feat.id)
+        return self._stage(stage, fields=fields)
+
+    def drop_fields(self, fields):
+        """Returns a new stream without the specified fields."""
+        return self.keep_fields([f for f in self.fields if f not in fields])
+
+    def reproject(self, tocrs):
+        """Returns a new stream where each feature is reprojected from the stream's crs to another."""
+        import pyproj
+        import pycrs
+
+        if not isinstance(tocrs, pycrs.CS):
+            tocrs = pycrs.parse.from_unknown_text(tocrs)
+
+        _transformer = pyproj.Transformer.from_crs(self.crs.to_proj4(), tocrs.to_proj4())
+
+        def _project(points):
+            xs,ys = zip(*points)
+            xs,ys = _transformer.transform(xs, ys)
+            newpoints = list(zip(xs, ys))
+            return newpoints
+
+        def stage(new, feat):
+            feat = Feature(new, feat.row, feat.geometry, id=feat.id)
+            if feat.geometry:
+                feat.transform(_project)
+            return feat
+        return self._stage(stage, crs=pycrs.parse.from_proj4(tocrs.to_proj4()))
+
+    ### OUTPUT ###
+
+    def save(self, savepath, **kwargs):
+        """Streams the features straight to a new file, without holding them in memory.
+        The stream is only run once. Since the field types have to be detected before writing, the 
+        features are spilled to a temporary file while detecting them, unless the fieldtypes or sample 
+        options are given. 
+
+        Args:
+            savepath: Filepath to save to.
+            **kwargs: File-format specific saving options. See `vector.saver.to_file` for details.
+        """
+        # rows and geometries are single use iterators, which makes the saver read them in one pass
+        rows,geometries = saver._lockstep(((list(feat.row),feat.geometry) for feat in self))
+        saver.to_file(self.fields, rows, geometries, savepath, **kwargs)
+
+    def load(self, **kwargs):
+        """Runs the stream and loads the resulting features into memory as a new VectorData instance.
+        Any **kwargs are passed on to VectorData, e.g. storage="columnar".
+        """
+        rowgeoms = ((feat.row,feat.geometry) for feat in self)
+        rows,geometries = [],[]
+        for row,geom in rowgeoms:
+            rows.append(row)
+            geometries.append(geom)
+        return VectorData(fields=list(self.fields), rows=rows, geometries=geometries, crs=self.crs, name=self.name, **kwargs)
+
+
@@ -0,0 +1,67 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import pythongis as pg
+from pythongis.vector.fileformats import columnar
+
+# data
+
+fields = ['name', 'pop', 'area', 'mixed']
+rows = [['a', 5, 1.5, 1],
+        ['b', 7, 2.5, None],
+        ['c', 9, 3.5, 'x']]
+geometries = [{'type':'Polygon', 'coordinates':[[(1,2),(2,2),(2,3),(1,2)]]},
+              {'type':'MultiPolygon', 'coordinates':[[[(0,0),(1,0),(1,1),(0,0)]], [[(5,5),(6,5),(6,6),(5,5)]]]},
+              None]
+
+# tests
+
+class TestColumnarFormat(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'test.pgc')
+        self.data = pg.VectorData(fields=fields, rows=rows, geometries=geometries)
+        self.data.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_roundtrip(self):
+        data = pg.VectorData(self.path)
+        self.assertEqual(data.fields, fields)
+        self.assertEqual([list(f.row) for f in data], rows)
+        self.assertEqual(data.bbox, (0,0,6,6))
+        self.assertEqual(data[1].geometry['coordinates'][1][0][2], (6,6))
+        self.assertEqual(data[2].geometry, None)
+
+    def test_mapped(self):
+        data = pg.VectorData(self.path)
+        self.assertTrue(isinstance(data._storage.columns[1], memoryview))
+        data[0]['pop'] = 100
+        data.add_feature(['d', 1, 1.0, 1], geometries[0])
+        self.assertEqual(list(data.column('pop')), [100, 7, 9, 1])
+        # file is left untouched
+        self.assertEqual(pg.VectorData(self.path)[0]['pop'], 5)
+
+    def test_other_storage(self):
+        data = pg.VectorData(self.path, lazy=True)
+        self.assertEqual([list(f.row) for f in data], rows)
+
+    def test_cache(self):
+        source = os.path.join(self.tempdir, 'source.pgc')
+        self.data.save(source)
+        pg.VectorData(source, cache=True)
+        self.assertTrue(os.path.exists(columnar.cache_path(source)))
+        self.assertTrue(columnar.valid_cache(source, {}))
+        self.assertFalse(columnar.valid_cache(source, {'encoding':'latin'}))
+        data = pg.VectorData(source, cache=True)
+        self.assertEqual(data.filepath, source)
+        self.assertEqual([list(f.row) for f in data], rows)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
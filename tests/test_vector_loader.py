@@ -0,0 +1,161 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import pythongis as pg
+from pythongis.vector import loader
+
+# data
+
+fields = ['name', 'pop']
+rows = [['a', 1],
+        ['b', 20],
+        ['c', 30]]
+polygons = [{'type':'Polygon', 'coordinates':[[(x,x),(x+1,x),(x+1,x+1),(x,x)]]} for x in (0,2,5)]
+points = [{'type':'Point', 'coordinates':(x,x)} for x in (0,2,5)]
+
+# base class
+
+class BaseTestCases:
+
+    class TestFilters(unittest.TestCase):
+        geometries = None
+
+        def setUp(self):
+            self.tempdir = tempfile.mkdtemp()
+            self.path = os.path.join(self.tempdir, 'source.shp')
+            pg.VectorData(fields=fields, rows=rows, geometries=self.geometries).save(self.path)
+
+        def tearDown(self):
+            shutil.rmtree(self.tempdir)
+
+        def test_shapefile_bboxes(self):
+            bboxes = [bbox for i,bbox in loader.iter_shapefile_bboxes(self.path)]
+            self.assertEqual(bboxes, [list(pg.VectorData(geometries=[geom], rows=[[]]).bbox) for geom in self.geometries])
+
+        def test_bbox(self):
+            data = pg.VectorData(self.path, bbox=[6,6,1.5,1.5])
+            self.assertEqual([f['name'] for f in data], ['b','c'])
+
+        def test_select(self):
+            data = pg.VectorData(self.path, select=lambda r: r['pop'] < 10)
+            self.assertEqual([f['name'] for f in data], ['a'])
+
+        def test_bbox_select(self):
+            data = pg.VectorData(self.path, bbox=[0,0,10,10], select=lambda r: r['pop'] > 25)
+            self.assertEqual([f['name'] for f in data], ['c'])
+
+        def test_no_matches(self):
+            data = pg.VectorData(self.path, bbox=[100,100,101,101])
+            self.assertEqual(len(data), 0)
+            self.assertEqual(data.fields, ['name', 'pop'])
+            data = pg.VectorData(self.path, select=lambda r: False)
+            self.assertEqual(len(data), 0)
+
+    class TestDelimited(unittest.TestCase):
+        workers = None
+
+        def setUp(self):
+            self.tempdir = tempfile.mkdtemp()
+            self.path = os.path.join(self.tempdir, 'points.csv')
+            with open(self.path, 'w') as fobj:
+                fobj.write('id;name;x;y\n')
+                for i in range(500):
+                    fobj.write('{};n{};{},5;{}\n'.format(i, i%3, i, -i if i%10 else 'NULL'))
+
+        def tearDown(self):
+            shutil.rmtree(self.tempdir)
+
+        def load(self, **kwargs):
+            return loader.from_file(self.path, workers=self.workers, chunksize=1000, **kwargs)
+
+        def test_rows(self):
+            fields,rows,geoms,crs = self.load()
+            self.assertEqual(fields, ['id','name','x','y'])
+            self.assertEqual(len(rows), 500)
+            self.assertEqual(rows[:2], [[0,'n0',0.5,None], [1,'n1',1.5,-1]])
+
+        def test_xy(self):
+            fields,rows,geoms,crs = self.load(xfield='x', yfield='y')
+            self.assertEqual(geoms[1], {'type':'Point', 'coordinates':(1.5,-1)})
+            self.assertEqual(geoms[10], None)
+
+        def test_last(self):
+            fields,rows,geoms,crs = self.load(last=5)
+            self.assertEqual([row[0] for row in rows], [0,1,2,3,4])
+
+    class TestGeoJSON(unittest.TestCase):
+        ext = None
+
+        def setUp(self):
+            self.tempdir = tempfile.mkdtemp()
+            self.path = os.path.join(self.tempdir, 'source' + self.ext)
+            geoms = list(points)
+            geoms[1] = None
+            pg.VectorData(fields=fields, rows=rows, geometries=geoms).save(self.path)
+
+        def tearDown(self):
+            shutil.rmtree(self.tempdir)
+
+        def test_roundtrip(self):
+            data = pg.VectorData(self.path)
+            self.assertEqual(data.fields, fields)
+            self.assertEqual([list(f.row) for f in data], rows)
+            self.assertEqual(data[1].geometry, None)
+            self.assertEqual(list(data[2].geometry['coordinates']), [5,5])
+
+        def test_union_fields(self):
+            with open(self.path, 'w') as fobj:
+                if self.ext == '.geojson':
+                    fobj.write('{"type": "FeatureCollection", "crs": null, "features": [')
+                    fobj.write('{"type": "Feature", "properties": {"a": 1}, "geometry": null},')
+                    fobj.write('{"type": "Feature", "properties": {"b": "x"}, "geometry": {"type": "Point", "coordinates": [1, 2]}}]}')
+                else:
+                    fobj.write('{"type": "Feature", "properties": {"a": 1}, "geometry": null}\n')
+                    fobj.write('{"type": "Feature", "properties": {"b": "x"}, "geometry": {"type": "Point", "coordinates": [1, 2]}}\n')
+            data = pg.VectorData(self.path)
+            self.assertEqual(data.fields, ['a','b'])
+            self.assertEqual([list(f.row) for f in data], [[1,None], [None,'x']])
+
+        def test_streaming(self):
+            outpath = os.path.join(self.tempdir, 'out' + self.ext)
+            pg.vector.streaming.Streaming(self.path).select(lambda f: f['pop'] > 10).save(outpath)
+            self.assertEqual([f['name'] for f in pg.VectorData(outpath)], ['b','c'])
+
+# tests
+
+class TestPolygonFilters(BaseTestCases.TestFilters):
+    geometries = polygons
+
+class TestPointFilters(BaseTestCases.TestFilters):
+    geometries = points
+
+
+class TestDelimited(BaseTestCases.TestDelimited):
+    workers = None
+
+class TestDelimitedParallel(BaseTestCases.TestDelimited):
+    workers = 2
+
+    def test_same_as_sequential(self):
+        parallel = self.load(xfield='x', yfield='y')
+        sequential = loader.from_file(self.path, xfield='x', yfield='y')
+        self.assertEqual(parallel, sequential)
+
+class TestGeoJSONCollection(BaseTestCases.TestGeoJSON):
+    ext = '.geojson'
+
+class TestGeoJSONSeq(BaseTestCases.TestGeoJSON):
+    ext = '.geojsonl'
+
+class TestGeoJSONSeqRecordSeparator(BaseTestCases.TestGeoJSON):
+    ext = '.geojsons'
+
+    def test_record_separator(self):
+        with open(self.path) as fobj:
+            self.assertTrue(fobj.read().startswith('\x1e{'))
+
+
+if __name__ == '__main__':
+    unittest.main()
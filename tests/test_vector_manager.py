@@ -0,0 +1,91 @@
+import unittest
+
+import pythongis as pg
+
+# data
+
+square = [(0,0),(4,0),(4,4),(0,4),(0,0)]
+hole = [(1,1),(3,1),(3,3),(1,3),(1,1)]
+polygons = pg.VectorData(fields=['name'], rows=[['holed'], ['multi']],
+                         geometries=[{'type':'Polygon', 'coordinates':[square, hole]},
+                                     {'type':'MultiPolygon', 'coordinates':[[[(10,0),(11,0),(11,1),(10,1),(10,0)]],
+                                                                            [[(12,0),(13,0),(13,1),(12,1),(12,0)]]]}])
+points = pg.VectorData(fields=['name'],
+                       rows=[['inside'], ['inhole'], ['edge'], ['outside'], ['multi'], ['between']],
+                       geometries=[{'type':'Point', 'coordinates':c} for c in [(0.5,0.5), (2,2), (4,2), (6,6), (12.5,0.5), (11.5,0.5)]])
+
+# tests
+
+class TestWhere(unittest.TestCase):
+
+    def where(self, condition, **kwargs):
+        result = pg.vector.manager.where(points.copy(), polygons.copy(), condition, **kwargs)
+        return [f['name'] for f in result]
+
+    def test_intersects(self):
+        self.assertEqual(self.where('intersects'), ['inside', 'edge', 'multi'])
+
+    def test_within(self):
+        self.assertEqual(self.where('within'), ['inside', 'multi'])
+
+    def test_distance(self):
+        self.assertEqual(self.where('distance', radius=0.5), ['inside', 'edge', 'multi', 'between'])
+
+    def test_polygons(self):
+        result = pg.vector.manager.where(polygons.copy(), points.copy(), 'contains')
+        self.assertEqual([f['name'] for f in result], ['holed', 'multi'])
+        result = pg.vector.manager.where(polygons.copy(), polygons.copy(), 'equals')
+        self.assertEqual(len(result), 2)
+
+    def test_disjoint(self):
+        self.assertEqual(sorted(self.where('disjoint')), ['between', 'inhole', 'outside'])
+
+class TestSpatialJoin(unittest.TestCase):
+
+    def setUp(self):
+        self.left = pg.VectorData(fields=['a'], rows=[[i] for i in range(30)],
+                                  geometries=[{'type':'Polygon', 'coordinates':[[(i,0),(i+1.5,0),(i+1.5,1),(i,1),(i,0)]]} for i in range(30)])
+        self.right = pg.VectorData(fields=['b'], rows=[[i] for i in range(10)],
+                                   geometries=[{'type':'Polygon', 'coordinates':[[(i*3,0.5),(i*3+2,0.5),(i*3+2,2),(i*3,2),(i*3,0.5)]]} for i in range(10)])
+
+    def join(self, **kwargs):
+        result = pg.vector.manager.spatial_join(self.left.copy(), self.right.copy(), 'intersects', **kwargs)
+        return [(tuple(f.row), f.geometry and f.get_shapely().area) for f in result]
+
+    def test_workers(self):
+        self.assertEqual(self.join(workers=2), self.join())
+        self.assertEqual(self.join(workers=2, keepall=True), self.join(keepall=True))
+
+    def test_workers_clip(self):
+        self.assertEqual(self.join(workers=3, clip='intersection'), self.join(clip='intersection'))
+        self.assertEqual(self.join(workers=3, clip='difference'), self.join(clip='difference'))
+
+class TestOverlay(unittest.TestCase):
+
+    def setUp(self):
+        def box(x, y, size):
+            return {'type':'Polygon', 'coordinates':[[(x,y),(x+size,y),(x+size,y+size),(x,y+size),(x,y)]]}
+        self.left = pg.VectorData(fields=['a'], rows=[[i] for i in range(4)],
+                                  geometries=[box(x, y, 2) for x in (0,2) for y in (0,2)])
+        self.right = pg.VectorData(fields=['b'], rows=[['x'], ['y']],
+                                   geometries=[box(1, 1, 2), box(10, 10, 1)])
+
+    def overlay(self, how):
+        result = pg.vector.manager.overlay(self.left, self.right, how)
+        return sorted(((tuple(f.row), f.get_shapely().area) for f in result), key=repr)
+
+    def test_intersection(self):
+        self.assertEqual(self.overlay('intersection'), [((0,'x'), 1), ((1,'x'), 1), ((2,'x'), 1), ((3,'x'), 1)])
+
+    def test_difference(self):
+        self.assertEqual(self.overlay('difference'), [((0,), 3), ((1,), 3), ((2,), 3), ((3,), 3)])
+
+    def test_union(self):
+        result = self.overlay('union')
+        self.assertEqual(len(result), 9)
+        self.assertEqual(sum(area for row,area in result), 17)
+        self.assertTrue(((None,'y'), 1) in result)
+
+
+if __name__ == '__main__':
+    unittest.main()
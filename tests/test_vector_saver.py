@@ -0,0 +1,76 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import pythongis as pg
+from pythongis.vector import saver
+
+# data
+
+fields = ['name', 'pop', 'area']
+rows = [['a', 5, 1.5],
+        ['bb', 17, None],
+        ['c', None, 3.25]]
+geometries = [{'type':'Point', 'coordinates':(1,2)},
+              None,
+              {'type':'Point', 'coordinates':(3,4)}]
+
+# tests
+
+class TestFieldTypes(unittest.TestCase):
+
+    def test_detect(self):
+        fieldtypes = [(typ,length,deci) for typ,func,length,deci in saver.detect_fieldtypes(fields, rows)]
+        self.assertEqual(fieldtypes, [('C',2,0), ('N',2,0), ('N',4,2)])
+
+    def test_detect_mixed(self):
+        fieldtypes = saver.detect_fieldtypes(['x'], iter([[1], ['text'], [2.5], [float('nan')]]))
+        self.assertEqual(fieldtypes[0][0], 'C')
+        self.assertEqual(fieldtypes[0][2], 4)
+
+    def test_parse(self):
+        fieldtypes = saver.parse_fieldtypes(fields, {'name':'C', 'pop':('N',5,0), 'area':'F'})
+        self.assertEqual([(typ,length,deci) for typ,func,length,deci in fieldtypes], [('C',254,0), ('N',5,0), ('F',19,8)])
+        with self.assertRaises(Exception):
+            saver.parse_fieldtypes(fields, {'name':'C'})
+
+class TestSaveOptions(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'out.shp')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def check(self):
+        data = pg.VectorData(self.path)
+        self.assertEqual([list(f.row) for f in data], [['a',5,1.5], ['bb',17,None], ['c',None,3.25]])
+        self.assertEqual(data[1].geometry, None)
+        self.assertEqual(list(data[2].geometry['coordinates']), [3,4])
+        return data
+
+    def test_generators(self):
+        # one-shot iterators are spilled to disk and only read once
+        saver.to_file(fields, (list(r) for r in rows), iter(geometries), self.path)
+        self.check()
+
+    def test_spill(self):
+        saver.to_file(fields, rows, geometries, self.path, spill=True)
+        self.check()
+
+    def test_sample(self):
+        saver.to_file(fields, (list(r) for r in rows), iter(geometries), self.path, sample=3)
+        self.check()
+        # values after the sample must fit the detected types
+        saver.to_file(fields, (list(r) for r in rows), iter(geometries), self.path, sample=1)
+        self.assertEqual(pg.VectorData(self.path)[2]['area'], 3.2)
+
+    def test_fieldtypes(self):
+        saver.to_file(fields, iter(rows), iter(geometries), self.path, fieldtypes=['C', ('N',10,0), ('N',10,2)])
+        self.check()
+
+
+if __name__ == '__main__':
+    unittest.main()
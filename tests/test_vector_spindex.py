@@ -1,12 +1,14 @@
 
 import unittest
+import os
+import tempfile
+import shutil
 
 import pythongis as pg
 
 # data
 
-pointdata = pg.VectorData('data/ne_10m_populated_places_simple.shp',
-                            encoding='latin')
+DATADIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
 # base class
 
@@ -41,15 +43,248 @@ class BaseTestCases:
             self.assertTrue(hasattr(self.data, 'spindex'))
             self.assertTrue(isinstance(self.data.spindex, pg.vector.spindex.QuadTree))
 
+        def test_quick_nearest(self):
+            self.create_spindex()
+            bbox = [10,10,10,10]
+            distance = lambda f: pg.vector.spindex.bbox_distance(bbox, f.bbox)
+            expected = sorted(distance(f) for f in self.data if f.geometry)[:5]
+            self.assertEqual([distance(f) for f in self.data.quick_nearest(bbox, n=5)], expected)
+
+        def test_packed_rtree(self):
+            self.create_spindex(type='rtree', backend='packed')
+            self.assertTrue(isinstance(self.data.spindex, pg.vector.spindex.Rtree))
+            bbox = [0,0,20,20]
+            expected = [f.id for f in self.data if f.geometry and
+                        f.bbox[0] <= bbox[2] and f.bbox[2] >= bbox[0] and f.bbox[1] <= bbox[3] and f.bbox[3] >= bbox[1]]
+            self.assertEqual(sorted(f.id for f in self.data.quick_overlap(bbox)), sorted(expected))
+
+        def test_grid(self):
+            self.create_spindex(type='grid')
+            self.assertTrue(isinstance(self.data.spindex, pg.vector.spindex.GridIndex))
+            bbox = [0,0,20,20]
+            expected = [f.id for f in self.data if f.geometry and
+                        f.bbox[0] <= bbox[2] and f.bbox[2] >= bbox[0] and f.bbox[1] <= bbox[3] and f.bbox[3] >= bbox[1]]
+            self.assertEqual(sorted(f.id for f in self.data.quick_overlap(bbox)), sorted(expected))
+
+    class TestPackedRtree(unittest.TestCase):
+        node_capacity = None
+
+        def setUp(self):
+            self.items = [(i, [x, y, x+1+i%3, y+1]) for i,(x,y) in enumerate((x,y) for x in range(0,100,3) for y in range(0,100,7))]
+            self.index = pg.vector.spindex.Rtree(backend='packed', node_capacity=self.node_capacity)
+            self.index.load(self.items)
+
+        def test_intersects(self):
+            bbox = [10,10,30,40]
+            expected = [i for i,b in self.items if b[0] <= bbox[2] and b[2] >= bbox[0] and b[1] <= bbox[3] and b[3] >= bbox[1]]
+            self.assertEqual(sorted(self.index.intersects(bbox)), expected)
+            self.assertEqual(list(self.index.intersects([-10,-10,-5,-5])), [])
+
+        def test_intersects_many(self):
+            self.index.insert('new', [500,500,501,501])
+            bboxes = [[10,10,30,40], [-10,-10,-5,-5], [0,0,0,0], [499,499,500,500]]
+            results = self.index.intersects_many(bboxes)
+            self.assertEqual([sorted(ids, key=str) for ids in results], [sorted(self.index.intersects(bbox), key=str) for bbox in bboxes])
+            self.assertEqual(results[3], ['new'])
+
+        def test_nearest(self):
+            ids = list(self.index.nearest([50,-20,50,-20], num_results=3))
+            self.assertEqual(len(ids), 3)
+            self.assertTrue(all(self.items[i][1][1] == 0 for i in ids))
+            ids = list(self.index.nearest([50,-20,50,-20], num_results=None, radius=20))
+            self.assertEqual(sorted(ids), sorted(i for i,b in self.items if b[1] == 0 and b[0] <= 50 <= b[2]))
+
+        def test_insert(self):
+            self.index.insert('new', [500,500,501,501])
+            self.assertEqual(list(self.index.intersects([499,499,500,500])), ['new'])
+            self.assertEqual(list(self.index.nearest([600,600,600,600])), ['new'])
+
+        def test_delete(self):
+            for i in range(0, len(self.items), 2):
+                self.index.delete(i)
+            self.index.delete(1)
+            self.index.insert(1, [500,500,501,501])
+            ids = list(self.index.intersects([0,0,100,100]))
+            self.assertEqual(sorted(ids), list(range(3, len(self.items), 2)))
+            self.assertEqual(list(self.index.nearest([600,600,600,600])), [1])
+
+
+class TestGridIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.items = [(i, [x, y, x, y]) for i,(x,y) in enumerate((x*0.5,y*1.5) for x in range(40) for y in range(30))]
+        self.index = pg.vector.spindex.GridIndex()
+        self.index.load(self.items)
+
+    def expected(self, bbox):
+        return [i for i,b in self.items if bbox[0] <= b[0] <= bbox[2] and bbox[1] <= b[1] <= bbox[3]]
+
+    def test_intersects(self):
+        bbox = [2.2,3,7.5,10]
+        self.assertEqual(sorted(self.index.intersects(bbox)), self.expected(bbox))
+        self.assertEqual(list(self.index.intersects([-10,-10,-5,-5])), [])
+        self.assertEqual(len(self.index.intersects([-100,-100,100,100])), len(self.items))
+
+    def test_cell_edges(self):
+        # points rounded to the cellsize fall right on the cell edges
+        points = [(round(x*0.1, 1), round(y*0.1, 1)) for x in range(50) for y in range(50)]
+        for cellsize in (None, 0.1):
+            index = pg.vector.spindex.GridIndex(cellsize=cellsize)
+            index.load([(i, [x, y, x, y]) for i,(x,y) in enumerate(points)])
+            results = index.intersects_many([[x, y, x, y] for x,y in points])
+            self.assertEqual(results, [[i] for i in range(len(points))])
+        self.assertEqual(index.intersects([1,0,1,0]), [points.index((1.0,0.0))])
+
+    def test_mixed_ids(self):
+        self.index.insert('new', [100,100,100,100])
+        self.index.load([])
+        self.assertEqual(self.index.intersects([0,0,0,0]), [0])
+        self.assertEqual(self.index.intersects([100,100,100,100]), ['new'])
+
+    def test_intersects_many(self):
+        bboxes = [[2.2,3,7.5,10], [-10,-10,-5,-5], [0,0,0,0], [19,40,30,50]]
+        results = self.index.intersects_many(bboxes)
+        self.assertEqual([sorted(ids) for ids in results], [self.expected(bbox) for bbox in bboxes])
+
+    def test_within_distance_many(self):
+        points = [(5,5), (0,0), (-3,-3)]
+        results = self.index.within_distance_many(points, [2, 1, 1])
+        expected = [[i for i,b in self.items if (b[0]-x)**2 + (b[1]-y)**2 <= r**2] for (x,y),r in zip(points, [2,1,1])]
+        self.assertEqual([sorted(ids) for ids in results], expected)
 
+    def test_nearest(self):
+        self.assertEqual(list(self.index.nearest([-1,0,-1,0], num_results=2)), [0,30])
+        ids = list(self.index.nearest([5,6,5,6], num_results=None, radius=1))
+        self.assertEqual(sorted(ids), [i for i,b in self.items if (b[0]-5)**2 + (b[1]-6)**2 <= 1])
+
+    def test_insert_delete(self):
+        self.index.delete(0)
+        self.index.insert('new', [100,100,100,100])
+        self.assertEqual(self.index.intersects([0,0,0,0]), [])
+        self.assertEqual(self.index.within_distance_many([(99,99)], 2), [['new']])
+        self.assertEqual(list(self.index.nearest([0,0,0,0], num_results=1)), [30])
+        with self.assertRaises(Exception):
+            self.index.insert('line', [0,0,1,1])
+
+class TestNearest(unittest.TestCase):
+
+    def setUp(self):
+        import random
+        rand = random.Random(1)
+        self.items = []
+        for i in range(500):
+            x,y = rand.uniform(0, 100),rand.uniform(0, 100)
+            self.items.append((i, [x, y, x+rand.uniform(0, 10), y+rand.uniform(0, 10)]))
+
+    def check(self, index):
+        from pythongis.vector.spindex import bbox_distance
+        index.load(self.items)
+        index.delete(0)
+        items = dict(self.items[1:])
+        for bbox in [[50,50,50,50], [-20,30,-10,40], [90,90,120,95]]:
+            expected = sorted(bbox_distance(bbox, b) for b in items.values())
+            ids = list(index.nearest(bbox, num_results=10))
+            self.assertEqual([bbox_distance(bbox, items[id]) for id in ids], expected[:10])
+            ids = list(index.nearest(bbox, num_results=None, radius=15))
+            self.assertEqual([bbox_distance(bbox, items[id]) for id in ids], [d for d in expected if d <= 15])
+
+    def test_quadtree(self):
+        self.check(pg.vector.spindex.QuadTree(bbox=[0,0,100,100], max_items=4))
+
+    def check_rtree(self, backend):
+        try:
+            index = pg.vector.spindex.Rtree(backend=backend)
+        except ImportError:
+            self.skipTest('{} is not installed'.format(backend))
+        self.check(index)
+
+    def test_rtree(self):
+        self.check_rtree('rtree')
+
+    def test_pyrtree(self):
+        self.check_rtree('pyrtree')
+
+class TestPersistentIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'points.shp')
+        pg.VectorData(fields=['id'], rows=[[i] for i in range(100)],
+                      geometries=[{'type':'Point', 'coordinates':(i%10,i//10)} for i in range(100)]).save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_reuse(self):
+        data = pg.VectorData(self.path)
+        data.create_spatial_index(type='rtree', backend='packed', persist=True)
+        self.assertTrue(os.path.exists(self.path + '.pgi'))
+        data = pg.VectorData(self.path)
+        data.create_spatial_index(persist=True)
+        self.assertEqual(data.spindex._backend.name, 'packed')
+        self.assertEqual(sorted(f['id'] for f in data.quick_overlap([0,0,1,1])), [0,1,10,11])
+        # only loaded when asked to
+        data = pg.VectorData(self.path)
+        data.create_spatial_index()
+        self.assertNotEqual(data.spindex._backend.name, 'packed')
+
+    def test_reuse_backends(self):
+        for type,backend in [('quadtree','pyqtree'), ('grid','grid')]:
+            pg.VectorData(self.path).create_spatial_index(type=type, backend=backend, persist=True)
+            data = pg.VectorData(self.path)
+            data.create_spatial_index(type=type, persist=True)
+            self.assertEqual(data.spindex._backend.name, backend)
+            self.assertEqual(sorted(f['id'] for f in data.quick_overlap([0,0,1,1])), [0,1,10,11])
+            self.assertEqual([f['id'] for f in data.quick_nearest(data[55].bbox, n=1)], [55])
+
+    def test_modified(self):
+        pg.VectorData(self.path).create_spatial_index(type='rtree', backend='packed', persist=True)
+        data = pg.VectorData(self.path)
+        for feat in data:
+            feat.transform(lambda coords: [(x+100,y+100) for x,y in coords])
+        data.create_spatial_index(persist=True)
+        self.assertEqual(sorted(f['id'] for f in data.quick_overlap([100,100,101,101])), [0,1,10,11])
+        self.assertEqual(list(data.quick_overlap([0,0,1,1])), [])
+
+    def test_function_options(self):
+        import warnings
+        data = pg.VectorData(self.path, select=lambda f: f['id'] < 50)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            data.create_spatial_index(type='rtree', backend='packed', persist=True)
+        self.assertFalse(os.path.exists(self.path + '.pgi'))
+        self.assertTrue(any(('persisted' in str(w.message) for w in caught)))
+        self.assertEqual(sorted(f['id'] for f in data.quick_overlap([0,0,1,1])), [0,1,10,11])
+
+    def test_outdated(self):
+        pg.VectorData(self.path).create_spatial_index(type='rtree', backend='packed', persist=True)
+        # loaded with other options
+        data = pg.VectorData(self.path, bbox=[0,0,1,1])
+        data.create_spatial_index(type='quadtree')
+        self.assertEqual(data.spindex.type, 'quadtree')
+        # other type requested
+        data = pg.VectorData(self.path)
+        data.create_spatial_index(type='quadtree')
+        self.assertEqual(data.spindex.type, 'quadtree')
 
 # tests
 
 class TestInitPointData(BaseTestCases.TestInitSpindex):
 
-    def __init__(self, *args, **kwargs):
-        super(BaseTestCases.TestInitSpindex, self).__init__(*args, **kwargs)
-        self.data = pointdata.copy()
+    @classmethod
+    def setUpClass(cls):
+        # loaded here rather than at import, so that the other tests still run without the data file
+        cls.pointdata = pg.VectorData(os.path.join(DATADIR, 'ne_10m_populated_places_simple.shp'),
+                                      encoding='latin')
+
+    def setUp(self):
+        self.data = self.pointdata.copy()
+
+class TestPackedRtree(BaseTestCases.TestPackedRtree):
+    node_capacity = 16
+
+class TestPackedRtreeSmallNodes(BaseTestCases.TestPackedRtree):
+    node_capacity = 2
     
     
 
@@ -0,0 +1,159 @@
+import unittest
+
+import pythongis as pg
+from pythongis.vector import sql
+
+# data
+
+def squares():
+    return pg.VectorData(fields=['name'], rows=[['sq%s' % i] for i in range(4)],
+                         geometries=[{'type':'Polygon', 'coordinates':[[(i*10,0),(i*10+10,0),(i*10+10,10),(i*10,10),(i*10,0)]]}
+                                     for i in range(4)])
+
+def points():
+    return pg.VectorData(fields=['id', 'pop'], rows=[[i, i*100] for i in range(40)],
+                         geometries=[{'type':'Point', 'coordinates':(i+0.5, 5)} for i in range(40)])
+
+# tests
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.squares = squares()
+        self.points = points()
+
+    def test_single_source(self):
+        q = sql.Query(self.points).where(lambda f: f['pop'] >= 3500).select([('id', lambda f: f['id'])])
+        self.assertEqual(q.fields, ['id'])
+        self.assertEqual(list(q), [[35],[36],[37],[38],[39]])
+        self.assertEqual(list(q.limit(2)), [[35],[36]])
+
+    def test_spatial_join(self):
+        q = sql.Query(self.squares, self.points)
+        q = q.where(lambda f: f['pop'] % 500 == 0, sources=1)
+        q = q.where('within', sources=(1,0))
+        q = q.select([('square', lambda items: items[0]['name']), ('point', lambda items: items[1]['id'])],
+                     geomselect=lambda items: items[1].geometry)
+        expected = [(['sq%s' % (i//10), i], {'type':'Point', 'coordinates':(i+0.5, 5)}) for i in range(0, 40, 5)]
+        self.assertEqual(list(q), expected)
+        plan = q.explain()
+        self.assertTrue('Index join source 1 on within(1,0)' in plan)
+        self.assertTrue('Filter 1 condition(s) on source 1' in plan)
+
+        # same result without the spatial index as a nested loop join
+        nested = sql.Query(self.squares, list(self.points))
+        nested = nested.where(lambda f: f['pop'] % 500 == 0, sources=1)
+        nested = nested.where('within', sources=(1,0))
+        nested = nested.select(q._select, q._geomselect)
+        self.assertTrue('Nested loop join source 1' in nested.explain())
+        self.assertEqual(list(nested), expected)
+
+        data = q.to_data()
+        self.assertEqual(data.fields, ['square', 'point'])
+        self.assertEqual(len(data), 8)
+
+    def test_multi_source_condition(self):
+        q = sql.Query(self.squares, self.points, self.squares)
+        q = q.where('intersects', sources=(0,1))
+        q = q.where(lambda items: items[0]['name'] == items[1]['name'] == 'sq1', sources=(0,2))
+        q = q.select([('count', lambda items: items[1]['id'])])
+        self.assertEqual(len(list(q)), 10)
+        self.assertTrue('Nested loop join source 2 where 1 condition(s)' in q.explain())
+
+    def test_query_function(self):
+        results = sql.query([self.squares, self.points],
+                            _select=[('name', lambda items: items[0]['name'], 'first'),
+                                     ('count', lambda items: items[1]['id'], 'count')],
+                            _where=lambda items: items[0].get_shapely().contains(items[1].get_shapely()),
+                            _groupby=lambda items: items[0]['name'])
+        self.assertEqual(next(results), ['name', 'count'])
+        self.assertEqual(list(results), [['sq0',10], ['sq1',10], ['sq2',10], ['sq3',10]])
+
+class TestAggreg(unittest.TestCase):
+
+    def test_stats(self):
+        values = [3, None, 1, 'x', 4, 1, float('nan'), 5]
+        stats = ['count', 'sum', 'mean', 'min', 'max', 'var', 'stdev', 'first', 'last', 'distinct', ',concat']
+        row = sql.aggreg(values, [(stat, lambda v: v, stat) for stat in stats])
+        self.assertEqual(row[:5], [6, 14.0, 2.8, 1.0, 5.0])
+        self.assertAlmostEqual(row[5], 2.56)
+        self.assertAlmostEqual(row[6], 1.6)
+        self.assertEqual(row[7:], [3, 5, 5, '3,1,x,4,1,5'])
+        row = sql.aggreg([3, 1, 4, 1, 5, 3], [(stat, lambda v: v, stat) for stat in ('majority', 'minority')])
+        self.assertEqual(row, [1, 4])
+        self.assertEqual(sql.aggreg([None], [('sum', lambda v: v, 'sum')]), [''])
+        self.assertEqual(sql.aggreg(iter([2, 1]), [('sorted', lambda v: v, sorted)]), [[1, 2]])
+
+    def test_distinct_estimate(self):
+        row = sql.aggreg(range(50000), [('distinct', lambda v: v % 20000, 'distinct')])
+        self.assertTrue(abs(row[0] - 20000) < 1000)
+
+    def test_compute_by(self):
+        data = pg.VectorData(fields=['group', 'value'], rows=[['a', 1], ['b', 2], ['a', 3], ['b', None]], geometries=[None]*4)
+        data.compute('total', lambda f: f['value'], by='group', stat='sum')
+        self.assertEqual([f['total'] for f in data], [4.0, 2.0, 4.0, 2.0])
+        data.compute('count', lambda f: f['value'], by=lambda f: [f['group']], stat='count')
+        self.assertEqual([f['count'] for f in data], [2, 1, 2, 1])
+        agg = data.aggregate(['group'], fieldmapping=[('mean', 'value', 'mean')])
+        self.assertEqual([list(f.row) for f in agg], [['a', 2.0], ['b', 2.0]])
+
+class TestGroupby(unittest.TestCase):
+
+    def test_hash_groupby(self):
+        items = [(i * 7) % 50 for i in range(500)]
+        groups = list(sql.hash_groupby(items, lambda v: v % 10))
+        self.assertEqual([k for k,_ in groups], [0, 7, 4, 1, 8, 5, 2, 9, 6, 3])
+        self.assertEqual(groups[1][1][:3], [7, 27, 47])
+        # spilled to disk gives the same result
+        self.assertEqual(list(sql.hash_groupby(items, lambda v: v % 10, maxgroups=3)), groups)
+        self.assertEqual([k for k,_ in sql.hash_groupby(items, lambda v: [v % 2], maxgroups=1)], [[0], [1]])
+        groups = list(sql.hash_groupby(items[:4], lambda v: {'mod': [v % 2]}))
+        self.assertEqual(groups, [({'mod': [0]}, [0, 14]), ({'mod': [1]}, [7, 21])])
+
+    def test_sort(self):
+        groups = list(sql.groupby(['b', 'a', 'b', 'c'], lambda v: v, sort=True))
+        self.assertEqual(groups, [['a'], ['b', 'b'], ['c']])
+        groups = list(sql.groupby(['b', 'a', 'b', 'c'], lambda v: v))
+        self.assertEqual(groups, [['b', 'b'], ['a'], ['c']])
+
+    def test_group(self):
+        data = pg.VectorData(fields=['name'], rows=[['b'], ['a'], ['b'], ['a']],
+                             geometries=[{'type':'Point', 'coordinates':(i%2, 0)} for i in range(4)])
+        groups = [(key, [f.id for f in feats]) for key,feats in data.group('name', maxgroups=1)]
+        self.assertEqual(groups, [('b', [0, 2]), ('a', [1, 3])])
+        groups = [(key, [f.id for f in feats]) for key,feats in data.group('name', sort=True)]
+        self.assertEqual(groups, [('a', [1, 3]), ('b', [0, 2])])
+        dups = data.duplicates(fieldmapping=[('names', 'name', ',concat')])
+        self.assertEqual([f['names'] for f in dups], ['b,b', 'a,a'])
+
+class TestSlidingWindow(unittest.TestCase):
+
+    def test_matches_aggreg(self):
+        import random
+        rand = random.Random(1)
+        values = [rand.choice([None, 'x', rand.randint(0, 5), rand.random()]) for _ in range(300)]
+        stats = ['count', 'sum', 'mean', 'min', 'max', 'var', 'stdev', 'majority', 'first', 'last', 'distinct', 'concat', len]
+        fieldmapping = [(str(stat), lambda v: v, stat) for stat in stats]
+        fieldmapping[7] = ('majority', lambda v: None if v == 'x' else v, 'majority') # needs comparable values
+        window = sql.SlidingWindow(7, fieldmapping)
+        for i,val in enumerate(values):
+            window.add(val)
+            expected = sql.aggreg(values[max(0, i-6):i+1], fieldmapping)
+            for stat,result,exp in zip(stats, window.result(), expected):
+                if isinstance(exp, float):
+                    self.assertAlmostEqual(result, exp, msg=stat)
+                else:
+                    self.assertEqual(result, exp, msg=stat)
+
+    def test_moving_window(self):
+        data = pg.VectorData(fields=['loc', 'value'], rows=[['b' if i % 2 else 'a', i] for i in range(8)], geometries=[None]*8)
+        data.moving_window(3, [('avg', 'value', 'mean'), ('top', 'value', 'max')], groupby='loc')
+        self.assertEqual([f['avg'] for f in data], [0.0, 1.0, 1.0, 2.0, 2.0, 3.0, 4.0, 5.0])
+        self.assertEqual([f['top'] for f in data], [0.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 7.0])
+        # unhashable group values
+        data.moving_window(3, [('avg2', 'value', 'mean')], groupby=lambda f: [f['loc']])
+        self.assertEqual([f['avg2'] for f in data], [f['avg'] for f in data])
+
+
+if __name__ == '__main__':
+    unittest.main()
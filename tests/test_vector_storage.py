@@ -0,0 +1,233 @@
+import unittest
+
+import pythongis as pg
+
+# data
+
+fields = ['name', 'pop', 'area']
+rows = [['a', 5, 1.5],
+        ['b', 7, 2.5],
+        ['c', None, 3.5]]
+geometries = [{'type':'Point', 'coordinates':(1,2)},
+              {'type':'MultiPoint', 'coordinates':[(3,4),(5,6)]},
+              None]
+
+# base class
+
+class BaseTestCases:
+
+    class TestStorage(unittest.TestCase):
+        storage = None
+        lazy = False
+
+        def setUp(self):
+            self.data = pg.VectorData(fields=list(fields), rows=[list(r) for r in rows],
+                                      geometries=geometries, storage=self.storage, lazy=self.lazy)
+
+        def test_rows(self):
+            self.assertEqual([list(f.row) for f in self.data], rows)
+
+        def test_geometries(self):
+            self.assertEqual(self.data.bbox, (1,2,5,6))
+            self.assertEqual(self.data[1].geometry['type'], 'MultiPoint')
+            self.assertEqual(self.data[2].geometry, None)
+
+        def test_setitem(self):
+            feat = self.data[0]
+            feat['pop'] = 'text'
+            self.assertEqual(self.data[0]['pop'], 'text')
+
+        def test_add_feature(self):
+            feat = self.data.add_feature(['d', 1, 1.0], {'type':'Point', 'coordinates':(10,10)})
+            self.assertEqual(len(self.data), 4)
+            self.assertEqual(self.data[feat.id]['name'], 'd')
+            self.assertEqual(self.data.bbox, (1,2,10,10))
+
+        def test_add_drop_field(self):
+            self.data.add_field('new', index=1)
+            self.data.compute('new', 3)
+            self.assertEqual([f['new'] for f in self.data], [3,3,3])
+            self.data.drop_field('pop')
+            self.assertEqual(list(self.data[0].row), ['a', 3, 1.5])
+
+        def test_transform(self):
+            self.data[0].transform(lambda coords: [(x+1,y+1) for x,y in coords])
+            self.assertEqual(self.data[0].geometry['coordinates'], (2,3))
+            self.assertEqual(self.data[0].bbox, [2,3,2,3])
+
+        def test_shapely_cache(self):
+            feat = self.data[0]
+            self.assertEqual(feat.get_shapely().coords[0], (1,2))
+            self.assertTrue(feat.get_prepared().intersects(feat.get_shapely()))
+            feat.geometry = {'type':'Point', 'coordinates':(3,3)}
+            self.assertEqual(feat.get_shapely().coords[0], (3,3))
+            feat.transform(lambda coords: [(x+1,y+1) for x,y in coords])
+            self.assertEqual(self.data[0].get_shapely().coords[0], (4,4))
+
+        def test_join(self):
+            other = pg.VectorData(fields=['name', 'kind', 'count'],
+                                  rows=[['b', 'x', 1], ['a', 'y', 2], ['b', 'z', 3], [None, 'w', 4]], geometries=[None]*4)
+            joined = self.data.join(other, 'name')
+            self.assertEqual(joined.fields, ['name', 'pop', 'area', 'kind', 'count'])
+            self.assertEqual([(f['name'], f['kind']) for f in joined], [('a','y'), ('b','x'), ('b','z'), ('c',None)])
+            joined = self.data.join(other, ['name'], collapse=True, keepall=False, fieldmapping=[('count', 'count', 'sum')])
+            self.assertEqual([(f['name'], f['kind'], f['count']) for f in joined], [('a','y',2), ('b','x',4)])
+            other = pg.VectorData(fields=['name', 'kind'], rows=[['a', 'y'], ['b', 'x'], ['b', 'z']], geometries=[None]*3)
+            joined = self.data.join(other, 'name', presorted=True)
+            self.assertEqual([(f['name'], f['kind']) for f in joined], [('a','y'), ('b','x'), ('b','z'), ('c',None)])
+
+        def test_sort(self):
+            self.data.sort(key=lambda f: f['name'], reverse=True)
+            self.assertEqual([f['name'] for f in self.data], ['c','b','a'])
+            self.assertEqual(self.data.field_values('name'), ['a','b','c'])
+
+        def test_copy(self):
+            new = self.data.copy()
+            next(iter(new))['name'] = 'changed'
+            self.assertEqual(self.data[0]['name'], 'a')
+
+        def test_field_index(self):
+            self.assertEqual(self.data.field_index('area'), 2)
+            self.data.add_field('new', index=0)
+            self.data.rename_field('name', 'label')
+            self.assertEqual(self.data.field_index('label'), 1)
+            self.assertEqual(self.data[0]['label'], 'a')
+            self.data.fields.insert(0, 'inplace') # in-place changes are detected as well
+            self.assertEqual(self.data.field_index('area'), 4)
+            with self.assertRaises(ValueError):
+                self.data.field_index('name')
+
+        def test_columns(self):
+            self.assertEqual(list(self.data.column('name')), ['a','b','c'])
+            names,areas = self.data.columns('name', 'area')
+            self.assertEqual(list(areas), [1.5,2.5,3.5])
+            self.assertEqual(len(self.data.columns()), 3)
+
+        def test_spatial_index(self):
+            self.data.create_spatial_index()
+            ids = [f.id for f in self.data.quick_overlap([0,0,2,3])]
+            self.assertEqual(ids, [0])
+
+        def test_quick_overlap_many(self):
+            self.data.create_spatial_index()
+            results = self.data.quick_overlap_many([[0,0,2,3], None, [4,5,1,1], [20,20,30,30]])
+            self.assertEqual([sorted(f.id for f in feats) for feats in results], [[0], [], [0,1], []])
+            results = self.data.quick_overlap_iter(iter([[0,0,2,3], None, [4,5,1,1], [20,20,30,30]]), batchsize=3)
+            self.assertEqual([sorted(f.id for f in feats) for feats in results], [[0], [], [0,1], []])
+
+        def test_spatial_index_updates(self):
+            self.data.create_spatial_index()
+            feat = self.data.add_feature(['d', 1, 1.0], {'type':'Point', 'coordinates':(10,10)})
+            self.assertEqual([f.id for f in self.data.quick_overlap([9,9,11,11])], [feat.id])
+            self.data[0].geometry = {'type':'Point', 'coordinates':(20,20)}
+            self.assertEqual([f.id for f in self.data.quick_overlap([19,19,21,21])], [0])
+            self.data[1].transform(lambda coords: [(x+100,y) for x,y in coords])
+            self.assertEqual(list(self.data.quick_overlap([0,0,6,6])), [])
+            del self.data[feat.id]
+            self.assertEqual(list(self.data.quick_overlap([9,9,11,11])), [])
+
+        def test_quick_nearest(self):
+            self.data.create_spatial_index()
+            self.assertEqual([f.id for f in self.data.quick_nearest([0,0,0,0], n=1)], [0])
+            self.assertEqual([f.id for f in self.data.quick_nearest([6,6,6,6], radius=1.5)], [1])
+            self.assertEqual([f.id for f in self.data.quick_nearest(geometry={'type':'Point', 'coordinates':(4,5)})], [1,0])
+            self.assertEqual([f.id for f in self.data.quick_nearest(geometry={'type':'Point', 'coordinates':(4,5)}, radius=1)], [])
+
+# tests
+
+class TestDefaultStorage(BaseTestCases.TestStorage):
+    storage = None
+
+class TestLazyFeatures(BaseTestCases.TestStorage):
+    lazy = True
+
+    def test_lazy(self):
+        self.assertEqual(len(self.data.features._feats), 0)
+        self.assertEqual(self.data.bbox, (1,2,5,6))
+        self.assertEqual(len(self.data.features._feats), 0)
+        feat = self.data[1]
+        self.assertTrue(feat is self.data[1])
+        self.assertEqual(len(self.data.features._feats), 1)
+
+    def test_shapely_cache_size(self):
+        size = pg.vector.data.SHAPELY_CACHE_SIZE
+        try:
+            pg.vector.data.SHAPELY_CACHE_SIZE = 1
+            first,second = self.data[0],self.data[1]
+            geom = first.get_shapely()
+            self.assertTrue(first.get_shapely() is geom)
+            second.get_shapely()
+            self.assertEqual(first._cached_shapely, None)
+            # disabled
+            pg.vector.data.SHAPELY_CACHE_SIZE = 0
+            pg.vector.data._shapely_cache.clear()
+            second.get_prepared()
+            self.assertEqual(second._cached_shapely, None)
+        finally:
+            pg.vector.data.SHAPELY_CACHE_SIZE = size
+
+    def test_shapely_cache_release(self):
+        import gc, weakref
+        data = pg.VectorData(fields=list(fields), rows=[list(r) for r in rows], geometries=geometries)
+        data[0].get_shapely()
+        ref = weakref.ref(data)
+        del data
+        gc.collect()
+        self.assertEqual(ref(), None)
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            self.data[0].foo = 1
+
+class TestColumnarStorage(BaseTestCases.TestStorage):
+    storage = 'columnar'
+
+    def test_typed_columns(self):
+        cols = self.data._storage.columns
+        self.assertEqual(cols[2].typecode, 'd')
+        self.assertTrue(isinstance(cols[1], list)) # because of None value
+        self.data[0]['area'] = 'text'
+        self.assertTrue(isinstance(self.data._storage.columns[2], list))
+
+class TestSqliteStorage(BaseTestCases.TestStorage):
+    storage = 'sqlite'
+
+    def test_reopen(self):
+        import os, tempfile
+        path = os.path.join(tempfile.mkdtemp(), 'test.sqlite')
+        pg.VectorData(fields=list(fields), rows=[list(r) for r in rows], geometries=geometries,
+                      storage='sqlite', database=path)
+        data = pg.VectorData(storage='sqlite', database=path)
+        self.assertEqual(data.fields, fields)
+        self.assertEqual(data.type, 'Point')
+        self.assertEqual([list(f.row) for f in data], rows)
+
+    def test_delete(self):
+        del self.data.features[0]
+        self.data.create_spatial_index()
+        self.assertEqual(list(self.data.quick_overlap([0,0,10,10])), [self.data[1]])
+        self.assertEqual(self.data.field_values('name'), ['b','c'])
+
+    def test_nearest(self):
+        import random
+        from pythongis.vector.spindex import bbox_distance
+        rand = random.Random(1)
+        data = pg.VectorData(fields=['id'], storage='sqlite')
+        for i in range(1000):
+            x,y = rand.uniform(0, 100),rand.uniform(0, 100)
+            data.add_feature([i], {'type':'Point', 'coordinates':(x,y)})
+        data.create_spatial_index()
+        bbox = [50.123,50.456,50.123,50.456]
+        expected = sorted(bbox_distance(bbox, f.bbox) for f in data)
+        self.assertEqual([bbox_distance(bbox, f.bbox) for f in data.quick_nearest(bbox, n=20)], expected[:20])
+
+    def test_group_select(self):
+        groups = [(key,[f.id for f in feats]) for key,feats in self.data.group('area')]
+        self.assertEqual(groups, [(1.5,[0]), (2.5,[1]), (3.5,[2])])
+        new = self.data.select(lambda f: f['area'] > 2)
+        self.assertTrue(new._storage is not None)
+        self.assertEqual([f['name'] for f in new], ['b','c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import tempfile
+import shutil
+
+import pythongis as pg
+from pythongis.vector.streaming import Streaming
+
+# data
+
+fields = ['name', 'pop']
+rows = [['a', 1],
+        ['b', 20],
+        ['c', 30]]
+geometries = [{'type':'Point', 'coordinates':(i,i)} for i in range(3)]
+
+# tests
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tempdir, 'source.shp')
+        pg.VectorData(fields=fields, rows=rows, geometries=geometries).save(self.path)
+        self.stream = Streaming(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_iter(self):
+        self.assertEqual(self.stream.fields, fields)
+        self.assertEqual([f.row for f in self.stream], rows)
+        # can be iterated again
+        self.assertEqual(len(list(self.stream)), 3)
+
+    def test_stages(self):
+        stream = self.stream.select(lambda f: f['pop'] > 5)
+        stream = stream.compute('double', lambda f: f['pop'] * 2)
+        stream = stream.keep_fields(['double', 'name'])
+        self.assertEqual(self.stream.fields, fields)
+        self.assertEqual(stream.fields, ['double', 'name'])
+        self.assertEqual([f.row for f in stream], [[40,'b'], [60,'c']])
+        self.assertEqual([f.id for f in stream], [1,2])
+
+    def test_reproject(self):
+        data = self.stream.reproject('+proj=merc +datum=WGS84').load()
+        self.assertEqual(len(data), 3)
+        self.assertNotEqual(data[1].geometry['coordinates'], (1,1))
+        self.assertTrue('merc' in data.crs.to_proj4())
+
+    def test_save(self):
+        outpath = os.path.join(self.tempdir, 'out.shp')
+        self.stream.select(lambda f: f['name'] != 'a').drop_fields(['pop']).save(outpath)
+        data = pg.VectorData(outpath)
+        self.assertEqual(data.fields, ['name'])
+        self.assertEqual([f.row for f in data], [['b'], ['c']])
+        self.assertEqual(data.bbox, (1,1,2,2))
+
+    def test_save_single_pass(self):
+        reads = []
+        stream = self.stream.compute('pop2', lambda f: reads.append(f.id) or f['pop'] * 2)
+        outpath = os.path.join(self.tempdir, 'single.shp')
+        stream.save(outpath)
+        self.assertEqual(reads, [0, 1, 2])
+        self.assertEqual([f['pop2'] for f in pg.VectorData(outpath)], [2, 40, 60])
+
+    def test_geojson_fields_read_once(self):
+        from unittest import mock
+        from pythongis.vector.fileformats import geojson
+        path = os.path.join(self.tempdir, 'source.geojson')
+        pg.VectorData(fields=fields, rows=rows, geometries=geometries).save(path)
+        with mock.patch.object(geojson, 'read_fields', wraps=geojson.read_fields) as read_fields:
+            stream = Streaming(path)
+            stream.save(os.path.join(self.tempdir, 'out.geojson'))
+            self.assertEqual(read_fields.call_count, 1)
+        self.assertEqual([f.row for f in stream], rows)
+
+    def test_save_stored(self):
+        data = pg.VectorData(fields=fields, rows=rows, geometries=geometries, storage='columnar')
+        del data[0]
+        outpath = os.path.join(self.tempdir, 'stored.shp')
+        data.save(outpath)
+        self.assertEqual([(f.row, f.geometry['coordinates']) for f in pg.VectorData(outpath)],
+                         [(['b', 20], (1,1)), (['c', 30], (2,2))])
+
+
+
+if __name__ == '__main__':
+    unittest.main()